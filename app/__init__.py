@@ -9,10 +9,27 @@ from .api.user_routes import user_routes
 from .api.auth_routes import auth_routes
 from .api.recipe_routes import recipe_routes
 from .api.grocery_list_routes import grocery_list_routes
+from .api.batch_routes import batch_routes
+from .api.ingredient_routes import ingredient_routes
+from .api.admin_routes import admin_routes
+from .api.image_routes import image_routes
+from .api.feed_routes import feed_routes
 from .seeds import seed_commands
+from .utils.recipe_documents import recipe_commands
+from .utils.backfill import backfill_commands
+from .utils.jobs import job_commands
+from .utils.archive import archive_commands
+from .utils.profiler import install_profiler, profiler_commands
+from .utils.ratelimit import install_admission_control
+from .utils.deadlines import install_deadlines
+from .utils.images import install_images
+from .utils.nutrition import install_nutrition
 from .config import Config
+from .utils.replicas import mark_recent_write
+from .utils.json_provider import FastJSONProvider
 
 app = Flask(__name__, static_folder='../react-vite/dist', static_url_path='/')
+app.json = FastJSONProvider(app)
 
 # Setup login manager
 login = LoginManager(app)
@@ -26,15 +43,41 @@ def load_user(id):
 
 # Tell flask about our seed commands
 app.cli.add_command(seed_commands)
+app.cli.add_command(recipe_commands)
+app.cli.add_command(backfill_commands)
+app.cli.add_command(job_commands)
+app.cli.add_command(archive_commands)
+app.cli.add_command(profiler_commands)
 
 app.config.from_object(Config)
 app.register_blueprint(user_routes, url_prefix='/api/users')
 app.register_blueprint(auth_routes, url_prefix='/api/auth')
 app.register_blueprint(recipe_routes, url_prefix='/api/recipes')
 app.register_blueprint(grocery_list_routes, url_prefix='/api/grocery-lists')
+app.register_blueprint(batch_routes, url_prefix='/api/batch')
+app.register_blueprint(ingredient_routes, url_prefix='/api/ingredients')
+app.register_blueprint(admin_routes, url_prefix='/api/admin')
+app.register_blueprint(image_routes, url_prefix='/api/images')
+app.register_blueprint(feed_routes, url_prefix='/api/feed')
 db.init_app(app)
 Migrate(app, db)
 
+# Rate limiting and the concurrency cap run before anything touches the database
+install_admission_control(app)
+
+# Latency budgets per endpoint, enforced on every query a request runs
+install_deadlines(app)
+
+# Process pool resizing uploaded images
+install_images(app)
+
+# Nutrient reference table for recipe and grocery list nutrition
+install_nutrition(app)
+
+# Request profiling is opt-in; when disabled the app is not wrapped at all
+if app.config['PROFILER_ENABLED']:
+    install_profiler(app)
+
 # Application Security
 CORS(app)
 
@@ -65,6 +108,10 @@ def inject_csrf_token(response):
     return response
 
 
+# Keep users who just wrote reading from the primary database
+app.after_request(mark_recent_write)
+
+
 @app.route("/api/docs")
 def api_help():
     """
@@ -0,0 +1,84 @@
+from flask import Blueprint, current_app, jsonify, request, send_file
+from flask_login import current_user
+from app.utils.deadlines import endpoint_budget
+from app.utils.profiler import MODES, make_token
+
+admin_routes = Blueprint('admin', __name__)
+
+
+@admin_routes.before_request
+def require_admin():
+    """
+    Only users listed in ADMIN_EMAILS may use the admin endpoints
+    """
+    if not current_user.is_authenticated:
+        return jsonify({'errors': {'message': 'Unauthorized'}}), 401
+    if current_user.email.lower() not in current_app.config['ADMIN_EMAILS']:
+        return jsonify({'error': 'Forbidden'}), 403
+
+
+def _profile_store():
+    return current_app.extensions.get('profiler')
+
+
+# GET /api/admin/profiles - List stored request profiles
+@admin_routes.route('/profiles', methods=['GET'])
+def list_profiles():
+    """
+    List stored request profiles, newest first
+    """
+    store = _profile_store()
+    if store is None:
+        return jsonify({'error': 'Profiler is not enabled'}), 404
+    profiles = store.list()
+    return jsonify({'profiles': profiles, 'total': len(profiles)}), 200
+
+
+# GET /api/admin/profiles/<name> - Download a profile
+@admin_routes.route('/profiles/<name>', methods=['GET'])
+def download_profile(name):
+    """
+    Download a stored profile file
+    """
+    store = _profile_store()
+    path = store.path(name) if store is not None else None
+    if not path:
+        return jsonify({'error': 'Profile not found'}), 404
+    return send_file(path, as_attachment=True, download_name=name,
+                     mimetype='application/octet-stream')
+
+
+# POST /api/admin/profiles/token - Get a token for the X-Profile-Token header
+@admin_routes.route('/profiles/token', methods=['POST'])
+def profile_token():
+    """
+    Create a signed token that profiles any request sending it in the
+    X-Profile-Token header until it expires
+    """
+    if _profile_store() is None:
+        return jsonify({'error': 'Profiler is not enabled'}), 404
+    mode = (request.get_json(silent=True) or {}).get('mode', 'cprofile')
+    if mode not in MODES:
+        return jsonify({'error': f'mode must be one of {", ".join(MODES)}'}), 400
+    return jsonify({
+        'token': make_token(current_app.config['SECRET_KEY'], mode),
+        'header': 'X-Profile-Token',
+        'expires_in': current_app.config['PROFILER_TOKEN_MAX_AGE']
+    }), 201
+
+
+# GET /api/admin/deadlines - Latency budgets and how often they ran out
+@admin_routes.route('/deadlines', methods=['GET'])
+def list_deadlines():
+    """
+    List each API endpoint's latency budget in seconds and how many of its
+    requests this worker answered with 503 for running out of time
+    """
+    hits = current_app.extensions['deadlines'].snapshot()
+    endpoints = sorted({rule.endpoint for rule in current_app.url_map.iter_rules()
+                        if rule.rule.startswith('/api/')})
+    return jsonify({
+        'endpoints': [{'endpoint': endpoint, 'budget': endpoint_budget(endpoint) or None,
+                       'exceeded': hits.get(endpoint, 0)} for endpoint in endpoints],
+        'exceeded': sum(hits.values())
+    }), 200
@@ -0,0 +1,131 @@
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from flask import Blueprint, current_app, g, jsonify, request
+from flask_login import current_user
+from werkzeug.exceptions import HTTPException
+from app.models import db
+from app.utils.deadlines import DeadlineExceeded, deadline_response
+
+batch_routes = Blueprint('batch', __name__)
+
+# Shared by every batch request in this worker, created on first use
+_executor = None
+
+# Request headers that describe the batch body rather than the subrequests
+SKIPPED_HEADERS = {'content-length', 'content-type'}
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=current_app.config['BATCH_MAX_WORKERS'],
+            thread_name_prefix='batch')
+    return _executor
+
+
+def _dispatch(app, path, headers, follow_redirects=True):
+    """
+    Runs one GET subrequest through the app's routing, blueprint hooks and
+    view inside the current app context, so it shares the DB session and
+    the already resolved current_user with the batch request
+    """
+    url = urlsplit(path)
+    flags = set(g)
+    outer_deadline = g.get('deadline')
+    try:
+        with app.test_request_context(url.path, query_string=url.query,
+                                      method='GET', headers=headers):
+            try:
+                rv = app.preprocess_request()
+                if rv is None:
+                    rv = app.dispatch_request()
+                response = app.make_response(rv)
+            except HTTPException as e:
+                return {'path': path, 'status': e.code, 'body': {'error': e.description}}
+            except DeadlineExceeded:
+                response = None
+            if g.get('deadline_exceeded'):
+                # The cancelled statement leaves the shared session's
+                # transaction unusable on Postgres. Batches only read, so
+                # rolling back loses nothing.
+                db.session.rollback()
+                response = deadline_response(response)
+
+            # Follow redirects within the API (like the login_required
+            # redirect) the way fetch would
+            location = response.headers.get('Location', '')
+            if follow_redirects and response.status_code in (301, 302, 307, 308) \
+                    and location.startswith('/api/'):
+                redirected = _dispatch(app, location, headers, follow_redirects=False)
+                redirected['path'] = path
+                return redirected
+
+            if response.is_streamed:
+                response.close()
+                return {'path': path, 'status': 400,
+                        'body': {'error': 'Streaming endpoints cannot be batched'}}
+
+            body = response.get_json(silent=True) if response.is_json else response.get_data(as_text=True)
+            return {'path': path, 'status': response.status_code, 'body': body}
+    except Exception:
+        current_app.logger.exception('Batch subrequest failed: %s', path)
+        return {'path': path, 'status': 500, 'body': {'error': 'Subrequest failed'}}
+    finally:
+        # Per-request flags (like read replica routing) must not leak into
+        # the next subrequest
+        for key in set(g) - flags:
+            g.pop(key, None)
+        if outer_deadline is not None:
+            g.deadline = outer_deadline
+
+
+def _dispatch_in_thread(app, user, path, headers):
+    # Worker threads get their own app context, and with it their own DB
+    # session, but reuse the user that the batch request already loaded
+    with app.app_context():
+        g._login_user = user
+        return _dispatch(app, path, headers)
+
+
+# POST /api/batch - Run several GET requests in one round trip
+@batch_routes.route('', methods=['POST'])
+def batch():
+    """
+    Runs a list of GET subrequests and returns all of their results together
+    """
+    data = request.get_json(silent=True) or {}
+    subrequests = data.get('requests') if isinstance(data, dict) else data
+
+    if not isinstance(subrequests, list) or not subrequests:
+        return jsonify({'error': 'requests must be a non-empty array'}), 400
+    if len(subrequests) > current_app.config['BATCH_MAX_REQUESTS']:
+        return jsonify({'error': f"at most {current_app.config['BATCH_MAX_REQUESTS']} requests per batch"}), 400
+
+    paths = []
+    for subrequest in subrequests:
+        path = subrequest.get('path') if isinstance(subrequest, dict) else subrequest
+        method = subrequest.get('method', 'GET') if isinstance(subrequest, dict) else 'GET'
+        if not isinstance(path, str) or not path.startswith('/api/') or path.startswith('/api/batch'):
+            return jsonify({'error': f'invalid path: {path}'}), 400
+        if method.upper() != 'GET':
+            return jsonify({'error': 'only GET requests can be batched'}), 400
+        paths.append(path)
+
+    # Nothing in a batch writes, so it must not pin the user to the primary
+    g.read_only_request = True
+
+    app = current_app._get_current_object()
+    headers = [(key, value) for key, value in request.headers
+               if key.lower() not in SKIPPED_HEADERS]
+    # Resolve the user once for every subrequest
+    user = current_user._get_current_object()
+
+    if isinstance(data, dict) and data.get('parallel'):
+        futures = [_get_executor().submit(_dispatch_in_thread, app, user, path, headers)
+                   for path in paths]
+        responses = [future.result() for future in futures]
+    else:
+        responses = [_dispatch(app, path, headers) for path in paths]
+
+    return jsonify({'responses': responses}), 200
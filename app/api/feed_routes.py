@@ -0,0 +1,30 @@
+from flask import Blueprint, request
+from flask_login import login_required, current_user
+from app.models import Recipe
+from app.utils.feed import feed_page
+from app.utils.recipe_documents import (
+    document_query, document_response, fetch_documents, splice_documents
+)
+from app.utils.deadlines import deadline
+
+feed_routes = Blueprint('feed', __name__)
+
+
+# GET /api/feed - Get recent recipes from followed users
+@feed_routes.route('/', methods=['GET'])
+@deadline(1)
+@login_required
+def get_feed():
+    """
+    Get the newest recipes from the users the current user follows, paginated
+    with ?cursor= (the next_cursor of the previous page)
+    """
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    cursor = request.args.get('cursor', type=int)
+
+    ids, next_cursor = feed_page(current_user.id, cursor, limit)
+    documents = fetch_documents(
+        document_query().where(Recipe.id.in_(ids)).order_by(Recipe.id.desc()),
+        viewer=current_user) if ids else []
+
+    return document_response(splice_documents('recipes', documents, next_cursor=next_cursor))
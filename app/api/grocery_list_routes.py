@@ -1,23 +1,48 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify, Response, stream_with_context
 from flask_login import login_required, current_user
-from app.models import db, GroceryList, GroceryListItem, Recipe
-from datetime import datetime
+from sqlalchemy import select
+from sqlalchemy.orm import selectinload
+from app.models import db, ArchivedGroceryListItem, GroceryList, GroceryListItem, Recipe
+from app.utils.autocomplete import ingredient_index
+from app.utils.list_sync import list_changes, list_change_events
+from app.utils import writes
+from app.utils.ownership import owned, owned_plan
+from app.utils.archive import archived_items, archived_lists, include_archived
+from app.utils.deadlines import deadline
+from app.utils.plans import async_view
+from app.utils.nutrition import item_nutrition, nutrient_table
 
 grocery_list_routes = Blueprint('grocery_lists', __name__)
 
+# Everything GroceryList.to_dict() reads, loaded up front so the read views
+# also work on an async session
+LIST_LOADERS = (selectinload(GroceryList.user), selectinload(GroceryList.items))
+
 # GET /api/grocery-lists - Get all grocery lists for current user
 @grocery_list_routes.route('/', methods=['GET'])
+@async_view
 @login_required
 def get_user_grocery_lists():
     """
-    Get all grocery lists for the current user
+    Get all grocery lists for the current user. With ?include_archived=true,
+    archived lists and items are included, marked "archived": true.
     """
     try:
-        grocery_lists = GroceryList.query.filter_by(user_id=current_user.id).all()
+        grocery_lists = yield (select(GroceryList).options(*LIST_LOADERS)
+                               .where(GroceryList.user_id == current_user.id)
+                               .order_by(GroceryList.id))
+        results = [grocery_list.to_dict() for grocery_list, in grocery_lists]
+        
+        if include_archived(request.args):
+            items = yield from archived_items(current_user.id)
+            for result in results:
+                result['items'] += [item.to_dict() for item in items.get(result['id'], [])]
+            results += [archived.to_dict(items.get(archived.id, []))
+                        for archived in (yield from archived_lists(current_user.id))]
         
         return jsonify({
-            'grocery_lists': [grocery_list.to_dict() for grocery_list in grocery_lists],
-            'total': len(grocery_lists)
+            'grocery_lists': results,
+            'total': len(results)
         }), 200
         
     except Exception as e:
@@ -26,21 +51,111 @@ def get_user_grocery_lists():
 
 # GET /api/grocery-lists/<id> - Get single grocery list by ID
 @grocery_list_routes.route('/<int:list_id>', methods=['GET'])
+@async_view
 @login_required
 def get_grocery_list(list_id):
     """
-    Get a single grocery list by ID (owner only)
+    Get a single grocery list by ID (owner only). With ?include_archived=true,
+    its archived items are included, and an archived list can be fetched.
+    """
+    grocery_list, found = yield from owned_plan(GroceryList, list_id, current_user, *LIST_LOADERS)
+    
+    if not found:
+        archived = (yield from archived_lists(current_user.id, list_id)) if include_archived(request.args) else None
+        if archived:
+            items = yield from archived_items(current_user.id, [list_id])
+            return jsonify(archived[0].to_dict(items.get(list_id, []))), 200
+        return jsonify({'error': 'Grocery list not found'}), 404
+    
+    # Someone else's list
+    if grocery_list is None:
+        return jsonify({'error': 'Unauthorized - you can only view your own grocery lists'}), 403
+    
+    result = grocery_list.to_dict()
+    if include_archived(request.args):
+        items = yield from archived_items(current_user.id, [list_id])
+        result['items'] += [item.to_dict() for item in items.get(list_id, [])]
+    return jsonify(result), 200
+
+
+# GET /api/grocery-lists/<id>/nutrition - Get a grocery list's nutrition totals
+@grocery_list_routes.route('/<int:list_id>/nutrition', methods=['GET'])
+@login_required
+def get_grocery_list_nutrition(list_id):
+    """
+    Get the nutrition totals of everything on a grocery list (owner only),
+    estimated from each item's quantity and name
+    """
+    grocery_list, found = owned(GroceryList, list_id, current_user)
+    
+    if not found:
+        return jsonify({'error': 'Grocery list not found'}), 404
+    
+    # Someone else's list
+    if grocery_list is None:
+        return jsonify({'error': 'Unauthorized - you can only view your own grocery lists'}), 403
+    
+    return jsonify({
+        'grocery_list_id': grocery_list.id,
+        **item_nutrition(nutrient_table(current_app), grocery_list.items)
+    }), 200
+
+
+# GET /api/grocery-lists/<id>/changes?since=<version> - Get changes since a version
+@grocery_list_routes.route('/<int:list_id>/changes', methods=['GET'])
+@login_required
+def get_grocery_list_changes(list_id):
+    """
+    Get the items inserted, updated and deleted since a list version (owner only)
     """
-    grocery_list = GroceryList.query.get(list_id)
+    since = request.args.get('since', type=int)
+    if since is None or since < 0:
+        return jsonify({'error': 'since must be a list version'}), 400
     
-    if not grocery_list:
+    grocery_list, found = owned(GroceryList, list_id, current_user)
+    
+    if not found:
         return jsonify({'error': 'Grocery list not found'}), 404
     
-    # Check if current user owns the list
-    if grocery_list.user_id != current_user.id:
+    # Someone else's list
+    if grocery_list is None:
         return jsonify({'error': 'Unauthorized - you can only view your own grocery lists'}), 403
     
-    return jsonify(grocery_list.to_dict()), 200
+    # A version from the future means the client's copy can't be patched
+    if since > grocery_list.version:
+        return jsonify({'reset': True, 'grocery_list': grocery_list.to_dict()}), 200
+    
+    return jsonify({'reset': False, **list_changes(grocery_list, since)}), 200
+
+
+# GET /api/grocery-lists/<id>/stream - Server-sent events with list changes
+@grocery_list_routes.route('/<int:list_id>/stream', methods=['GET'])
+@deadline(None)
+@login_required
+def stream_grocery_list(list_id):
+    """
+    Stream changes to a grocery list as they happen (owner only). Starts
+    from Last-Event-ID or ?since=, or from the current version.
+    """
+    grocery_list, found = owned(GroceryList, list_id, current_user)
+    
+    if not found:
+        return jsonify({'error': 'Grocery list not found'}), 404
+    
+    # Someone else's list
+    if grocery_list is None:
+        return jsonify({'error': 'Unauthorized - you can only view your own grocery lists'}), 403
+    
+    since = request.headers.get('Last-Event-ID', type=int)
+    if since is None:
+        since = request.args.get('since', grocery_list.version, type=int)
+    db.session.close()
+    
+    return Response(
+        stream_with_context(list_change_events(list_id, since)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
 
 
 # POST /api/grocery-lists - Create new grocery list
@@ -60,13 +175,17 @@ def create_grocery_list():
         # Create new grocery list
         new_list = GroceryList(
             name=data['name'],
-            user_id=current_user.id
+            user_id=current_user.id,
+            items=[]
         )
         
+        # Serialized before the commit so nothing is read back after it
         db.session.add(new_list)
+        db.session.flush()
+        body = new_list.to_dict()
         db.session.commit()
         
-        return jsonify(new_list.to_dict()), 201
+        return jsonify(body), 201
         
     except Exception as e:
         db.session.rollback()
@@ -81,25 +200,21 @@ def update_grocery_list(list_id):
     Update a grocery list (owner only)
     """
     try:
-        grocery_list = GroceryList.query.get(list_id)
-        
-        if not grocery_list:
-            return jsonify({'error': 'Grocery list not found'}), 404
-        
-        # Check if current user owns the list
-        if grocery_list.user_id != current_user.id:
-            return jsonify({'error': 'Unauthorized - you can only edit your own grocery lists'}), 403
-        
         data = request.get_json()
         
         # Update name if provided
-        if 'name' in data:
-            grocery_list.name = data['name']
+        values = {'name': data['name']} if 'name' in data else {}
         
-        grocery_list.updated_at = datetime.utcnow()
+        grocery_list, found = writes.update_grocery_list(list_id, current_user._get_current_object(), values)
+        if grocery_list is None:
+            if not found:
+                return jsonify({'error': 'Grocery list not found'}), 404
+            return jsonify({'error': 'Unauthorized - you can only edit your own grocery lists'}), 403
+        
+        body = grocery_list.to_dict()
         db.session.commit()
         
-        return jsonify(grocery_list.to_dict()), 200
+        return jsonify(body), 200
         
     except Exception as e:
         db.session.rollback()
@@ -111,20 +226,31 @@ def update_grocery_list(list_id):
 @login_required
 def delete_grocery_list(list_id):
     """
-    Delete a grocery list (owner only) - cascade deletes all items
+    Delete a grocery list (owner only) - the database cascade deletes all items
     """
     try:
-        grocery_list = GroceryList.query.get(list_id)
+        grocery_list, found = owned(GroceryList, list_id, current_user)
         
-        if not grocery_list:
+        if not found:
             return jsonify({'error': 'Grocery list not found'}), 404
         
-        # Check if current user owns the list
-        if grocery_list.user_id != current_user.id:
+        # Someone else's list
+        if grocery_list is None:
             return jsonify({'error': 'Unauthorized - you can only delete your own grocery lists'}), 403
         
+        # Items are removed by the database (ON DELETE CASCADE); only their
+        # names are read, for the autocomplete index. Archived items of the
+        # list have no foreign key to it and are deleted here.
+        item_names = db.session.scalars(
+            db.select(GroceryListItem.item_name)
+            .where(GroceryListItem.grocery_list_id == list_id)).all()
+        archived = ArchivedGroceryListItem.__table__
+        in_archive = (archived.c.user_id == current_user.id) & (archived.c.grocery_list_id == list_id)
+        item_names += db.session.scalars(db.select(archived.c.item_name).where(in_archive)).all()
+        db.session.execute(db.delete(archived).where(in_archive))
         db.session.delete(grocery_list)
         db.session.commit()
+        ingredient_index.update(removed=item_names)
         
         return jsonify({'message': 'Grocery list deleted successfully'}), 200
         
@@ -141,33 +267,28 @@ def add_item_to_list(list_id):
     Add an item to a grocery list
     """
     try:
-        grocery_list = GroceryList.query.get(list_id)
-        
-        if not grocery_list:
-            return jsonify({'error': 'Grocery list not found'}), 404
-        
-        # Check if current user owns the list
-        if grocery_list.user_id != current_user.id:
-            return jsonify({'error': 'Unauthorized'}), 403
-        
         data = request.get_json()
         
         if not data.get('item_name'):
             return jsonify({'error': 'item_name is required'}), 400
         
         # Create new grocery list item
-        new_item = GroceryListItem(
-            grocery_list_id=list_id,
-            item_name=data['item_name'],
-            quantity=data.get('quantity', ''),
-            notes=data.get('notes', ''),
-            checked_off=data.get('checked_off', False)
-        )
+        new_item, found = writes.add_grocery_item(list_id, current_user._get_current_object(), {
+            'item_name': data['item_name'],
+            'quantity': data.get('quantity', ''),
+            'notes': data.get('notes', ''),
+            'checked_off': data.get('checked_off', False)
+        })
+        if new_item is None:
+            if not found:
+                return jsonify({'error': 'Grocery list not found'}), 404
+            return jsonify({'error': 'Unauthorized'}), 403
         
-        db.session.add(new_item)
+        body = new_item.to_dict()
         db.session.commit()
+        ingredient_index.update(added=[body['item_name']])
         
-        return jsonify(new_item.to_dict()), 201
+        return jsonify(body), 201
         
     except Exception as e:
         db.session.rollback()
@@ -182,30 +303,24 @@ def update_grocery_item(item_id):
     Update a grocery list item (owner only)
     """
     try:
-        item = GroceryListItem.query.get(item_id)
-        
-        if not item:
-            return jsonify({'error': 'Grocery list item not found'}), 404
-        
-        # Check if current user owns the parent list
-        if item.grocery_list.user_id != current_user.id:
-            return jsonify({'error': 'Unauthorized'}), 403
-        
         data = request.get_json()
         
         # Update fields if provided
-        if 'item_name' in data:
-            item.item_name = data['item_name']
-        if 'quantity' in data:
-            item.quantity = data['quantity']
-        if 'notes' in data:
-            item.notes = data['notes']
-        if 'checked_off' in data:
-            item.checked_off = data['checked_off']
+        values = {key: data[key] for key in ('item_name', 'quantity', 'notes', 'checked_off') if key in data}
+        
+        result, found = writes.update_grocery_item(item_id, current_user._get_current_object(), values)
+        if result is None:
+            if not found:
+                return jsonify({'error': 'Grocery list item not found'}), 404
+            return jsonify({'error': 'Unauthorized'}), 403
         
+        item, old_name = result
+        body = item.to_dict()
         db.session.commit()
+        if body['item_name'] != old_name:
+            ingredient_index.update(added=[body['item_name']], removed=[old_name])
         
-        return jsonify(item.to_dict()), 200
+        return jsonify(body), 200
         
     except Exception as e:
         db.session.rollback()
@@ -220,17 +335,19 @@ def delete_grocery_item(item_id):
     Delete a grocery list item (owner only)
     """
     try:
-        item = GroceryListItem.query.get(item_id)
+        item, found = owned(GroceryListItem, item_id, current_user)
         
-        if not item:
+        if not found:
             return jsonify({'error': 'Grocery list item not found'}), 404
         
-        # Check if current user owns the parent list
-        if item.grocery_list.user_id != current_user.id:
+        # An item on someone else's list
+        if item is None:
             return jsonify({'error': 'Unauthorized'}), 403
         
+        item_name = item.item_name
         db.session.delete(item)
         db.session.commit()
+        ingredient_index.update(removed=[item_name])
         
         return jsonify({'message': 'Grocery list item deleted successfully'}), 200
         
@@ -247,13 +364,13 @@ def add_recipe_ingredients_to_list(list_id):
     Add all ingredients from a recipe to a grocery list
     """
     try:
-        grocery_list = GroceryList.query.get(list_id)
+        grocery_list, found = owned(GroceryList, list_id, current_user)
         
-        if not grocery_list:
+        if not found:
             return jsonify({'error': 'Grocery list not found'}), 404
         
-        # Check if current user owns the list
-        if grocery_list.user_id != current_user.id:
+        # Someone else's list
+        if grocery_list is None:
             return jsonify({'error': 'Unauthorized'}), 403
         
         data = request.get_json()
@@ -279,6 +396,7 @@ def add_recipe_ingredients_to_list(list_id):
             added_items.append(new_item)
         
         db.session.commit()
+        ingredient_index.update(added=[item.item_name for item in added_items])
         
         return jsonify({
             'message': f'Added {len(added_items)} ingredients from {recipe.title}',
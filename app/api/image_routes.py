@@ -0,0 +1,35 @@
+import re
+from flask import Blueprint, current_app, jsonify, send_file
+from app.utils.images import FORMATS, VARIANTS, RenderTimeout
+
+image_routes = Blueprint('images', __name__)
+
+# A year, the longest browsers and CDNs honour
+CACHE_SECONDS = 365 * 24 * 3600
+
+
+# GET /api/images/<key>/<variant>.webp - Get a resized recipe image
+@image_routes.route('/<key>/<variant>.<extension>', methods=['GET'])
+def get_image(key, variant, extension):
+    """
+    Get the thumbnail, card or full size version of an uploaded image, as
+    WebP. The URL names the image's content, so it never changes.
+    """
+    if not re.fullmatch(r'[0-9a-f]{64}', key) or variant not in VARIANTS or extension not in FORMATS:
+        return jsonify({'error': 'Image not found'}), 404
+
+    images = current_app.extensions['images']
+    try:
+        path = images.path(key, variant, extension, current_app.config['IMAGE_RENDER_TIMEOUT'])
+    except RenderTimeout:
+        response = jsonify({'error': 'Image is still being processed'})
+        response.status_code = 503
+        response.headers['Retry-After'] = '1'
+        return response
+
+    if path is None:
+        return jsonify({'error': 'Image not found'}), 404
+
+    response = send_file(path, mimetype=FORMATS[extension][1], max_age=CACHE_SECONDS)
+    response.headers['Cache-Control'] = f'public, max-age={CACHE_SECONDS}, immutable'
+    return response
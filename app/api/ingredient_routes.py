@@ -0,0 +1,25 @@
+from flask import Blueprint, current_app, request, jsonify
+from app.utils.autocomplete import get_ingredient_index
+from app.utils.deadlines import deadline
+
+ingredient_routes = Blueprint('ingredients', __name__)
+
+
+# GET /api/ingredients/autocomplete?prefix= - Suggest ingredient names
+@ingredient_routes.route('/autocomplete', methods=['GET'])
+@deadline(0.5)
+def autocomplete():
+    """
+    Suggest canonical ingredient and grocery item names for a prefix, most
+    common first
+    """
+    prefix = request.args.get('prefix', '')
+    limit = min(max(request.args.get('limit', 10, type=int), 1), 25)
+
+    index = get_ingredient_index(current_app._get_current_object())
+    suggestions = index.suggest(prefix, limit)
+
+    return jsonify({
+        'prefix': prefix,
+        'suggestions': [{'name': name, 'count': count} for name, count in suggestions]
+    }), 200
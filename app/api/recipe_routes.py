@@ -1,12 +1,33 @@
-from flask import Blueprint, request, jsonify
+from flask import Blueprint, current_app, request, jsonify
 from flask_login import login_required, current_user
+from sqlalchemy import select
 from app.models import db, Recipe, User
+from app.utils.validation import validate_recipe_data
+from app.utils.replicas import route_reads_to_replica
+from app.utils.recipe_import import (
+    detect_format, import_recipes, iter_text_lines, parse_csv, parse_ndjson
+)
+from app.utils.autocomplete import ingredient_index
+from app.utils import writes
+from app.utils.ownership import owned
+from app.utils.images import InvalidImage, release_image, store_original
+from app.utils.revisions import list_revisions, rebuild_revision
+from app.utils.recipe_documents import (
+    document_query, document_response, documents_plan, splice_documents
+)
+from app.utils.deadlines import deadline
+from app.utils.plans import async_view
+from app.utils.nutrition import nutrient_table, recipe_nutrition, sum_nutrients
 from datetime import datetime
+import math
 
 recipe_routes = Blueprint('recipes', __name__)
+recipe_routes.before_request(route_reads_to_replica)
 
 # GET /api/recipes - Get all recipes
 @recipe_routes.route('/', methods=['GET'])
+@deadline(2)
+@async_view
 def get_all_recipes():
     """
     Get all recipes with optional pagination
@@ -14,19 +35,20 @@ def get_all_recipes():
     try:
         page = request.args.get('page', 1, type=int)
         per_page = request.args.get('per_page', 20, type=int)
+        limit = per_page if per_page >= 1 else 20
+        offset = (max(page, 1) - 1) * limit
         
-        recipes = Recipe.query.paginate(
-            page=page, 
-            per_page=per_page, 
-            error_out=False
-        )
+        total = (yield select(db.func.count(Recipe.id)))[0][0]
+        documents = yield from documents_plan(
+            document_query().order_by(Recipe.id).limit(limit).offset(offset),
+            viewer=current_user)
         
-        return jsonify({
-            'recipes': [recipe.to_dict() for recipe in recipes.items],
-            'total': recipes.total,
-            'pages': recipes.pages,
-            'current_page': page
-        }), 200
+        return document_response(splice_documents(
+            'recipes', documents,
+            total=total,
+            pages=math.ceil(total / limit) if total else 0,
+            current_page=page
+        ))
         
     except Exception as e:
         return jsonify({'error': 'Failed to fetch recipes'}), 500
@@ -34,16 +56,18 @@ def get_all_recipes():
 
 # GET /api/recipes/<id> - Get single recipe by ID
 @recipe_routes.route('/<int:recipe_id>', methods=['GET'])
+@deadline(1)
+@async_view
 def get_recipe(recipe_id):
     """
     Get a single recipe by ID
     """
-    recipe = Recipe.query.get(recipe_id)
+    documents = yield from documents_plan(document_query().where(Recipe.id == recipe_id), viewer=current_user)
     
-    if not recipe:
+    if not documents:
         return jsonify({'error': 'Recipe not found'}), 404
     
-    return jsonify(recipe.to_dict()), 200
+    return document_response(documents[0])
 
 
 # POST /api/recipes - Create new recipe
@@ -56,15 +80,10 @@ def create_recipe():
     try:
         data = request.get_json()
         
-        # Validate required fields
-        required_fields = ['title', 'ingredients', 'instructions']
-        for field in required_fields:
-            if not data.get(field):
-                return jsonify({'error': f'{field} is required'}), 400
-        
-        # Validate ingredients is a list
-        if not isinstance(data.get('ingredients'), list):
-            return jsonify({'error': 'ingredients must be an array'}), 400
+        # Validate required fields and ingredients
+        error = validate_recipe_data(data)
+        if error:
+            return jsonify({'error': error}), 400
         
         # Create new recipe
         new_recipe = Recipe(
@@ -76,16 +95,50 @@ def create_recipe():
             user_id=current_user.id
         )
         
+        # Serialized before the commit so nothing is read back after it
         db.session.add(new_recipe)
+        db.session.flush()
+        body = new_recipe.to_dict()
         db.session.commit()
+        ingredient_index.update(added=body['ingredients'])
         
-        return jsonify(new_recipe.to_dict()), 201
+        return jsonify(body), 201
         
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Failed to create recipe'}), 500
 
 
+# POST /api/recipes/import - Bulk import recipes from NDJSON or CSV
+@recipe_routes.route('/import', methods=['POST'])
+@deadline(120)
+@login_required
+def import_recipes_upload():
+    """
+    Bulk import recipes from an NDJSON or CSV upload (requires authentication)
+    """
+    upload = request.files.get('file')
+    if upload:
+        stream = upload.stream
+        upload_format = request.args.get('format') or detect_format(upload.filename, upload.mimetype)
+    else:
+        stream = request.stream
+        upload_format = request.args.get('format') or detect_format(None, request.mimetype)
+
+    if upload_format not in ('ndjson', 'csv'):
+        return jsonify({'error': 'upload must be NDJSON or CSV'}), 400
+
+    parse = parse_csv if upload_format == 'csv' else parse_ndjson
+    try:
+        report = import_recipes(parse(iter_text_lines(stream)), current_user.id)
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to import recipes'}), 500
+
+    status = 201 if report.inserted else 400
+    return jsonify(report.to_dict()), status
+
+
 # PUT /api/recipes/<id> - Update recipe
 @recipe_routes.route('/<int:recipe_id>', methods=['PUT'])
 @login_required
@@ -94,45 +147,92 @@ def update_recipe(recipe_id):
     Update a recipe (only owner can update)
     """
     try:
-        recipe = Recipe.query.get(recipe_id)
-        
-        if not recipe:
-            return jsonify({'error': 'Recipe not found'}), 404
-        
-        # Check if current user owns the recipe
-        if recipe.user_id != current_user.id:
-            return jsonify({'error': 'Unauthorized - you can only edit your own recipes'}), 403
-        
         data = request.get_json()
         
         # Validate ingredients if provided
         if 'ingredients' in data and not isinstance(data['ingredients'], list):
             return jsonify({'error': 'ingredients must be an array'}), 400
         
-        # Update fields if provided
-        if 'title' in data:
-            recipe.title = data['title']
-        if 'description' in data:
-            recipe.description = data['description']
-        if 'ingredients' in data:
-            recipe.ingredients = data['ingredients']
-        if 'instructions' in data:
-            recipe.instructions = data['instructions']
+        # Update fields if provided, along with the updated_at timestamp
+        values = {key: data[key] for key in ('title', 'description', 'ingredients', 'instructions', 'image_url')
+                  if key in data}
+        values['updated_at'] = datetime.utcnow()
+        # A new image URL replaces any uploaded image
         if 'image_url' in data:
-            recipe.image_url = data['image_url']
+            values['image_key'] = None
+        # New ingredients mean new nutrition totals
+        if 'ingredients' in data:
+            values['nutrition'] = None
         
-        # Update the updated_at timestamp
-        recipe.updated_at = datetime.utcnow()
+        result, found = writes.update_recipe(recipe_id, current_user._get_current_object(), values)
+        if result is None:
+            if not found:
+                return jsonify({'error': 'Recipe not found'}), 404
+            return jsonify({'error': 'Unauthorized - you can only edit your own recipes'}), 403
         
+        recipe, previous = result
+        if 'image_url' in data:
+            release_image(previous['image_key'])
+        body = recipe.to_dict()
         db.session.commit()
+        if 'ingredients' in data:
+            ingredient_index.update(added=data['ingredients'], removed=previous['ingredients'] or [])
         
-        return jsonify(recipe.to_dict()), 200
+        return jsonify(body), 200
         
     except Exception as e:
         db.session.rollback()
         return jsonify({'error': 'Failed to update recipe'}), 500
 
 
+# POST /api/recipes/<id>/image - Upload recipe image
+@recipe_routes.route('/<int:recipe_id>/image', methods=['POST'])
+@login_required
+def upload_recipe_image(recipe_id):
+    """
+    Upload an image for a recipe (only owner can upload), as an `image` form
+    field or the raw request body. Thumbnail, card and full size versions
+    are made in the background.
+    """
+    recipe, found = owned(Recipe, recipe_id, current_user)
+    
+    if not found:
+        return jsonify({'error': 'Recipe not found'}), 404
+    
+    # Someone else's recipe
+    if recipe is None:
+        return jsonify({'error': 'Unauthorized - you can only edit your own recipes'}), 403
+    
+    upload = request.files.get('image')
+    max_bytes = current_app.config['IMAGE_MAX_BYTES']
+    data = (upload.stream if upload else request.stream).read(max_bytes + 1)
+    if not data:
+        return jsonify({'error': 'image is required'}), 400
+    if len(data) > max_bytes:
+        return jsonify({'error': f'image must be at most {max_bytes // (1024 * 1024)} MB'}), 413
+    
+    images = current_app.extensions['images']
+    try:
+        key = store_original(images.root, data)
+    except InvalidImage as e:
+        return jsonify({'error': str(e)}), 400
+    
+    try:
+        if recipe.image_key != key:
+            release_image(recipe.image_key)
+        recipe.image_key = key
+        recipe.updated_at = datetime.utcnow()
+        db.session.flush()
+        body = recipe.to_dict()
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to save recipe image'}), 500
+    
+    images.submit(key)
+    return jsonify(body), 200
+
+
 # DELETE /api/recipes/<id> - Delete recipe
 @recipe_routes.route('/<int:recipe_id>', methods=['DELETE'])
 @login_required
@@ -141,17 +241,20 @@ def delete_recipe(recipe_id):
     Delete a recipe (only owner can delete)
     """
     try:
-        recipe = Recipe.query.get(recipe_id)
+        recipe, found = owned(Recipe, recipe_id, current_user)
         
-        if not recipe:
+        if not found:
             return jsonify({'error': 'Recipe not found'}), 404
         
-        # Check if current user owns the recipe
-        if recipe.user_id != current_user.id:
+        # Someone else's recipe
+        if recipe is None:
             return jsonify({'error': 'Unauthorized - you can only delete your own recipes'}), 403
         
+        ingredients = list(recipe.ingredients or [])
+        release_image(recipe.image_key)
         db.session.delete(recipe)
         db.session.commit()
+        ingredient_index.update(removed=ingredients)
         
         return jsonify({'message': 'Recipe deleted successfully'}), 200
         
@@ -160,24 +263,139 @@ def delete_recipe(recipe_id):
         return jsonify({'error': 'Failed to delete recipe'}), 500
 
 
+# GET /api/recipes/<id>/revisions - Get a recipe's revision history
+@recipe_routes.route('/<int:recipe_id>/revisions', methods=['GET'])
+@deadline(2)
+@login_required
+def get_recipe_revisions(recipe_id):
+    """
+    Get the revisions of a recipe, newest first (only owner can view)
+    """
+    recipe, found = owned(Recipe, recipe_id, current_user)
+    
+    if not found:
+        return jsonify({'error': 'Recipe not found'}), 404
+    
+    # Someone else's recipe
+    if recipe is None:
+        return jsonify({'error': 'Unauthorized - you can only view the history of your own recipes'}), 403
+    
+    return jsonify({
+        'recipe_id': recipe.id,
+        'current': recipe.revision,
+        'revisions': list_revisions(recipe)
+    }), 200
+
+
+# GET /api/recipes/<id>/revisions/<number> - Get one revision of a recipe
+@recipe_routes.route('/<int:recipe_id>/revisions/<int:number>', methods=['GET'])
+@deadline(2)
+@login_required
+def get_recipe_revision(recipe_id, number):
+    """
+    Get a recipe's content as of one of its revisions (only owner can view)
+    """
+    recipe, found = owned(Recipe, recipe_id, current_user)
+    
+    if not found:
+        return jsonify({'error': 'Recipe not found'}), 404
+    
+    # Someone else's recipe
+    if recipe is None:
+        return jsonify({'error': 'Unauthorized - you can only view the history of your own recipes'}), 403
+    
+    revision = rebuild_revision(recipe, number)
+    if revision is None:
+        return jsonify({'error': 'Revision not found'}), 404
+    
+    content, created_at = revision
+    return jsonify({
+        'recipe_id': recipe.id,
+        'number': number,
+        'created_at': created_at,
+        **content
+    }), 200
+
+
+# GET /api/recipes/<id>/nutrition - Get a recipe's nutrition totals
+@recipe_routes.route('/<int:recipe_id>/nutrition', methods=['GET'])
+@deadline(1)
+def get_recipe_nutrition(recipe_id):
+    """
+    Get the nutrition totals of a recipe, estimated from its ingredients.
+    Ingredients not in the nutrient table are listed under "unmatched".
+    """
+    try:
+        results = recipe_nutrition(nutrient_table(current_app), [recipe_id])
+        db.session.commit()
+        
+        if recipe_id not in results:
+            return jsonify({'error': 'Recipe not found'}), 404
+        
+        return jsonify(results[recipe_id]), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to fetch recipe nutrition'}), 500
+
+
+# GET /api/recipes/nutrition?ids=1,2,3 - Get nutrition totals for several recipes
+@recipe_routes.route('/nutrition', methods=['GET'])
+@deadline(2)
+def get_recipes_nutrition():
+    """
+    Get the nutrition totals of several recipes and their combined total,
+    e.g. for a meal plan. A recipe listed twice counts twice in the total.
+    """
+    try:
+        ids = [int(part) for part in request.args.get('ids', '').split(',') if part.strip()]
+    except ValueError:
+        return jsonify({'error': 'ids must be a comma separated list of recipe ids'}), 400
+    
+    limit = current_app.config['NUTRITION_BATCH_LIMIT']
+    if not ids:
+        return jsonify({'error': 'ids is required'}), 400
+    if len(ids) > limit:
+        return jsonify({'error': f'At most {limit} recipes per request'}), 400
+    
+    try:
+        table = nutrient_table(current_app)
+        results = recipe_nutrition(table, ids)
+        db.session.commit()
+        
+        return jsonify({
+            'recipes': [results[recipe_id] for recipe_id in dict.fromkeys(ids) if recipe_id in results],
+            'total': sum_nutrients(table, [results[recipe_id] for recipe_id in ids if recipe_id in results]),
+            'missing': [recipe_id for recipe_id in dict.fromkeys(ids) if recipe_id not in results]
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Failed to fetch recipe nutrition'}), 500
+
+
 # GET /api/recipes/user/<user_id> - Get recipes by user
 @recipe_routes.route('/user/<int:user_id>', methods=['GET'])
+@deadline(2)
+@async_view
 def get_recipes_by_user(user_id):
     """
     Get all recipes created by a specific user
     """
     try:
-        user = User.query.get(user_id)
-        if not user:
+        users = yield select(User.username).where(User.id == user_id)
+        if not users:
             return jsonify({'error': 'User not found'}), 404
         
-        recipes = Recipe.query.filter_by(user_id=user_id).all()
+        documents = yield from documents_plan(
+            document_query().where(Recipe.user_id == user_id).order_by(Recipe.id),
+            viewer=current_user)
         
-        return jsonify({
-            'recipes': [recipe.to_dict() for recipe in recipes],
-            'user': user.username,
-            'total': len(recipes)
-        }), 200
+        return document_response(splice_documents(
+            'recipes', documents,
+            user=users[0].username,
+            total=len(documents)
+        ))
         
     except Exception as e:
         return jsonify({'error': 'Failed to fetch user recipes'}), 500
@@ -185,18 +403,22 @@ def get_recipes_by_user(user_id):
 
 # GET /api/recipes/my-recipes - Get current user's recipes
 @recipe_routes.route('/my-recipes', methods=['GET'])
+@deadline(2)
+@async_view
 @login_required
 def get_my_recipes():
     """
     Get all recipes created by the current user
     """
     try:
-        recipes = Recipe.query.filter_by(user_id=current_user.id).all()
+        documents = yield from documents_plan(
+            document_query().where(Recipe.user_id == current_user.id).order_by(Recipe.id),
+            viewer=current_user)
         
-        return jsonify({
-            'recipes': [recipe.to_dict() for recipe in recipes],
-            'total': len(recipes)
-        }), 200
+        return document_response(splice_documents(
+            'recipes', documents,
+            total=len(documents)
+        ))
         
     except Exception as e:
         return jsonify({'error': 'Failed to fetch your recipes'}), 500
\ No newline at end of file
@@ -1,18 +1,78 @@
-from flask import Blueprint, jsonify
-from flask_login import login_required
-from app.models import User
+from flask import Blueprint, jsonify, request, Response, stream_with_context
+from flask_login import login_required, current_user
+from app.models import db, User
+from app.utils.export import export_user
+from app.utils.feed import follow, unfollow
+from app.utils.replicas import route_reads_to_replica
+from app.utils.deadlines import deadline
 
 user_routes = Blueprint('users', __name__)
+user_routes.before_request(route_reads_to_replica)
 
 
 @user_routes.route('/')
+@deadline(1)
 @login_required
 def users():
     """
-    Query for all users and returns them in a list of user dictionaries
+    Lists users as {id, username}, ordered by id and paginated with a cursor.
+    ?q= matches the start of the username, or a whole email address, ignoring
+    case. Email only matches in full, so addresses can't be guessed a letter
+    at a time.
     """
-    users = User.query.all()
-    return {'users': [user.to_dict() for user in users]}
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
+    cursor = request.args.get('cursor', 0, type=int)
+    q = request.args.get('q', '').strip().lower()
+
+    query = (db.select(User.id, User.username)
+             .where(User.id > cursor)
+             .order_by(User.id)
+             .limit(limit + 1))
+    if q:
+        query = query.where(db.or_(prefix_match(User.username, q), exact_match(User.email, q)))
+
+    rows = db.session.execute(query).all()
+    page = rows[:limit]
+    return {
+        'users': [{'id': row.id, 'username': row.username} for row in page],
+        'next_cursor': page[-1].id if len(rows) > limit else None
+    }
+
+
+def prefix_match(column, prefix):
+    """
+    Case-insensitive "starts with" that can use the directory indexes:
+    lower(column) text_pattern_ops on Postgres, column COLLATE NOCASE on
+    SQLite (where LIKE already ignores case)
+    """
+    pattern = prefix.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return db.func.lower(column).like(pattern, escape='\\')
+    return column.like(pattern, escape='\\')
+
+
+def exact_match(column, value):
+    """
+    Case-insensitive equality served by the same indexes as prefix_match()
+    """
+    if db.session.get_bind().dialect.name == 'postgresql':
+        return db.func.lower(column) == value
+    return column.collate('NOCASE') == value
+
+
+@user_routes.route('/me/export')
+@deadline(None)
+@login_required
+def export_account():
+    """
+    Streams a full NDJSON export of the current user's account data
+    """
+    user_id = current_user.id
+    return Response(
+        stream_with_context(export_user(user_id)),
+        mimetype='application/x-ndjson',
+        headers={'Content-Disposition': f'attachment; filename="chefecito-export-{user_id}.ndjson"'}
+    )
 
 
 @user_routes.route('/<int:id>')
@@ -21,5 +81,35 @@ def user(id):
     """
     Query for a user by id and returns that user in a dictionary
     """
-    user = User.query.get(id)
-    return user.to_dict()
+    user = db.session.execute(
+        db.select(User.id, User.username, User.email).where(User.id == id)).first()
+    if not user:
+        return {'errors': {'message': 'User not found'}}, 404
+    return dict(user._mapping)
+
+
+@user_routes.route('/<int:id>/follow', methods=['POST'])
+@login_required
+def follow_user(id):
+    """
+    Follows a user, adding their recipes to the current user's feed
+    """
+    if id == current_user.id:
+        return {'errors': {'message': 'You can\'t follow yourself'}}, 400
+    if not db.session.scalar(db.select(User.id).where(User.id == id)):
+        return {'errors': {'message': 'User not found'}}, 404
+    created = follow(current_user.id, id)
+    db.session.commit()
+    return {'following': True}, 201 if created else 200
+
+
+@user_routes.route('/<int:id>/follow', methods=['DELETE'])
+@login_required
+def unfollow_user(id):
+    """
+    Stops following a user
+    """
+    if not unfollow(current_user.id, id):
+        return {'errors': {'message': 'Not following this user'}}, 404
+    db.session.commit()
+    return {'following': False}
@@ -0,0 +1,195 @@
+"""
+Optional ASGI entry point that serves the read views written as plans
+(@async_view, see app/utils/plans.py) with async SQLAlchemy sessions, so a
+worker is not held while it waits on the database. Everything else,
+including every write, is handed to the regular Flask app, which stays the
+default way to run Chefecito.
+
+    pip install -r requirements-async.txt
+    uvicorn app.asgi:application --workers 4
+
+A plan runs inside a regular Flask request context: the session cookie,
+Flask-Login, the before_request and after_request hooks (rate limit,
+deadlines, replica routing, https redirect) and the view's decorators all
+apply as they do under Flask, and the concurrency cap shares its slots with
+the Flask app. Only the plan's statements run on the async engine, and the
+hooks, which may touch the database, run in a worker thread.
+
+The async engines use aiosqlite for SQLite and asyncpg for Postgres, built
+from the same DATABASE_URL and replica binds as the Flask app.
+"""
+import asyncio
+import inspect
+import random
+import sys
+from io import BytesIO
+from asgiref.wsgi import WsgiToAsgi, WsgiToAsgiInstance
+from flask import g
+from flask_login import current_user
+from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+from sqlalchemy.orm import sessionmaker
+from werkzeug.exceptions import HTTPException
+from . import app as flask_app
+from .models import db
+from .utils.plans import run_plan_async
+from .utils.ratelimit import BUSY_BODY
+from .utils.replicas import REPLICA_BIND_PREFIX
+
+ASYNC_DRIVERS = {
+    'sqlite': 'sqlite+aiosqlite',
+    'postgresql': 'postgresql+asyncpg'
+}
+
+
+def async_database_url(url):
+    """
+    Converts a database URL to its async driver equivalent
+    """
+    backend = url.get_backend_name()
+    if backend not in ASYNC_DRIVERS:
+        raise RuntimeError(f'No async driver configured for {backend}')
+    return url.set(drivername=ASYNC_DRIVERS[backend])
+
+
+class AsyncApplication:
+    """
+    ASGI app that runs plan views natively and forwards every other request
+    to the wrapped Flask app
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.wsgi = WsgiToAsgi(app)
+        self.engine = None
+        self.replicas = []
+        self.session_factory = None
+
+    def start(self):
+        with self.app.app_context():
+            engines = dict(db.engines)
+        self.engine = create_async_engine(async_database_url(engines[None].url))
+        self.replicas = [create_async_engine(async_database_url(engine.url))
+                         for key, engine in engines.items()
+                         if key and key.startswith(REPLICA_BIND_PREFIX)]
+        self.session_factory = sessionmaker(class_=AsyncSession, expire_on_commit=False)
+
+    async def stop(self):
+        for engine in [self.engine, *self.replicas]:
+            if engine is not None:
+                await engine.dispose()
+
+    def environ(self, scope):
+        instance = WsgiToAsgiInstance(self.app)
+        instance.scope = scope
+        environ = instance.build_environ(scope, BytesIO())
+        # asgiref's is a BytesIO, which Flask's log handler can't write to
+        environ['wsgi.errors'] = sys.stderr
+        return environ
+
+    def match(self, environ):
+        """
+        The plan view a request is routed to and its arguments, or None
+        """
+        try:
+            endpoint, args = self.app.url_map.bind_to_environ(environ).match()
+        except HTTPException:
+            return None
+        view = self.app.view_functions.get(endpoint)
+        return getattr(view, 'plan', None), args
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] == 'lifespan':
+            return await self.lifespan(receive, send)
+
+        if scope['type'] == 'http' and scope['method'] == 'GET':
+            environ = self.environ(scope)
+            matched = self.match(environ)
+            if matched and matched[0] is not None:
+                return await self.serve(environ, *matched, send)
+
+        await self.wsgi(scope, receive, send)
+
+    async def serve(self, environ, plan, args, send):
+        admission = self.app.extensions.get('admission')
+        if admission is not None and admission.applies_to(environ['PATH_INFO']):
+            if not await asyncio.to_thread(admission.acquire):
+                return await self.send(send, 503, admission.busy_headers(), BUSY_BODY)
+        else:
+            admission = None
+
+        if self.session_factory is None:
+            self.start()
+        ctx = self.app.request_context(environ)
+        ctx.push()
+        error = None
+        try:
+            try:
+                rv = await self.run_sync(self.dispatch, plan, args)
+                if inspect.isgenerator(rv):
+                    async with self.session_factory(bind=self.bind()) as session:
+                        rv = await run_plan_async(session, rv)
+            except Exception as e:
+                rv = await self.run_sync(self.app.handle_user_exception, e)
+            response = await self.run_sync(self.app.finalize_request, rv)
+        except Exception as e:
+            error = e
+            response = self.app.handle_exception(e)
+        finally:
+            ctx.pop(error)
+            if admission is not None:
+                admission.release()
+        await self.send(send, response.status_code, response.headers.to_wsgi_list(), response.get_data())
+
+    async def run_sync(self, fn, *args):
+        """
+        Runs blocking Flask code in a worker thread. The Flask-SQLAlchemy
+        session is closed before the thread returns, so no connection is
+        held across threads or while the plan runs.
+        """
+        def call():
+            try:
+                return fn(*args)
+            finally:
+                db.session.close()
+        return await asyncio.to_thread(call)
+
+    def dispatch(self, plan, args):
+        """
+        What Flask does before calling a view: the request hooks, then the
+        view itself, which returns a plan or, from a decorator such as
+        @login_required, a response
+        """
+        rv = self.app.preprocess_request()
+        if rv is None:
+            # Loads the user here, not in the event loop
+            current_user._get_current_object()
+            rv = plan(**args)
+        return rv
+
+    def bind(self):
+        if g.get('read_replica') and self.replicas:
+            return random.choice(self.replicas)
+        return self.engine
+
+    async def send(self, send, status, headers, body):
+        await send({
+            'type': 'http.response.start',
+            'status': status,
+            'headers': [(name.lower().encode('latin-1'), value.encode('latin-1'))
+                        for name, value in headers]
+        })
+        await send({'type': 'http.response.body', 'body': body})
+
+    async def lifespan(self, receive, send):
+        while True:
+            message = await receive()
+            if message['type'] == 'lifespan.startup':
+                self.start()
+                await send({'type': 'lifespan.startup.complete'})
+            elif message['type'] == 'lifespan.shutdown':
+                await self.stop()
+                await send({'type': 'lifespan.shutdown.complete'})
+                return
+
+
+application = AsyncApplication(flask_app)
@@ -1,4 +1,6 @@
+import json
 import os
+from app.utils.replicas import replica_binds
 
 
 class Config:
@@ -12,3 +14,96 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.environ.get(
         'DATABASE_URL').replace('postgres://', 'postgresql://')
     SQLALCHEMY_ECHO = True
+    # Optional read replicas as a comma separated list of URLs. GET requests
+    # to the recipe and user endpoints read from them, writes stay on the
+    # primary above.
+    SQLALCHEMY_BINDS = replica_binds(os.environ.get('DATABASE_REPLICA_URLS'))
+    # How long a user keeps reading from the primary after they write
+    REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+    # Limits for POST /api/batch
+    BATCH_MAX_REQUESTS = int(os.environ.get('BATCH_MAX_REQUESTS', 20))
+    BATCH_MAX_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS', 4))
+    # Most ingredient names each worker keeps for autocomplete
+    AUTOCOMPLETE_MAX_ENTRIES = int(os.environ.get('AUTOCOMPLETE_MAX_ENTRIES', 50000))
+    # Background job workers (`flask jobs worker`): threads per worker, how
+    # often an idle thread polls, retry backoff and how long a running job
+    # may go without finishing before it is handed to another worker
+    JOBS_CONCURRENCY = int(os.environ.get('JOBS_CONCURRENCY', 4))
+    JOBS_POLL_INTERVAL = float(os.environ.get('JOBS_POLL_INTERVAL', 1.0))
+    JOBS_BACKOFF_BASE = float(os.environ.get('JOBS_BACKOFF_BASE', 5))
+    JOBS_BACKOFF_MAX = float(os.environ.get('JOBS_BACKOFF_MAX', 3600))
+    JOBS_VISIBILITY_TIMEOUT = int(os.environ.get('JOBS_VISIBILITY_TIMEOUT', 600))
+    # Users allowed to use /api/admin, as a comma separated list of emails
+    ADMIN_EMAILS = [email.strip().lower()
+                    for email in os.environ.get('ADMIN_EMAILS', '').split(',') if email.strip()]
+    # Request profiler. Off unless PROFILER_ENABLED is set; then requests with
+    # a signed X-Profile-Token header, and a PROFILER_SAMPLE_RATE share of all
+    # requests, are profiled into PROFILER_DIR (default instance/profiles)
+    PROFILER_ENABLED = os.environ.get('PROFILER_ENABLED', '').lower() in ('1', 'true', 'yes')
+    PROFILER_SAMPLE_RATE = float(os.environ.get('PROFILER_SAMPLE_RATE', 0))
+    PROFILER_MODE = os.environ.get('PROFILER_MODE', 'cprofile')  # cprofile or sampling
+    PROFILER_SAMPLE_INTERVAL = float(os.environ.get('PROFILER_SAMPLE_INTERVAL', 0.005))
+    PROFILER_DIR = os.environ.get('PROFILER_DIR')
+    PROFILER_MAX_FILES = int(os.environ.get('PROFILER_MAX_FILES', 200))
+    PROFILER_TOKEN_MAX_AGE = int(os.environ.get('PROFILER_TOKEN_MAX_AGE', 3600))
+    # Token bucket per user (or client IP when logged out): RATELIMIT_CAPACITY
+    # tokens, refilled at RATELIMIT_REFILL_RATE per second. Endpoint costs
+    # are set in app/utils/ratelimit.py and overridden with RATELIMIT_COSTS
+    # ({"endpoint": cost} as JSON). RATELIMIT_STORAGE_URL (redis://...)
+    # shares the buckets between workers.
+    RATELIMIT_ENABLED = os.environ.get('RATELIMIT_ENABLED', 'true').lower() in ('1', 'true', 'yes')
+    RATELIMIT_CAPACITY = float(os.environ.get('RATELIMIT_CAPACITY', 120))
+    RATELIMIT_REFILL_RATE = float(os.environ.get('RATELIMIT_REFILL_RATE', 2))
+    RATELIMIT_COSTS = json.loads(os.environ.get('RATELIMIT_COSTS', '{}'))
+    RATELIMIT_STORAGE_URL = os.environ.get('RATELIMIT_STORAGE_URL')
+    # Proxies in front of the app that append to X-Forwarded-For
+    RATELIMIT_TRUSTED_PROXIES = int(os.environ.get('RATELIMIT_TRUSTED_PROXIES', 0))
+    # Most /api/ requests one worker process runs at once (0 for no cap).
+    # Keep it at or below the connection pool size (5 + 10 overflow by
+    # default) so requests are shed with 503 instead of waiting on the pool.
+    ADMISSION_MAX_CONCURRENT = int(os.environ.get('ADMISSION_MAX_CONCURRENT', 15))
+    ADMISSION_QUEUE_TIMEOUT = float(os.environ.get('ADMISSION_QUEUE_TIMEOUT', 0.5))
+    ADMISSION_RETRY_AFTER = int(os.environ.get('ADMISSION_RETRY_AFTER', 1))
+    # Grocery list change streams: how often each stream checks the list's
+    # version, how often an idle stream sends a keepalive, how long a stream
+    # stays open before the client reconnects (keep it under the gunicorn
+    # timeout) and how many streams one worker process serves at once (0
+    # for no cap). Each open stream holds a worker thread.
+    SYNC_POLL_INTERVAL = float(os.environ.get('SYNC_POLL_INTERVAL', 1.0))
+    SYNC_HEARTBEAT_SECONDS = float(os.environ.get('SYNC_HEARTBEAT_SECONDS', 15))
+    SYNC_STREAM_MAX_SECONDS = float(os.environ.get('SYNC_STREAM_MAX_SECONDS', 25))
+    SYNC_STREAM_MAX_CONCURRENT = int(os.environ.get('SYNC_STREAM_MAX_CONCURRENT', 2))
+    # Uploaded recipe images: where originals and resized variants are kept
+    # (default instance/images), the largest upload accepted, how many
+    # processes resize images and how long a request for a variant waits
+    # on a resize still in progress
+    IMAGE_DIR = os.environ.get('IMAGE_DIR')
+    IMAGE_MAX_BYTES = int(os.environ.get('IMAGE_MAX_BYTES', 10 * 1024 * 1024))
+    IMAGE_WORKERS = int(os.environ.get('IMAGE_WORKERS', 2))
+    IMAGE_RENDER_TIMEOUT = float(os.environ.get('IMAGE_RENDER_TIMEOUT', 10))
+    # Home feed: authors with this many followers are merged into feeds when
+    # read instead of copied into every follower's timeline, and following
+    # someone copies their latest FEED_BACKFILL recipes
+    FEED_FANOUT_LIMIT = int(os.environ.get('FEED_FANOUT_LIMIT', 5000))
+    FEED_BACKFILL = int(os.environ.get('FEED_BACKFILL', 50))
+    # Request deadlines: seconds an /api/ request may take before its
+    # database queries are cancelled and it answers 503, unless its view
+    # declares a budget with @deadline (0 for no deadline). DEADLINE_BUDGETS
+    # overrides budgets by endpoint ({"endpoint": seconds} as JSON).
+    DEADLINE_DEFAULT = float(os.environ.get('DEADLINE_DEFAULT', 10))
+    DEADLINE_BUDGETS = json.loads(os.environ.get('DEADLINE_BUDGETS', '{}'))
+    # Grocery list retention: checked-off items untouched for
+    # ARCHIVE_CHECKED_ITEMS_DAYS and lists untouched for
+    # ARCHIVE_STALE_LISTS_DAYS move to the archive tables (0 turns either
+    # off), at most ARCHIVE_BATCH_SIZE items per transaction. The
+    # grocery-lists.archive job runs every ARCHIVE_INTERVAL_HOURS, at most
+    # ARCHIVE_JOB_MAX_BATCHES batches per run.
+    ARCHIVE_CHECKED_ITEMS_DAYS = int(os.environ.get('ARCHIVE_CHECKED_ITEMS_DAYS', 30))
+    ARCHIVE_STALE_LISTS_DAYS = int(os.environ.get('ARCHIVE_STALE_LISTS_DAYS', 180))
+    ARCHIVE_BATCH_SIZE = int(os.environ.get('ARCHIVE_BATCH_SIZE', 500))
+    ARCHIVE_INTERVAL_HOURS = float(os.environ.get('ARCHIVE_INTERVAL_HOURS', 24))
+    ARCHIVE_JOB_MAX_BATCHES = int(os.environ.get('ARCHIVE_JOB_MAX_BATCHES', 50))
+    # Nutrition estimates: the nutrient reference table (default
+    # app/data/nutrients.csv) and how many recipes one batch request covers
+    NUTRITION_TABLE = os.environ.get('NUTRITION_TABLE')
+    NUTRITION_BATCH_LIMIT = int(os.environ.get('NUTRITION_BATCH_LIMIT', 100))
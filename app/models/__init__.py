@@ -1,6 +1,10 @@
 from .db import db
 from .user import User
 from .db import environment, SCHEMA
-from .recipe import Recipe  
-from .grocery_list import GroceryList, GroceryListItem
-from .social import Comment, Like, Favourite
+from .recipe import Recipe, RecipeRevision
+from .grocery_list import (
+    GroceryList, GroceryListItem, GroceryListItemDeletion, ArchivedGroceryList, ArchivedGroceryListItem
+)
+from .social import Comment, Like, Favourite, Follow, TimelineEntry
+from .backfill import BackfillCheckpoint
+from .job import Job
@@ -0,0 +1,26 @@
+from .db import db, environment, SCHEMA
+from datetime import datetime
+
+
+class BackfillCheckpoint(db.Model):
+    __tablename__ = 'backfill_checkpoints'
+
+    if environment == "production":
+        __table_args__ = {'schema': SCHEMA}
+
+    name = db.Column(db.String(100), primary_key=True)
+    last_key = db.Column(db.Integer, nullable=False, default=0)
+    rows_done = db.Column(db.Integer, nullable=False, default=0)
+    started_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'name': self.name,
+            'last_key': self.last_key,
+            'rows_done': self.rows_done,
+            'started_at': self.started_at,
+            'updated_at': self.updated_at,
+            'finished_at': self.finished_at
+        }
@@ -4,18 +4,30 @@ from datetime import datetime
 class GroceryList(db.Model):
     __tablename__ = 'grocery_lists'
 
+    # Lists left untouched the longest, for archiving. Archived lists keep
+    # their id, so SQLite must never hand it out again (AUTOINCREMENT).
     if environment == "production":
-        __table_args__ = {'schema': SCHEMA}
+        __table_args__ = (
+            db.Index('ix_grocery_lists_updated_at', 'updated_at'),
+            {'schema': SCHEMA, 'sqlite_autoincrement': True}
+        )
+    else:
+        __table_args__ = (
+            db.Index('ix_grocery_lists_updated_at', 'updated_at'),
+            {'sqlite_autoincrement': True}
+        )
 
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(255), nullable=False)
-    user_id = db.Column(db.Integer, db.ForeignKey(add_prefix_for_prod('users.id')), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey(add_prefix_for_prod('users.id'), ondelete='CASCADE'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Bumped on every change to the list or its items, see app/utils/list_sync.py
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     # Relationships
-    user = db.relationship("User", backref="grocery_lists")
-    items = db.relationship("GroceryListItem", backref="grocery_list", cascade="all, delete-orphan")
+    user = db.relationship("User", backref=db.backref("grocery_lists", cascade="all, delete", passive_deletes=True))
+    items = db.relationship("GroceryListItem", backref="grocery_list", cascade="all, delete-orphan", passive_deletes=True)
 
     def to_dict(self):
         return {
@@ -23,8 +35,9 @@ class GroceryList(db.Model):
             'name': self.name,
             'user_id': self.user_id,
             'username': self.user.username if self.user else None,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
+            'version': self.version,
             'items': [item.to_dict() for item in self.items]
         }
 
@@ -32,16 +45,30 @@ class GroceryList(db.Model):
 class GroceryListItem(db.Model):
     __tablename__ = 'grocery_list_items'
 
+    # The second index finds checked-off items due for archiving
     if environment == "production":
-        __table_args__ = {'schema': SCHEMA}
+        __table_args__ = (
+            db.Index('ix_grocery_list_items_list_version', 'grocery_list_id', 'version'),
+            db.Index('ix_grocery_list_items_checked_updated', 'checked_off', 'updated_at'),
+            {'schema': SCHEMA}
+        )
+    else:
+        __table_args__ = (
+            db.Index('ix_grocery_list_items_list_version', 'grocery_list_id', 'version'),
+            db.Index('ix_grocery_list_items_checked_updated', 'checked_off', 'updated_at'),
+        )
 
     id = db.Column(db.Integer, primary_key=True)
-    grocery_list_id = db.Column(db.Integer, db.ForeignKey(add_prefix_for_prod('grocery_lists.id')), nullable=False)
+    grocery_list_id = db.Column(db.Integer, db.ForeignKey(add_prefix_for_prod('grocery_lists.id'), ondelete='CASCADE'), nullable=False)
     item_name = db.Column(db.String(255), nullable=False)
     quantity = db.Column(db.String(100))
     notes = db.Column(db.String(500))
     checked_off = db.Column(db.Boolean, default=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # List versions at which the item was added and last changed
+    created_version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    version = db.Column(db.Integer, nullable=False, default=0, server_default='0')
 
     def to_dict(self):
         return {
@@ -51,5 +78,113 @@ class GroceryListItem(db.Model):
             'quantity': self.quantity,
             'notes': self.notes,
             'checked_off': self.checked_off,
-            'created_at': self.created_at.isoformat() if self.created_at else None
-        }
\ No newline at end of file
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
+            'version': self.version
+        }
+
+
+class GroceryListItemDeletion(db.Model):
+    """
+    Tombstone for a deleted item, so clients syncing a list hear about it
+    """
+    __tablename__ = 'grocery_list_item_deletions'
+
+    if environment == "production":
+        __table_args__ = (
+            db.Index('ix_grocery_list_item_deletions_list_version', 'grocery_list_id', 'version'),
+            {'schema': SCHEMA}
+        )
+    else:
+        __table_args__ = (db.Index('ix_grocery_list_item_deletions_list_version', 'grocery_list_id', 'version'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    grocery_list_id = db.Column(db.Integer, db.ForeignKey(add_prefix_for_prod('grocery_lists.id'), ondelete='CASCADE'), nullable=False)
+    item_id = db.Column(db.Integer, nullable=False)
+    version = db.Column(db.Integer, nullable=False)
+    deleted_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+
+class ArchivedGroceryList(db.Model):
+    """
+    A list moved out of grocery_lists after going untouched for a while,
+    see app/utils/archive.py. `id` is the list's original id, which
+    grocery_lists never hands out again.
+    """
+    __tablename__ = 'grocery_lists_archive'
+
+    if environment == "production":
+        __table_args__ = (
+            db.Index('ix_grocery_lists_archive_user_id_id', 'user_id', 'id'),
+            {'schema': SCHEMA}
+        )
+    else:
+        __table_args__ = (db.Index('ix_grocery_lists_archive_user_id_id', 'user_id', 'id'),)
+
+    archive_id = db.Column(db.Integer, primary_key=True)
+    id = db.Column(db.Integer, nullable=False)
+    name = db.Column(db.String(255), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey(add_prefix_for_prod('users.id'), ondelete='CASCADE'), nullable=False)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self, items=()):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'user_id': self.user_id,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
+            'version': self.version,
+            'archived': True,
+            'archived_at': self.archived_at,
+            'items': [item.to_dict() for item in items]
+        }
+
+
+class ArchivedGroceryListItem(db.Model):
+    """
+    A checked-off item, or an item of an archived list, moved out of
+    grocery_list_items, under its original id. Its list may be in either
+    table, so the owner is kept here for the foreign key.
+    """
+    __tablename__ = 'grocery_list_items_archive'
+
+    if environment == "production":
+        __table_args__ = (
+            db.Index('ix_grocery_list_items_archive_user_list', 'user_id', 'grocery_list_id'),
+            {'schema': SCHEMA}
+        )
+    else:
+        __table_args__ = (db.Index('ix_grocery_list_items_archive_user_list', 'user_id', 'grocery_list_id'),)
+
+    archive_id = db.Column(db.Integer, primary_key=True)
+    id = db.Column(db.Integer, nullable=False)
+    grocery_list_id = db.Column(db.Integer, nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey(add_prefix_for_prod('users.id'), ondelete='CASCADE'), nullable=False)
+    item_name = db.Column(db.String(255), nullable=False)
+    quantity = db.Column(db.String(100))
+    notes = db.Column(db.String(500))
+    checked_off = db.Column(db.Boolean, default=False)
+    created_at = db.Column(db.DateTime)
+    updated_at = db.Column(db.DateTime)
+    created_version = db.Column(db.Integer, nullable=False, default=0)
+    version = db.Column(db.Integer, nullable=False, default=0)
+    archived_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'grocery_list_id': self.grocery_list_id,
+            'item_name': self.item_name,
+            'quantity': self.quantity,
+            'notes': self.notes,
+            'checked_off': self.checked_off,
+            'created_at': self.created_at,
+            'updated_at': self.updated_at,
+            'version': self.version,
+            'archived': True,
+            'archived_at': self.archived_at
+        }
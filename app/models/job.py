@@ -0,0 +1,45 @@
+from .db import db, environment, SCHEMA
+from sqlalchemy import JSON
+from datetime import datetime
+
+
+class Job(db.Model):
+    __tablename__ = 'jobs'
+
+    if environment == "production":
+        __table_args__ = (
+            db.Index('ix_jobs_status_run_at', 'status', 'run_at'),
+            {'schema': SCHEMA}
+        )
+    else:
+        __table_args__ = (db.Index('ix_jobs_status_run_at', 'status', 'run_at'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False)
+    payload = db.Column(JSON)
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, done, failed
+    attempts = db.Column(db.Integer, nullable=False, default=0)
+    max_attempts = db.Column(db.Integer, nullable=False, default=5)
+    idempotency_key = db.Column(db.String(255), unique=True)
+    last_error = db.Column(db.Text)
+    locked_by = db.Column(db.String(100))
+    run_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime)
+    finished_at = db.Column(db.DateTime)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'payload': self.payload,
+            'status': self.status,
+            'attempts': self.attempts,
+            'max_attempts': self.max_attempts,
+            'idempotency_key': self.idempotency_key,
+            'last_error': self.last_error,
+            'run_at': self.run_at,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
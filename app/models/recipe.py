@@ -6,8 +6,14 @@ from datetime import datetime
 class Recipe(db.Model):
     __tablename__ = 'recipes'
 
+    # Latest recipes by an author, for the home feed
     if environment == "production":
-        __table_args__ = {'schema': SCHEMA}
+        __table_args__ = (
+            db.Index('ix_recipes_user_id_id', 'user_id', 'id'),
+            {'schema': SCHEMA}
+        )
+    else:
+        __table_args__ = (db.Index('ix_recipes_user_id_id', 'user_id', 'id'),)
 
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(255), nullable=False)
@@ -15,12 +21,32 @@ class Recipe(db.Model):
     ingredients = db.Column(JSON, nullable=False)  # Store as JSON array
     instructions = db.Column(db.Text, nullable=False)
     image_url = db.Column(db.String(500))  # URLs can be long
-    user_id = db.Column(db.Integer, db.ForeignKey(add_prefix_for_prod('users.id')), nullable=False)
+    # SHA-256 of an uploaded image (see app/utils/images.py); takes the
+    # place of image_url when set
+    image_key = db.Column(db.String(64))
+    # Number of the latest revision; see app/utils/revisions.py
+    revision = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+    user_id = db.Column(db.Integer, db.ForeignKey(add_prefix_for_prod('users.id'), ondelete='CASCADE'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    # Serialized to_dict() output, kept current on every write and spliced
+    # straight into API responses
+    document = db.deferred(db.Column(db.Text))
+    # Nutrition totals worked out from the ingredients, cleared when they
+    # change; see app/utils/nutrition.py
+    nutrition = db.deferred(db.Column(JSON))
 
     # Relationship
-    user = db.relationship("User", backref="recipes")
+    user = db.relationship("User", backref=db.backref("recipes", cascade="all, delete", passive_deletes=True))
+
+    def image_variant_url(self, variant):
+        """
+        URL of a resized variant of the uploaded image, or image_url for an
+        image hosted elsewhere
+        """
+        if self.image_key:
+            return f'/api/images/{self.image_key}/{variant}.webp'
+        return self.image_url
 
     def to_dict(self):
         return {
@@ -29,9 +55,34 @@ class Recipe(db.Model):
             'description': self.description,
             'ingredients': self.ingredients,  # Will return as Python list
             'instructions': self.instructions,
-            'image_url': self.image_url,
+            'image_url': self.image_variant_url('full'),
+            'thumbnail_url': self.image_variant_url('thumbnail'),
+            'card_url': self.image_variant_url('card'),
             'user_id': self.user_id,
             'username': self.user.username if self.user else None,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
-        }
\ No newline at end of file
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
+        }
+
+
+class RecipeRevision(db.Model):
+    """
+    One numbered version of a recipe's content, zlib-compressed: either a
+    full snapshot or a diff against the revision before it
+    """
+    __tablename__ = 'recipe_revisions'
+
+    if environment == "production":
+        __table_args__ = (
+            db.UniqueConstraint('recipe_id', 'number', name='uq_recipe_revisions_recipe_number'),
+            {'schema': SCHEMA}
+        )
+    else:
+        __table_args__ = (db.UniqueConstraint('recipe_id', 'number', name='uq_recipe_revisions_recipe_number'),)
+
+    id = db.Column(db.Integer, primary_key=True)
+    recipe_id = db.Column(db.Integer, db.ForeignKey(add_prefix_for_prod('recipes.id'), ondelete='CASCADE'), nullable=False)
+    number = db.Column(db.Integer, nullable=False)
+    snapshot = db.Column(db.Boolean, nullable=False)
+    data = db.Column(db.LargeBinary, nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
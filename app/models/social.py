@@ -9,13 +9,13 @@ class Favourite(db.Model):
         __table_args__ = {'schema': SCHEMA}
 
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey(add_prefix_for_prod('users.id')), nullable=False)
-    recipe_id = db.Column(db.Integer, db.ForeignKey(add_prefix_for_prod('recipes.id')), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey(add_prefix_for_prod('users.id'), ondelete='CASCADE'), nullable=False)
+    recipe_id = db.Column(db.Integer, db.ForeignKey(add_prefix_for_prod('recipes.id'), ondelete='CASCADE'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Relationships
-    user = db.relationship("User", backref="favourites")
-    recipe = db.relationship("Recipe", backref="favourited_by")
+    user = db.relationship("User", backref=db.backref("favourites", cascade="all, delete", passive_deletes=True))
+    recipe = db.relationship("Recipe", backref=db.backref("favourited_by", cascade="all, delete", passive_deletes=True))
 
     # Prevent duplicate favourites
     __table_args__ = (db.UniqueConstraint('user_id', 'recipe_id', name='unique_user_recipe_favourite'),)
@@ -27,7 +27,7 @@ class Favourite(db.Model):
             'recipe_id': self.recipe_id,
             'username': self.user.username if self.user else None,
             'recipe_title': self.recipe.title if self.recipe else None,
-            'created_at': self.created_at.isoformat() if self.created_at else None
+            'created_at': self.created_at
         }
 
 
@@ -38,15 +38,15 @@ class Comment(db.Model):
         __table_args__ = {'schema': SCHEMA}
 
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey(add_prefix_for_prod('users.id')), nullable=False)
-    recipe_id = db.Column(db.Integer, db.ForeignKey(add_prefix_for_prod('recipes.id')), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey(add_prefix_for_prod('users.id'), ondelete='CASCADE'), nullable=False)
+    recipe_id = db.Column(db.Integer, db.ForeignKey(add_prefix_for_prod('recipes.id'), ondelete='CASCADE'), nullable=False)
     content = db.Column(db.Text, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
     # Relationships
-    user = db.relationship("User", backref="comments")
-    recipe = db.relationship("Recipe", backref="comments")
+    user = db.relationship("User", backref=db.backref("comments", cascade="all, delete", passive_deletes=True))
+    recipe = db.relationship("Recipe", backref=db.backref("comments", cascade="all, delete", passive_deletes=True))
 
     def to_dict(self):
         return {
@@ -55,8 +55,8 @@ class Comment(db.Model):
             'recipe_id': self.recipe_id,
             'content': self.content,
             'username': self.user.username if self.user else None,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+            'created_at': self.created_at,
+            'updated_at': self.updated_at
         }
 
 
@@ -67,13 +67,13 @@ class Like(db.Model):
         __table_args__ = {'schema': SCHEMA}
 
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey(add_prefix_for_prod('users.id')), nullable=False)
-    recipe_id = db.Column(db.Integer, db.ForeignKey(add_prefix_for_prod('recipes.id')), nullable=False)
+    user_id = db.Column(db.Integer, db.ForeignKey(add_prefix_for_prod('users.id'), ondelete='CASCADE'), nullable=False)
+    recipe_id = db.Column(db.Integer, db.ForeignKey(add_prefix_for_prod('recipes.id'), ondelete='CASCADE'), nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
 
     # Relationships
-    user = db.relationship("User", backref="likes")
-    recipe = db.relationship("Recipe", backref="liked_by")
+    user = db.relationship("User", backref=db.backref("likes", cascade="all, delete", passive_deletes=True))
+    recipe = db.relationship("Recipe", backref=db.backref("liked_by", cascade="all, delete", passive_deletes=True))
 
     # Prevent duplicate likes
     __table_args__ = (db.UniqueConstraint('user_id', 'recipe_id', name='unique_user_recipe_like'),)
@@ -84,5 +84,49 @@ class Like(db.Model):
             'user_id': self.user_id,
             'recipe_id': self.recipe_id,
             'username': self.user.username if self.user else None,
-            'created_at': self.created_at.isoformat() if self.created_at else None
-        }
\ No newline at end of file
+            'created_at': self.created_at
+        }
+
+
+class Follow(db.Model):
+    __tablename__ = 'follows'
+
+    if environment == "production":
+        __table_args__ = (
+            db.UniqueConstraint('follower_id', 'followed_id', name='unique_follower_followed'),
+            db.Index('ix_follows_followed_id', 'followed_id'),
+            {'schema': SCHEMA}
+        )
+    else:
+        __table_args__ = (
+            db.UniqueConstraint('follower_id', 'followed_id', name='unique_follower_followed'),
+            db.Index('ix_follows_followed_id', 'followed_id'),
+        )
+
+    id = db.Column(db.Integer, primary_key=True)
+    follower_id = db.Column(db.Integer, db.ForeignKey(add_prefix_for_prod('users.id'), ondelete='CASCADE'), nullable=False)
+    followed_id = db.Column(db.Integer, db.ForeignKey(add_prefix_for_prod('users.id'), ondelete='CASCADE'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'follower_id': self.follower_id,
+            'followed_id': self.followed_id,
+            'created_at': self.created_at
+        }
+
+
+class TimelineEntry(db.Model):
+    """
+    A recipe in a user's home feed, written when the author posts it (see
+    app/utils/feed.py)
+    """
+    __tablename__ = 'timeline_entries'
+
+    if environment == "production":
+        __table_args__ = {'schema': SCHEMA}
+
+    user_id = db.Column(db.Integer, db.ForeignKey(add_prefix_for_prod('users.id'), ondelete='CASCADE'), primary_key=True)
+    recipe_id = db.Column(db.Integer, db.ForeignKey(add_prefix_for_prod('recipes.id'), ondelete='CASCADE'), primary_key=True)
+    author_id = db.Column(db.Integer, db.ForeignKey(add_prefix_for_prod('users.id'), ondelete='CASCADE'), nullable=False)
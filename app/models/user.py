@@ -1,18 +1,59 @@
 from .db import db, environment, SCHEMA, add_prefix_for_prod
 from werkzeug.security import generate_password_hash, check_password_hash
 from flask_login import UserMixin
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import ColumnElement
+from sqlalchemy.sql.visitors import InternalTraversal
+
+
+class PrefixSearchKey(ColumnElement):
+    """
+    Index key serving the case-insensitive prefix search in
+    app/api/user_routes.py: lower(column) text_pattern_ops on Postgres,
+    column COLLATE NOCASE on SQLite
+    """
+    __visit_name__ = 'prefix_search_key'
+    inherit_cache = True
+    _traverse_internals = [('column', InternalTraversal.dp_clauseelement)]
+
+    def __init__(self, column):
+        self.column = column
+        self.type = column.type
+
+
+@compiles(PrefixSearchKey)
+def _compile_prefix_search_key(element, compiler, **kw):
+    return f'{compiler.process(element.column, **kw)} COLLATE NOCASE'
+
+
+@compiles(PrefixSearchKey, 'postgresql')
+def _compile_prefix_search_key_postgresql(element, compiler, **kw):
+    return f'lower({compiler.process(element.column, **kw)}) text_pattern_ops'
 
 
 class User(db.Model, UserMixin):
     __tablename__ = 'users'
 
-    if environment == "production":
-        __table_args__ = {'schema': SCHEMA}
-
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(40), nullable=False, unique=True)
     email = db.Column(db.String(255), nullable=False, unique=True)
     hashed_password = db.Column(db.String(255), nullable=False)
+    # Kept up to date by follow() and unfollow() in app/utils/feed.py
+    follower_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')
+
+    # Indexes for the user directory search: username by prefix, email by
+    # exact match only
+    if environment == "production":
+        __table_args__ = (
+            db.Index('ix_users_username_prefix', PrefixSearchKey(username)),
+            db.Index('ix_users_email_prefix', PrefixSearchKey(email)),
+            {'schema': SCHEMA}
+        )
+    else:
+        __table_args__ = (
+            db.Index('ix_users_username_prefix', PrefixSearchKey(username)),
+            db.Index('ix_users_email_prefix', PrefixSearchKey(email)),
+        )
 
     @property
     def password(self):
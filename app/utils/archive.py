@@ -0,0 +1,261 @@
+"""
+Hot/cold retention for grocery lists.
+
+Checked-off items left alone for ARCHIVE_CHECKED_ITEMS_DAYS, and lists left
+alone for ARCHIVE_STALE_LISTS_DAYS together with all their items, move to
+grocery_lists_archive and grocery_list_items_archive in short transactions
+of at most ARCHIVE_BATCH_SIZE rows. The hot tables, their indexes and
+GroceryList.to_dict() then only carry what people still use.
+
+Archiving an item counts as a change to its list: the list version moves on
+and the item gets a tombstone, so syncing clients drop it. The list's
+updated_at is left alone, since archiving isn't activity. Archived rows are
+read back with ?include_archived=true on the grocery list endpoints.
+
+Run it with `flask grocery-lists archive`, or start the grocery-lists.archive
+job with `flask grocery-lists schedule-archive`; the job then queues itself
+again every ARCHIVE_INTERVAL_HOURS.
+"""
+import time
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import delete, func, insert, literal, select, update
+from app.models import (
+    db, ArchivedGroceryList, ArchivedGroceryListItem, GroceryList, GroceryListItem, GroceryListItemDeletion
+)
+from app.utils.jobs import enqueue, job
+
+archive_commands = AppGroup('grocery-lists')
+
+# Lists move with all their items, so a batch takes this many times fewer
+# lists than items
+LIST_BATCH_DIVISOR = 10
+
+ITEM_COLUMNS = ('id', 'grocery_list_id', 'item_name', 'quantity', 'notes', 'checked_off',
+                'created_at', 'updated_at', 'created_version', 'version')
+LIST_COLUMNS = ('id', 'name', 'user_id', 'created_at', 'updated_at', 'version')
+
+
+def _cutoff(days):
+    return datetime.utcnow() - timedelta(days=days) if days > 0 else None
+
+
+def _items_due(cutoff):
+    items = GroceryListItem.__table__
+    return items.c.checked_off.is_(True) & (items.c.updated_at < cutoff)
+
+
+def _archive_items(item_ids, now):
+    # Copies items, with their list's owner, into the archive
+    items, lists = GroceryListItem.__table__, GroceryList.__table__
+    archive = ArchivedGroceryListItem.__table__
+    db.session.execute(insert(archive).from_select(
+        [*ITEM_COLUMNS, 'user_id', 'archived_at'],
+        select(*[items.c[name] for name in ITEM_COLUMNS], lists.c.user_id,
+               literal(now, archive.c.archived_at.type))
+        .select_from(items.join(lists, lists.c.id == items.c.grocery_list_id))
+        .where(item_ids)))
+
+
+def archive_checked_items(cutoff, batch_size):
+    """
+    Moves one batch of checked-off items last changed before `cutoff` to the
+    archive and commits. Returns how many moved.
+    """
+    items, lists = GroceryListItem.__table__, GroceryList.__table__
+    candidates = db.session.execute(
+        select(items.c.id, items.c.grocery_list_id)
+        .where(_items_due(cutoff))
+        .order_by(items.c.updated_at)
+        .limit(batch_size)).all()
+    if not candidates:
+        return 0
+
+    # Every item write bumps its list's version first, so this holds them
+    # off until the batch commits and the items can't change under it
+    list_ids = sorted({row.grocery_list_id for row in candidates})
+    db.session.execute(update(lists).where(lists.c.id.in_(list_ids))
+                       .values(version=lists.c.version + 1, updated_at=lists.c.updated_at))
+    moved = db.session.execute(
+        select(items.c.id, items.c.grocery_list_id)
+        .where(items.c.id.in_([row.id for row in candidates]), _items_due(cutoff))).all()
+
+    if moved:
+        now = datetime.utcnow()
+        moved_ids = items.c.id.in_([row.id for row in moved])
+        _archive_items(moved_ids, now)
+        db.session.execute(delete(items).where(moved_ids))
+        versions = dict(db.session.execute(
+            select(lists.c.id, lists.c.version).where(lists.c.id.in_(list_ids))).all())
+        db.session.execute(insert(GroceryListItemDeletion.__table__), [
+            {'grocery_list_id': row.grocery_list_id, 'item_id': row.id,
+             'version': versions[row.grocery_list_id], 'deleted_at': now}
+            for row in moved])
+    db.session.commit()
+    return len(moved)
+
+
+def archive_stale_lists(cutoff, batch_size):
+    """
+    Moves one batch of lists last changed before `cutoff`, with all their
+    items, to the archive and commits. Returns how many lists moved.
+    """
+    lists, items = GroceryList.__table__, GroceryListItem.__table__
+    # Writers waiting on a locked list find it gone once the batch commits
+    list_ids = db.session.scalars(
+        select(lists.c.id)
+        .where(lists.c.updated_at < cutoff)
+        .order_by(lists.c.updated_at)
+        .limit(batch_size)
+        .with_for_update(skip_locked=True)).all()
+    if not list_ids:
+        return 0
+
+    now = datetime.utcnow()
+    archive = ArchivedGroceryList.__table__
+    db.session.execute(insert(archive).from_select(
+        [*LIST_COLUMNS, 'archived_at'],
+        select(*[lists.c[name] for name in LIST_COLUMNS], literal(now, archive.c.archived_at.type))
+        .where(lists.c.id.in_(list_ids))))
+    _archive_items(items.c.grocery_list_id.in_(list_ids), now)
+    # ON DELETE CASCADE removes the items and tombstones
+    db.session.execute(delete(lists).where(lists.c.id.in_(list_ids)))
+    db.session.commit()
+    return len(list_ids)
+
+
+def run_archive(batch_size=None, max_batches=None, throttle=0.0, log=None):
+    """
+    Archives stale lists, then checked-off items, until nothing is due or
+    max_batches batches have run. Returns counts and whether it finished.
+    """
+    config = current_app.config
+    batch_size = batch_size or config['ARCHIVE_BATCH_SIZE']
+    report = {'lists': 0, 'items': 0, 'batches': 0, 'finished': False}
+    phases = []
+    lists_cutoff = _cutoff(config['ARCHIVE_STALE_LISTS_DAYS'])
+    if lists_cutoff:
+        phases.append(('lists', archive_stale_lists, lists_cutoff, max(batch_size // LIST_BATCH_DIVISOR, 1)))
+    items_cutoff = _cutoff(config['ARCHIVE_CHECKED_ITEMS_DAYS'])
+    if items_cutoff:
+        phases.append(('items', archive_checked_items, items_cutoff, batch_size))
+
+    for name, archive_batch, cutoff, size in phases:
+        while True:
+            if max_batches is not None and report['batches'] >= max_batches:
+                return report
+            moved = archive_batch(cutoff, size)
+            if not moved:
+                break
+            report[name] += moved
+            report['batches'] += 1
+            if log:
+                log(f'archived {report["lists"]} lists and {report["items"]} items so far')
+            if throttle:
+                time.sleep(throttle)
+    report['finished'] = True
+    return report
+
+
+def archive_due():
+    """
+    How many lists and checked-off items the current policy would archive
+    """
+    config = current_app.config
+    lists_cutoff = _cutoff(config['ARCHIVE_STALE_LISTS_DAYS'])
+    items_cutoff = _cutoff(config['ARCHIVE_CHECKED_ITEMS_DAYS'])
+    lists = GroceryList.__table__
+    return {
+        'lists': db.session.scalar(select(func.count()).select_from(lists)
+                                   .where(lists.c.updated_at < lists_cutoff)) if lists_cutoff else 0,
+        'items': db.session.scalar(select(func.count()).select_from(GroceryListItem.__table__)
+                                   .where(_items_due(items_cutoff))) if items_cutoff else 0
+    }
+
+
+def schedule_archive(after_slot=None):
+    """
+    Queues the archive job for the start of the next ARCHIVE_INTERVAL_HOURS
+    slot, or of the slot after `after_slot`. The slot is the idempotency
+    key, so each one is only ever queued once.
+    """
+    interval = current_app.config['ARCHIVE_INTERVAL_HOURS'] * 3600
+    if interval <= 0:
+        return None
+    slot = int(time.time() // interval) + 1
+    if after_slot is not None:
+        slot = max(slot, after_slot + 1)
+    return enqueue('grocery-lists.archive', {'slot': slot},
+                   idempotency_key=f'grocery-lists.archive:{slot}',
+                   delay=max(slot * interval - time.time(), 0))
+
+
+@job('grocery-lists.archive')
+def archive_job(payload):
+    payload = payload or {}
+    report = run_archive(max_batches=current_app.config['ARCHIVE_JOB_MAX_BATCHES'])
+    if report['finished']:
+        schedule_archive(payload.get('slot'))
+    else:
+        # More is due than one run moves; carry on instead of waiting a
+        # whole interval
+        enqueue('grocery-lists.archive', {'slot': payload.get('slot')})
+
+
+def archived_lists(user_id, list_id=None):
+    """
+    Plan (see app/utils/plans.py) loading a user's archived lists, or one
+    """
+    query = select(ArchivedGroceryList).where(ArchivedGroceryList.user_id == user_id)
+    if list_id is not None:
+        query = query.where(ArchivedGroceryList.id == list_id)
+    rows = yield query.order_by(ArchivedGroceryList.id)
+    return [archived for archived, in rows]
+
+
+def archived_items(user_id, list_ids=None):
+    """
+    Plan loading a user's archived items by list id, for all their lists
+    or some
+    """
+    query = select(ArchivedGroceryListItem).where(ArchivedGroceryListItem.user_id == user_id)
+    if list_ids is not None:
+        query = query.where(ArchivedGroceryListItem.grocery_list_id.in_(list_ids))
+    by_list = {}
+    for item, in (yield query.order_by(ArchivedGroceryListItem.id)):
+        by_list.setdefault(item.grocery_list_id, []).append(item)
+    return by_list
+
+
+def include_archived(args):
+    return args.get('include_archived', '').lower() in ('1', 'true', 'yes')
+
+
+# Creates the `flask grocery-lists archive` command
+@archive_commands.command('archive')
+@click.option('--dry-run', is_flag=True, help='Only count what the policy would archive.')
+@click.option('--batch-size', type=int, default=None, help='Items per transaction (default ARCHIVE_BATCH_SIZE).')
+@click.option('--max-batches', type=int, default=None, help='Stop after this many batches.')
+@click.option('--throttle', type=float, default=0.0, help='Seconds to sleep between batches.')
+def archive_command(dry_run, batch_size, max_batches, throttle):
+    if dry_run:
+        due = archive_due()
+        click.echo(f'{due["lists"]} lists and {due["items"]} checked-off items are due for archiving')
+        return
+    report = run_archive(batch_size, max_batches, throttle, log=click.echo)
+    click.echo(f'Archived {report["lists"]} lists and {report["items"]} items in {report["batches"]} batches'
+               + ('' if report['finished'] else ', more are due'))
+
+
+# Creates the `flask grocery-lists schedule-archive` command
+@archive_commands.command('schedule-archive')
+def schedule_archive_command():
+    scheduled = schedule_archive()
+    db.session.commit()
+    if scheduled is None:
+        click.echo('ARCHIVE_INTERVAL_HOURS is 0, nothing scheduled')
+    else:
+        click.echo(f'Archive job {scheduled.id} runs at {scheduled.run_at} UTC, then every '
+                   f'{current_app.config["ARCHIVE_INTERVAL_HOURS"]} hours')
@@ -0,0 +1,184 @@
+import heapq
+import threading
+from bisect import bisect_left, insort
+from sqlalchemy import func, select
+from app.models import db, Recipe, GroceryListItem, ArchivedGroceryListItem
+from app.utils.nutrition import FRACTIONS, QUANTITY, UNITS
+
+# Longest name kept in the index; anything longer is not a useful suggestion
+MAX_NAME_LENGTH = 80
+
+# Share of the lowest ranked entries dropped when the index is over budget,
+# so eviction runs rarely instead of on every insert
+EVICT_FRACTION = 0.1
+
+
+def _is_unit(word):
+    word = word.lower().rstrip('.')
+    return word in UNITS or (word.endswith('s') and word[:-1] in UNITS)
+
+
+def ingredient_name(text):
+    """
+    The name an ingredient line or item is indexed under, in its display
+    case: whitespace collapsed, and a leading quantity with its unit
+    ("1 1/2 cups", "2 tbsp of", "a pinch of") dropped
+    """
+    text = str(text)
+    for fraction, value in FRACTIONS.items():
+        text = text.replace(fraction, f' {value}')
+    text = ' '.join(text.split())
+    words = text.split(' ')
+    match = QUANTITY.match(text)
+    if match and text[match.end():match.end() + 1] in ('', ' '):
+        words = text[match.end():].split()
+    elif len(words) > 1 and words[0].lower() in ('a', 'an') and _is_unit(words[1]):
+        # "a pinch of salt"
+        words = words[1:]
+    else:
+        return text
+    if words and _is_unit(words[0]):
+        words = words[1:]
+    if words and words[0].lower() == 'of':
+        words = words[1:]
+    return ' '.join(words)
+
+
+def normalize(name):
+    """
+    Index key for a name, and the form a query prefix is matched in
+    """
+    return ingredient_name(name).lower()
+
+
+class PrefixIndex:
+    """
+    Per-worker ingredient name index: a sorted array of normalized names for
+    prefix range lookups, plus each name's display form and frequency.
+    Names and query prefixes are normalized alike, so "2 cups Flour" and
+    "flour" count as one name. The index never holds more than max_entries
+    names.
+    """
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self.ready = False
+        self._keys = []
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._keys)
+
+    def _add(self, name, count):
+        display = ingredient_name(name)
+        if not display or len(display) > MAX_NAME_LENGTH:
+            return
+        key = display.lower()
+        entry = self._entries.get(key)
+        if entry:
+            entry[1] += count
+            if entry[1] <= 0:
+                del self._entries[key]
+                del self._keys[bisect_left(self._keys, key)]
+        elif count > 0:
+            self._entries[key] = [display, count]
+            insort(self._keys, key)
+
+    def _evict(self):
+        if len(self._keys) <= self.max_entries:
+            return
+        drop = len(self._keys) - self.max_entries + int(self.max_entries * EVICT_FRACTION)
+        for key in heapq.nsmallest(drop, self._keys, key=lambda key: self._entries[key][1]):
+            del self._entries[key]
+        self._keys = [key for key in self._keys if key in self._entries]
+
+    def load(self, counts):
+        """
+        Replaces the index contents with an iterable of (name, count)
+        """
+        with self._lock:
+            self._keys = []
+            self._entries = {}
+            merged = {}
+            for name, count in counts:
+                display = ingredient_name(name)
+                if not display or len(display) > MAX_NAME_LENGTH:
+                    continue
+                entry = merged.setdefault(display.lower(), [display, 0])
+                entry[1] += count
+            self._entries = merged
+            self._keys = sorted(merged)
+            self._evict()
+            self.ready = True
+
+    def update(self, added=(), removed=()):
+        """
+        Incrementally counts names in and out of the index
+        """
+        if not self.ready:
+            return
+        with self._lock:
+            for name in removed:
+                self._add(name, -1)
+            for name in added:
+                self._add(name, 1)
+            self._evict()
+
+    def suggest(self, prefix, limit=10):
+        """
+        Returns up to `limit` (name, count) pairs starting with `prefix`,
+        most frequent first
+        """
+        prefix = normalize(prefix)
+        if not prefix:
+            return []
+        with self._lock:
+            start = bisect_left(self._keys, prefix)
+            end = bisect_left(self._keys, prefix + '\uffff', lo=start)
+            matches = [self._entries[key] for key in self._keys[start:end]]
+        best = heapq.nsmallest(limit, matches, key=lambda entry: (-entry[1], entry[0].lower()))
+        return [(display, count) for display, count in best]
+
+
+ingredient_index = PrefixIndex(max_entries=50000)
+
+
+def _existing_names():
+    """
+    Yields (name, count) for every recipe ingredient and grocery item name
+    in the database, archived items included
+    """
+    result = db.session.execute(select(Recipe.ingredients).execution_options(stream_results=True))
+    for (ingredients,) in result.yield_per(1000):
+        for name in ingredients or []:
+            if isinstance(name, str):
+                yield name, 1
+
+    # Archived items still count: archiving doesn't change the index
+    for model in (GroceryListItem, ArchivedGroceryListItem):
+        yield from db.session.execute(
+            select(model.item_name, func.count())
+            .group_by(model.item_name))
+
+
+def build_ingredient_index(app):
+    """
+    Builds this worker's index from the existing data. Called when a worker
+    starts, and on first use otherwise.
+    """
+    ingredient_index.max_entries = app.config['AUTOCOMPLETE_MAX_ENTRIES']
+    with app.app_context():
+        ingredient_index.load(_existing_names())
+        db.session.remove()
+
+
+_build_lock = threading.Lock()
+
+
+def get_ingredient_index(app):
+    if not ingredient_index.ready:
+        with _build_lock:
+            if not ingredient_index.ready:
+                build_ingredient_index(app)
+    return ingredient_index
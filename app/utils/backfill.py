@@ -0,0 +1,215 @@
+"""
+Chunked, resumable data backfills.
+
+A backfill walks a table in primary key order, one short transaction per
+chunk, and records how far it got in backfill_checkpoints in the same
+transaction. If it is stopped or crashes it resumes from the last committed
+chunk, so no statement ever holds locks on more than one chunk of rows.
+
+Run registered backfills with `flask backfill run <name>`, or from a
+migration, outside alembic's own transaction:
+
+    from app.utils.backfill import backfills, run_backfill
+
+    def upgrade():
+        with op.get_context().autocommit_block():
+            run_backfill(backfills['normalize-recipe-ingredients'], op.get_bind().engine)
+"""
+import time
+from datetime import datetime
+import click
+from flask.cli import AppGroup
+from sqlalchemy import inspect, select, update
+from app.models import db, Recipe, BackfillCheckpoint
+
+backfill_commands = AppGroup('backfill')
+
+# Registered backfills by name
+backfills = {}
+
+
+class Backfill:
+    """
+    Describes one backfill: the table to walk, the integer key to order by,
+    an optional filter, and a process(connection, rows, **options) callable
+    that updates one chunk of rows and returns how many it changed. The
+    options come from prepare(connection), called once per run, for what
+    only needs working out once, such as which columns exist.
+    """
+
+    def __init__(self, name, table, process, columns=None, key='id', where=None, batch_size=1000,
+                 prepare=None):
+        self.name = name
+        self.table = table
+        self.process = process
+        self.prepare = prepare
+        self.columns = columns
+        self.key = key
+        self.where = where
+        self.batch_size = batch_size
+
+    def chunk_query(self, last_key, batch_size):
+        key = self.table.c[self.key]
+        columns = [self.table.c[name] for name in self.columns] if self.columns else [self.table]
+        query = select(*columns).where(key > last_key).order_by(key).limit(batch_size)
+        if self.where is not None:
+            query = query.where(self.where)
+        return query
+
+
+def register_backfill(backfill):
+    backfills[backfill.name] = backfill
+    return backfill
+
+
+def _checkpoint_table():
+    return BackfillCheckpoint.__table__
+
+
+def read_checkpoint(connection, name):
+    table = _checkpoint_table()
+    return connection.execute(select(table).where(table.c.name == name)).first()
+
+
+def _save_checkpoint(connection, name, last_key, rows_done, finished=False):
+    table = _checkpoint_table()
+    values = {
+        'last_key': last_key,
+        'rows_done': rows_done,
+        'updated_at': datetime.utcnow(),
+        'finished_at': datetime.utcnow() if finished else None
+    }
+    result = connection.execute(update(table).where(table.c.name == name).values(**values))
+    if result.rowcount == 0:
+        connection.execute(table.insert().values(name=name, started_at=datetime.utcnow(), **values))
+
+
+def reset_checkpoint(engine, name):
+    table = _checkpoint_table()
+    with engine.begin() as connection:
+        connection.execute(table.delete().where(table.c.name == name))
+
+
+def run_backfill(backfill, engine, batch_size=None, throttle=0.0, max_batches=None, log=print):
+    """
+    Runs a backfill to completion (or for max_batches chunks), resuming from
+    its checkpoint. Sleeps `throttle` seconds between chunks to leave room
+    for regular traffic. Returns the number of rows processed in this run.
+    """
+    batch_size = batch_size or backfill.batch_size
+    with engine.connect() as connection:
+        checkpoint = read_checkpoint(connection, backfill.name)
+        options = backfill.prepare(connection) if backfill.prepare else {}
+    last_key = checkpoint.last_key if checkpoint else 0
+    rows_done = checkpoint.rows_done if checkpoint else 0
+    if checkpoint and checkpoint.finished_at:
+        log(f'{backfill.name}: already finished at {checkpoint.finished_at}, nothing to do')
+        return 0
+    if checkpoint:
+        log(f'{backfill.name}: resuming after key {last_key} ({rows_done} rows already done)')
+
+    started = time.perf_counter()
+    processed = 0
+    changed = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        with engine.begin() as connection:
+            rows = connection.execute(backfill.chunk_query(last_key, batch_size)).all()
+            if not rows:
+                _save_checkpoint(connection, backfill.name, last_key, rows_done, finished=True)
+                elapsed = time.perf_counter() - started
+                log(f'{backfill.name}: finished, {processed} rows this run, {changed} changed '
+                    f'in {elapsed:.1f}s')
+                return processed
+            changed += backfill.process(connection, rows, **options) or 0
+            last_key = getattr(rows[-1], backfill.key)
+            rows_done += len(rows)
+            _save_checkpoint(connection, backfill.name, last_key, rows_done)
+
+        processed += len(rows)
+        batches += 1
+        elapsed = time.perf_counter() - started
+        log(f'{backfill.name}: {rows_done} rows done, last key {last_key}, '
+            f'{processed / elapsed if elapsed else 0:,.0f} rows/s')
+        if throttle:
+            time.sleep(throttle)
+
+    log(f'{backfill.name}: stopped after {batches} batches, resume later to continue')
+    return processed
+
+
+def _has_column(connection, table, name):
+    columns = inspect(connection).get_columns(table.name, schema=table.schema)
+    return any(column['name'] == name for column in columns)
+
+
+def _recipe_ingredients_options(connection):
+    return {'has_nutrition': _has_column(connection, Recipe.__table__, 'nutrition')}
+
+
+def _normalize_recipe_ingredients(connection, rows, has_nutrition=True):
+    """
+    Trims whitespace from every ingredient and drops blank or non-text
+    entries. Documents and cached nutrition of changed recipes are cleared
+    so they are rebuilt from the new data.
+
+    This is a cleanup, not an edit, so it records no revision and leaves
+    Recipe.revision alone. It also runs from a migration older than the
+    revision history and the nutrition column, so it only clears nutrition
+    when the column exists.
+    """
+    table = Recipe.__table__
+    cleared = {'document': None}
+    if has_nutrition:
+        cleared['nutrition'] = None
+    changed = 0
+    for row in rows:
+        ingredients = row.ingredients if isinstance(row.ingredients, list) else []
+        normalized = [' '.join(name.split()) for name in ingredients
+                      if isinstance(name, str) and name.strip()]
+        if normalized != row.ingredients:
+            connection.execute(
+                update(table).where(table.c.id == row.id)
+                .values(ingredients=normalized, updated_at=table.c.updated_at, **cleared))
+            changed += 1
+    return changed
+
+
+register_backfill(Backfill(
+    'normalize-recipe-ingredients',
+    Recipe.__table__,
+    _normalize_recipe_ingredients,
+    columns=['id', 'ingredients'],
+    prepare=_recipe_ingredients_options
+))
+
+
+# Creates the `flask backfill list` command
+@backfill_commands.command('list')
+def list_backfills():
+    with db.engine.connect() as connection:
+        for name in sorted(backfills):
+            checkpoint = read_checkpoint(connection, name)
+            if not checkpoint:
+                status = 'not started'
+            elif checkpoint.finished_at:
+                status = f'finished {checkpoint.finished_at} ({checkpoint.rows_done} rows)'
+            else:
+                status = f'in progress, last key {checkpoint.last_key} ({checkpoint.rows_done} rows)'
+            click.echo(f'{name}: {status}')
+
+
+# Creates the `flask backfill run <name>` command
+@backfill_commands.command('run')
+@click.argument('name')
+@click.option('--batch-size', type=int, help='Rows per transaction.')
+@click.option('--throttle', type=float, default=0.0, help='Seconds to sleep between batches.')
+@click.option('--max-batches', type=int, help='Stop after this many batches.')
+@click.option('--restart', is_flag=True, help='Ignore the checkpoint and start from the beginning.')
+def run_backfill_command(name, batch_size, throttle, max_batches, restart):
+    if name not in backfills:
+        raise click.BadParameter(f'unknown backfill {name}', param_hint='name')
+    if restart:
+        reset_checkpoint(db.engine, name)
+    run_backfill(backfills[name], db.engine, batch_size=batch_size,
+                 throttle=throttle, max_batches=max_batches, log=click.echo)
@@ -0,0 +1,256 @@
+"""
+Per-endpoint latency budgets.
+
+Each /api/ request gets a deadline when it starts: the budget its view
+declares with @deadline(seconds), DEADLINE_DEFAULT for views that don't,
+or an override from DEADLINE_BUDGETS. Streaming views declare
+@deadline(None), since their queries run long after the view returns.
+
+The deadline is enforced on every database statement the request runs:
+
+- a statement started after the deadline fails straight away
+- on Postgres each transaction runs SET LOCAL statement_timeout with the
+  time left, so the server gives up on its own, and a watchdog thread
+  cancels a statement still running when the deadline passes
+- on SQLite a progress handler interrupts the statement at the deadline
+
+A request that runs out of time answers 503, even if the view caught the
+error, and is counted under its endpoint in app.extensions['deadlines'].
+"""
+import heapq
+import sqlite3
+import threading
+import time
+from collections import Counter
+from flask import current_app, g, has_app_context, has_request_context, jsonify, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+from sqlalchemy.pool import Pool
+
+# SQLite virtual machine instructions between deadline checks
+PROGRESS_INTERVAL = 1000
+
+# Postgres SQLSTATE for a cancelled statement (statement_timeout or cancel)
+QUERY_CANCELED = '57014'
+
+# Marks a connection that is about to roll back to a savepoint
+ROLLING_BACK = object()
+
+
+class DeadlineExceeded(Exception):
+    """
+    The current request ran out of its latency budget
+    """
+
+
+def deadline(seconds):
+    """
+    Declares a view's latency budget in seconds, or None for no deadline.
+    Goes below the route decorator.
+    """
+    def decorator(view):
+        view.deadline_seconds = seconds
+        return view
+    return decorator
+
+
+def endpoint_budget(endpoint):
+    budgets = current_app.config['DEADLINE_BUDGETS']
+    if endpoint in budgets:
+        return budgets[endpoint]
+    view = current_app.view_functions.get(endpoint)
+    return getattr(view, 'deadline_seconds', current_app.config['DEADLINE_DEFAULT'])
+
+
+class DeadlineStats:
+    """
+    How many requests ran out of time, by endpoint
+    """
+
+    def __init__(self):
+        self.hits = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, endpoint):
+        with self._lock:
+            self.hits[endpoint] += 1
+
+    def snapshot(self):
+        with self._lock:
+            return dict(self.hits.most_common())
+
+
+class Watchdog:
+    """
+    One daemon thread cancelling statements that are still running when
+    their request's deadline passes
+    """
+
+    def __init__(self):
+        self._heap = []
+        self._queued = set()
+        self._running = {}
+        self._condition = threading.Condition()
+        self._thread = None
+
+    def watch(self, dbapi_connection, at):
+        key = id(dbapi_connection)
+        with self._condition:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='deadline-watchdog', daemon=True)
+                self._thread.start()
+            self._running[key] = at
+            # One entry per connection and deadline, however many
+            # statements the request runs
+            if (key, at) not in self._queued:
+                self._queued.add((key, at))
+                heapq.heappush(self._heap, (at, key, dbapi_connection))
+                if self._heap[0][0] == at:
+                    self._condition.notify()
+
+    def done(self, dbapi_connection):
+        with self._condition:
+            self._running.pop(id(dbapi_connection), None)
+
+    def _run(self):
+        while True:
+            with self._condition:
+                while not self._heap:
+                    self._condition.wait()
+                at, key, dbapi_connection = self._heap[0]
+                wait = at - time.monotonic()
+                if wait > 0:
+                    self._condition.wait(wait)
+                    continue
+                heapq.heappop(self._heap)
+                self._queued.discard((key, at))
+                if self._running.get(key) != at:
+                    continue
+                del self._running[key]
+            try:
+                dbapi_connection.cancel()
+            except Exception:
+                # Closed in the meantime
+                pass
+
+
+_watchdog = Watchdog()
+
+
+def _current_deadline():
+    return g.get('deadline') if has_app_context() else None
+
+
+def _dbapi_connection(conn):
+    fairy = conn.connection
+    return getattr(fairy, 'dbapi_connection', None) or fairy.connection
+
+
+def _exceeded():
+    if has_request_context():
+        g.deadline_exceeded = True
+    return DeadlineExceeded()
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def enforce_statement_deadline(conn, cursor, statement, parameters, context, executemany):
+    at = _current_deadline()
+    dbapi_connection = _dbapi_connection(conn)
+    if at is None:
+        if conn.info.pop('deadline_progress_handler', False):
+            dbapi_connection.set_progress_handler(None, 0)
+        return
+
+    remaining = at - time.monotonic()
+    if remaining <= 0:
+        raise _exceeded()
+
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.set_progress_handler(lambda: time.monotonic() > at, PROGRESS_INTERVAL)
+        conn.info['deadline_progress_handler'] = True
+    elif conn.dialect.name == 'postgresql':
+        timeout_for = conn.info.get('statement_timeout_for')
+        if timeout_for is ROLLING_BACK:
+            # This is the ROLLBACK TO SAVEPOINT itself, in a transaction that
+            # may be aborted; the next statement sets the timeout again
+            del conn.info['statement_timeout_for']
+        elif timeout_for != at:
+            # Lasts until the transaction ends
+            cursor.execute('SET LOCAL statement_timeout = %d' % max(int(remaining * 1000), 1))
+            conn.info['statement_timeout_for'] = at
+        _watchdog.watch(dbapi_connection, at)
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def statement_finished(conn, cursor, statement, parameters, context, executemany):
+    if 'statement_timeout_for' in conn.info:
+        _watchdog.done(_dbapi_connection(conn))
+
+
+@event.listens_for(Engine, 'handle_error')
+def translate_deadline_errors(context):
+    at = _current_deadline()
+    conn = context.connection
+    if conn is not None and 'statement_timeout_for' in conn.info and not conn.invalidated:
+        _watchdog.done(_dbapi_connection(conn))
+    if at is None or isinstance(context.original_exception, DeadlineExceeded):
+        return
+    error = context.original_exception
+    if (time.monotonic() >= at
+            or getattr(error, 'pgcode', None) == QUERY_CANCELED
+            or (isinstance(error, sqlite3.OperationalError) and str(error) == 'interrupted')):
+        raise _exceeded() from error
+
+
+@event.listens_for(Engine, 'commit')
+@event.listens_for(Engine, 'rollback')
+def forget_statement_timeout(conn):
+    conn.info.pop('statement_timeout_for', None)
+
+
+@event.listens_for(Engine, 'rollback_savepoint')
+def forget_statement_timeout_in_savepoint(conn, name, context):
+    # Rolling back to a savepoint also undoes a SET LOCAL made after it.
+    # This runs before the ROLLBACK TO SAVEPOINT is sent.
+    if 'statement_timeout_for' in conn.info:
+        conn.info['statement_timeout_for'] = ROLLING_BACK
+
+
+@event.listens_for(Pool, 'checkin')
+def forget_statement_timeout_on_checkin(dbapi_connection, connection_record):
+    connection_record.info.pop('statement_timeout_for', None)
+
+
+def start_deadline():
+    """
+    Sets the request's deadline from its endpoint's budget. A batch
+    subrequest gets its own budget or what is left of the batch's,
+    whichever ends first.
+    """
+    if not request.path.startswith('/api/'):
+        return
+    budget = endpoint_budget(request.endpoint)
+    if budget:
+        at = time.monotonic() + budget
+        g.deadline = min(at, g.deadline) if g.get('deadline') is not None else at
+
+
+def deadline_response(response):
+    """
+    Answers 503 for a request that ran out of time, whatever the view
+    made of the error, and counts it
+    """
+    if not g.pop('deadline_exceeded', False):
+        return response
+    current_app.extensions['deadlines'].record(request.endpoint)
+    current_app.logger.warning('Deadline exceeded: %s %s', request.method, request.path)
+    response = jsonify({'error': 'The request took too long, try again shortly'})
+    response.status_code = 503
+    return response
+
+
+def install_deadlines(app):
+    app.extensions['deadlines'] = DeadlineStats()
+    app.before_request(start_deadline)
+    app.after_request(deadline_response)
+    app.register_error_handler(DeadlineExceeded, lambda error: deadline_response(None))
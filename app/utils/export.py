@@ -0,0 +1,68 @@
+from flask import current_app
+from sqlalchemy import select
+from app.models import (
+    db, User, Recipe, GroceryList, GroceryListItem, ArchivedGroceryList, ArchivedGroceryListItem,
+    Comment, Like, Favourite
+)
+
+# Rows fetched per round trip from each server-side cursor
+EXPORT_BATCH_SIZE = 500
+
+
+def _line(record_type, row):
+    return current_app.json.dumps({'type': record_type, 'data': row},
+                                  separators=(',', ':')) + '\n'
+
+
+def _stream(record_type, statement):
+    """
+    Streams one query through a server-side cursor, yielding an NDJSON line
+    per row so only one batch is ever held in memory
+    """
+    result = db.session.execute(statement.execution_options(stream_results=True))
+    for row in result.yield_per(EXPORT_BATCH_SIZE):
+        yield _line(record_type, row)
+    result.close()
+
+
+def export_user(user_id):
+    """
+    Yields a complete NDJSON export of everything a user owns: their account,
+    recipes, grocery lists and items (archived ones too), comments, likes
+    and favourites
+    """
+    users = User.__table__.c
+    yield from _stream('user', select(users.id, users.username, users.email)
+                       .where(users.id == user_id))
+
+    recipes = Recipe.__table__
+    yield from _stream('recipe', select(*[column for column in recipes.c if column.name not in ('document', 'nutrition')])
+                       .where(recipes.c.user_id == user_id)
+                       .order_by(recipes.c.id))
+
+    lists = GroceryList.__table__
+    yield from _stream('grocery_list', select(lists)
+                       .where(lists.c.user_id == user_id)
+                       .order_by(lists.c.id))
+
+    items = GroceryListItem.__table__
+    yield from _stream('grocery_list_item', select(items)
+                       .join(lists, lists.c.id == items.c.grocery_list_id)
+                       .where(lists.c.user_id == user_id)
+                       .order_by(items.c.grocery_list_id, items.c.id))
+
+    archived_lists = ArchivedGroceryList.__table__
+    yield from _stream('archived_grocery_list', select(archived_lists)
+                       .where(archived_lists.c.user_id == user_id)
+                       .order_by(archived_lists.c.id))
+
+    archived_items = ArchivedGroceryListItem.__table__
+    yield from _stream('archived_grocery_list_item', select(archived_items)
+                       .where(archived_items.c.user_id == user_id)
+                       .order_by(archived_items.c.grocery_list_id, archived_items.c.id))
+
+    for record_type, model in (('comment', Comment), ('like', Like), ('favourite', Favourite)):
+        table = model.__table__
+        yield from _stream(record_type, select(table)
+                           .where(table.c.user_id == user_id)
+                           .order_by(table.c.id))
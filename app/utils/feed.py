@@ -0,0 +1,187 @@
+"""
+Home feed: recent recipes from the cooks a user follows.
+
+Recipes are fanned out on write. Creating a recipe copies one row per
+follower into timeline_entries with a single INSERT ... SELECT, in the same
+transaction, and reading a feed page is a range scan of the reader's own
+timeline rows.
+
+An author with FEED_FANOUT_LIMIT followers or more would turn every recipe
+into that many rows, so their recipes are not fanned out. A reader merges
+in the latest recipes of the few such authors they follow instead, reading
+each one's newest recipes through the (user_id, id) index alongside their
+timeline.
+
+Following someone copies their latest FEED_BACKFILL recipes into the
+follower's timeline, and unfollowing removes them. When an author drops
+back under the limit, a job copies their latest recipes into every
+follower's timeline, since readers stop merging them in. Bulk imports use
+the same job.
+
+Pages are keyset paginated on recipe id, which follows creation order:
+?cursor= is the last id of the previous page.
+"""
+from flask import current_app
+from sqlalchemy import delete, event, exists, insert, literal, select, true, union, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+from app.models import db, Follow, Recipe, TimelineEntry, User
+from app.utils.jobs import enqueue, job
+
+
+def _fanout_limit():
+    return current_app.config['FEED_FANOUT_LIMIT']
+
+
+def _timeline_insert(dialect):
+    # Backfills and fan-out can race to copy the same recipe to the same
+    # follower; whoever comes second skips the row
+    upsert = postgresql.insert if dialect.name == 'postgresql' else sqlite.insert
+    return upsert(TimelineEntry.__table__)
+
+
+def fan_out(connection, recipe_ids):
+    """
+    Copies new recipes into the timelines of their authors' followers,
+    unless the author has too many followers for that
+    """
+    recipes, follows, users = Recipe.__table__, Follow.__table__, User.__table__
+    connection.execute(_timeline_insert(connection.dialect).from_select(
+        ['user_id', 'recipe_id', 'author_id'],
+        select(follows.c.follower_id, recipes.c.id, recipes.c.user_id)
+        .select_from(recipes
+                     .join(follows, follows.c.followed_id == recipes.c.user_id)
+                     .join(users, users.c.id == recipes.c.user_id))
+        .where(recipes.c.id.in_(recipe_ids), users.c.follower_count < _fanout_limit()))
+        .on_conflict_do_nothing())
+
+
+@event.listens_for(Session, 'after_flush')
+def fan_out_new_recipes(session, flush_context):
+    recipe_ids = [obj.id for obj in session.new if isinstance(obj, Recipe)]
+    if recipe_ids:
+        fan_out(session.connection(mapper=Recipe.__mapper__), recipe_ids)
+
+
+def backfill(author_id, follower_id=None):
+    """
+    Copies an author's latest FEED_BACKFILL recipes into the timeline of one
+    follower, or of all of them, skipping recipes already there
+    """
+    recipes, follows, timeline = Recipe.__table__, Follow.__table__, TimelineEntry.__table__
+    latest = (select(recipes.c.id)
+              .where(recipes.c.user_id == author_id)
+              .order_by(recipes.c.id.desc())
+              .limit(current_app.config['FEED_BACKFILL'])
+              .subquery())
+    followers = select(follows.c.follower_id).where(follows.c.followed_id == author_id)
+    if follower_id is not None:
+        followers = followers.where(follows.c.follower_id == follower_id)
+    followers = followers.subquery()
+
+    db.session.execute(_timeline_insert(db.session.get_bind().dialect).from_select(
+        ['user_id', 'recipe_id', 'author_id'],
+        select(followers.c.follower_id, latest.c.id, literal(author_id))
+        .select_from(followers.join(latest, true()))
+        .where(~exists().where(timeline.c.user_id == followers.c.follower_id,
+                               timeline.c.recipe_id == latest.c.id)))
+        .on_conflict_do_nothing())
+
+
+@job('feed.backfill-followers')
+def backfill_followers_job(payload):
+    follower_count = db.session.scalar(select(User.follower_count).where(User.id == payload['author_id']))
+    if follower_count is not None and follower_count < _fanout_limit():
+        backfill(payload['author_id'])
+
+
+def _change_follower_count(user_id, change):
+    users = User.__table__
+    db.session.execute(update(users).where(users.c.id == user_id)
+                       .values(follower_count=users.c.follower_count + change))
+    return db.session.execute(select(users.c.follower_count).where(users.c.id == user_id)).scalar()
+
+
+def follow(follower_id, followed_id):
+    """
+    Makes one user follow another. Returns False if they already did.
+    """
+    try:
+        with db.session.begin_nested():
+            db.session.execute(insert(Follow.__table__).values(follower_id=follower_id, followed_id=followed_id))
+    except IntegrityError:
+        return False
+    if _change_follower_count(followed_id, 1) < _fanout_limit():
+        backfill(followed_id, follower_id)
+    return True
+
+
+def unfollow(follower_id, followed_id):
+    """
+    Stops one user following another. Returns False if they didn't.
+    """
+    follows, timeline = Follow.__table__, TimelineEntry.__table__
+    removed = db.session.execute(delete(follows).where(follows.c.follower_id == follower_id,
+                                                       follows.c.followed_id == followed_id)).rowcount
+    if not removed:
+        return False
+    db.session.execute(delete(timeline).where(timeline.c.user_id == follower_id,
+                                              timeline.c.author_id == followed_id))
+    if _change_follower_count(followed_id, -1) == _fanout_limit() - 1:
+        # Readers stop merging this author in, so their recent recipes have
+        # to be in every follower's timeline
+        enqueue('feed.backfill-followers', {'author_id': followed_id})
+    return True
+
+
+def _timeline_ids(user_id, cursor, limit):
+    timeline = TimelineEntry.__table__
+    query = select(timeline.c.recipe_id.label('id')).where(timeline.c.user_id == user_id)
+    if cursor:
+        query = query.where(timeline.c.recipe_id < cursor)
+    return query.order_by(timeline.c.recipe_id.desc()).limit(limit)
+
+
+def merged_authors(user_id, min_followers):
+    """
+    The authors `user_id` follows that have at least `min_followers`
+    followers
+    """
+    follows, users = Follow.__table__, User.__table__
+    return db.session.scalars(
+        select(follows.c.followed_id)
+        .select_from(follows.join(users, users.c.id == follows.c.followed_id))
+        .where(follows.c.follower_id == user_id, users.c.follower_count >= min_followers)).all()
+
+
+def _author_ids(author_id, cursor, limit):
+    recipes = Recipe.__table__
+    query = select(recipes.c.id).where(recipes.c.user_id == author_id)
+    if cursor:
+        query = query.where(recipes.c.id < cursor)
+    return query.order_by(recipes.c.id.desc()).limit(limit)
+
+
+def merge_pages(sides, limit):
+    """
+    Newest `limit` ids, plus the next cursor, across queries that each
+    return their newest limit + 1 ids
+    """
+    merged = union(*[side.subquery().select() for side in sides]).subquery()
+    ids = db.session.scalars(select(merged.c.id).order_by(merged.c.id.desc()).limit(limit + 1)).all()
+    page = ids[:limit]
+    return page, page[-1] if len(ids) > limit else None
+
+
+def feed_page(user_id, cursor=None, limit=20):
+    """
+    Ids of the next page of a user's feed, newest first, and the cursor for
+    the page after it (None on the last page)
+    """
+    # The timeline and each merged author are read newest first through
+    # their indexes, limit + 1 rows at most, however long their history
+    sides = [_timeline_ids(user_id, cursor, limit + 1)]
+    sides += [_author_ids(author_id, cursor, limit + 1)
+              for author_id in merged_authors(user_id, _fanout_limit())]
+    return merge_pages(sides, limit)
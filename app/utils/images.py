@@ -0,0 +1,231 @@
+"""
+Uploaded recipe images and their resized variants.
+
+An upload is stored once under the SHA-256 of its bytes, in IMAGE_DIR:
+
+    <IMAGE_DIR>/<key[:2]>/<key>/original
+    <IMAGE_DIR>/<key[:2]>/<key>/<variant>.webp
+
+Resizing runs in a process pool so it never holds up a request thread or
+the GIL. A variant requested before the pool has written it waits for that
+render, up to IMAGE_RENDER_TIMEOUT. Because a URL always names the same
+bytes, variants are served with immutable cache headers.
+
+When a recipe lets go of an image (a new upload, an image_url, or the
+recipe being deleted) release_image() queues its removal, which happens
+only if no recipe uses it by then.
+"""
+import hashlib
+import io
+import multiprocessing
+import os
+import shutil
+import tempfile
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as RenderTimeout
+from concurrent.futures.process import BrokenProcessPool
+from flask import current_app
+from PIL import Image, ImageOps
+from sqlalchemy import select
+from app.models import db, Recipe
+from app.utils.jobs import enqueue, job
+
+# name: (width, height, crop). Cropped variants fill the box exactly, the
+# rest fit inside it. Changing a size means a new variant name, since the
+# old URLs are cached forever.
+VARIANTS = {
+    'thumbnail': (160, 160, True),
+    'card': (640, 400, True),
+    'full': (1600, 1600, False),
+}
+
+# URL extension: (Pillow format, mimetype)
+FORMATS = {
+    'webp': ('WEBP', 'image/webp'),
+}
+
+ACCEPTED_FORMATS = {'JPEG', 'PNG', 'WEBP', 'GIF'}
+
+QUALITY = 82
+
+# Seconds between a recipe letting go of an image and its files being
+# removed; an upload of the same bytes in that time keeps them
+RELEASE_DELAY = 3600
+
+
+class InvalidImage(ValueError):
+    pass
+
+
+def image_key(data):
+    return hashlib.sha256(data).hexdigest()
+
+
+def image_dir(root, key):
+    return os.path.join(root, key[:2], key)
+
+
+def variant_filename(variant, extension):
+    return f'{variant}.{extension}'
+
+
+def _write_atomic(path, write):
+    # Readers never see a half written file
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def store_original(root, data):
+    """
+    Checks that `data` is an image and saves it. Returns its key.
+    """
+    try:
+        with Image.open(io.BytesIO(data)) as image:
+            if image.format not in ACCEPTED_FORMATS:
+                raise InvalidImage('image must be JPEG, PNG, WebP or GIF')
+            image.verify()
+    except (OSError, SyntaxError, Image.DecompressionBombError) as e:
+        raise InvalidImage('not a readable image') from e
+
+    key = image_key(data)
+    directory = image_dir(root, key)
+    os.makedirs(directory, exist_ok=True)
+    original = os.path.join(directory, 'original')
+    if os.path.exists(original):
+        # Marks the image as wanted again for a pending release
+        os.utime(original)
+    else:
+        _write_atomic(original, lambda f: f.write(data))
+    return key
+
+
+def _convert(image):
+    # WebP keeps transparency
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        return image.convert('RGBA')
+    return image.convert('RGB')
+
+
+def render_variants(root, key):
+    """
+    Writes every missing variant of an image. Runs in the pool processes,
+    so it only takes picklable arguments.
+    """
+    directory = image_dir(root, key)
+    wanted = [(variant, extension) for variant in VARIANTS for extension in FORMATS
+              if not os.path.exists(os.path.join(directory, variant_filename(variant, extension)))]
+    if not wanted:
+        return 0
+
+    largest = max(width for width, height, crop in VARIANTS.values())
+    with Image.open(os.path.join(directory, 'original')) as image:
+        # JPEGs can be decoded straight at a fraction of their size
+        image.draft('RGB', (largest, largest))
+        image = _convert(ImageOps.exif_transpose(image))
+
+    rendered = {}
+    for variant, extension in wanted:
+        if variant not in rendered:
+            width, height, crop = VARIANTS[variant]
+            if crop:
+                rendered[variant] = ImageOps.fit(image, (width, height), Image.LANCZOS)
+            else:
+                resized = image.copy()
+                resized.thumbnail((width, height), Image.LANCZOS)
+                rendered[variant] = resized
+        pillow_format = FORMATS[extension][0]
+        _write_atomic(os.path.join(directory, variant_filename(variant, extension)),
+                      lambda f: rendered[variant].save(f, pillow_format, quality=QUALITY, optimize=True))
+    return len(wanted)
+
+
+class VariantRenderer:
+    """
+    Process pool rendering variants, with at most one render per image in
+    flight
+    """
+
+    def __init__(self, root, workers):
+        self.root = root
+        self.workers = workers
+        self._pool = None
+        self._pending = {}
+        # Reentrant: a future that is already done runs its callback at once
+        self._lock = threading.RLock()
+
+    def _executor(self):
+        if self._pool is None:
+            # spawn, not fork: the web process has threads and open connections
+            self._pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+        return self._pool
+
+    def submit(self, key):
+        with self._lock:
+            future = self._pending.get(key)
+            if future is None:
+                try:
+                    future = self._executor().submit(render_variants, self.root, key)
+                except BrokenProcessPool:
+                    # A pool process died (out of memory on a huge image, say)
+                    self._pool = None
+                    future = self._executor().submit(render_variants, self.root, key)
+                self._pending[key] = future
+                future.add_done_callback(lambda done: self._forget(key, done))
+            return future
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._pending.get(key) is future:
+                del self._pending[key]
+
+    def path(self, key, variant, extension, timeout):
+        """
+        Path of a variant, waiting up to `timeout` for it to be rendered if
+        needed (RenderTimeout after that). None if the image doesn't exist.
+        """
+        directory = image_dir(self.root, key)
+        path = os.path.join(directory, variant_filename(variant, extension))
+        if os.path.exists(path):
+            return path
+        if not os.path.exists(os.path.join(directory, 'original')):
+            return None
+        self.submit(key).result(timeout)
+        return path
+
+
+def release_image(key):
+    """
+    Queues removal of an image a recipe no longer uses. Call before
+    committing the change that drops it.
+    """
+    if key:
+        enqueue('images.release', {'key': key}, delay=RELEASE_DELAY)
+
+
+@job('images.release')
+def release_image_job(payload):
+    """
+    Deletes an image's original and variants unless a recipe uses it or it
+    was uploaded again since it was released
+    """
+    key = payload['key']
+    if db.session.execute(select(Recipe.id).where(Recipe.image_key == key).limit(1)).first():
+        return
+    directory = image_dir(current_app.extensions['images'].root, key)
+    original = os.path.join(directory, 'original')
+    if os.path.exists(original) and time.time() - os.path.getmtime(original) < RELEASE_DELAY:
+        return
+    shutil.rmtree(directory, ignore_errors=True)
+
+
+def install_images(app):
+    root = app.config['IMAGE_DIR'] or os.path.join(app.instance_path, 'images')
+    app.extensions['images'] = VariantRenderer(root, app.config['IMAGE_WORKERS'])
+
@@ -0,0 +1,371 @@
+"""
+Durable background jobs.
+
+Jobs are rows in the jobs table, so they survive restarts and work the same
+on SQLite and Postgres. Route handlers call enqueue() before committing:
+the job is written in the same transaction as the change that needs it and
+becomes visible to workers only once that transaction commits, and never if
+it rolls back.
+
+    @job('recipes.rebuild-documents')
+    def rebuild(payload):
+        ...
+
+    enqueue('recipes.rebuild-documents', {'ids': [1, 2]}, idempotency_key='...')
+    db.session.commit()
+
+Workers are started with `flask jobs worker`. Delivery is at least once: a
+job whose worker dies mid-run is picked up again after JOBS_VISIBILITY_TIMEOUT,
+so handlers must be safe to run twice.
+"""
+import logging
+import os
+import random
+import signal
+import socket
+import threading
+import time
+import traceback
+from datetime import datetime, timedelta
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import func, select, update
+from sqlalchemy.exc import IntegrityError
+from app.models import db, Job
+
+logger = logging.getLogger(__name__)
+
+job_commands = AppGroup('jobs')
+
+# Registered job handlers by name, with their default max attempts
+handlers = {}
+
+
+def job(name, max_attempts=5):
+    """
+    Registers a function taking the job payload as the handler for `name`
+    """
+    def register(fn):
+        handlers[name] = (fn, max_attempts)
+        return fn
+    return register
+
+
+def enqueue(name, payload=None, idempotency_key=None, delay=0, max_attempts=None):
+    """
+    Adds a job to the current session; it is queued when the caller commits.
+    If a job with the same idempotency key already exists, that job is
+    returned instead of adding another.
+    """
+    if idempotency_key is not None:
+        existing = Job.query.filter_by(idempotency_key=idempotency_key).first()
+        if existing:
+            return existing
+
+    if max_attempts is None:
+        max_attempts = handlers[name][1] if name in handlers else 5
+    new_job = Job(
+        name=name,
+        payload=payload,
+        idempotency_key=idempotency_key,
+        max_attempts=max_attempts,
+        status='queued',
+        attempts=0,
+        run_at=datetime.utcnow() + timedelta(seconds=delay)
+    )
+    if idempotency_key is None:
+        db.session.add(new_job)
+        return new_job
+
+    # A concurrent request may insert the same key first; the savepoint keeps
+    # that from failing the caller's whole transaction
+    try:
+        with db.session.begin_nested():
+            db.session.add(new_job)
+    except IntegrityError:
+        return Job.query.filter_by(idempotency_key=idempotency_key).first()
+    return new_job
+
+
+def backoff_seconds(attempts):
+    """
+    Exponential backoff with jitter before retry number `attempts`
+    """
+    base = current_app.config['JOBS_BACKOFF_BASE']
+    delay = min(base * 2 ** (attempts - 1), current_app.config['JOBS_BACKOFF_MAX'])
+    return delay * random.uniform(1.0, 1.25)
+
+
+def _job_table():
+    return Job.__table__
+
+
+def claim_job(connection, worker_id):
+    """
+    Marks the next due job as running and returns it, or None if nothing is
+    due. The status check in the UPDATE makes claiming safe between workers;
+    Postgres additionally skips rows other workers have locked.
+    """
+    table = _job_table()
+    now = datetime.utcnow()
+    candidates = (
+        select(table.c.id)
+        .where(table.c.status == 'queued', table.c.run_at <= now, table.c.name.in_(list(handlers)))
+        .order_by(table.c.run_at, table.c.id)
+        .limit(1)
+    )
+    if connection.dialect.name == 'postgresql':
+        candidates = candidates.with_for_update(skip_locked=True)
+
+    with connection.begin():
+        job_id = connection.execute(candidates).scalar()
+        if job_id is None:
+            return None
+        claimed = connection.execute(
+            update(table)
+            .where(table.c.id == job_id, table.c.status == 'queued')
+            .values(status='running', locked_by=worker_id, started_at=now,
+                    attempts=table.c.attempts + 1))
+        if claimed.rowcount != 1:
+            return False
+        return connection.execute(select(table).where(table.c.id == job_id)).first()
+
+
+def _finish(connection, row, error=None):
+    table = _job_table()
+    now = datetime.utcnow()
+    if error is None:
+        values = {'status': 'done', 'finished_at': now, 'last_error': None}
+    elif row.attempts < row.max_attempts:
+        values = {'status': 'queued', 'last_error': error,
+                  'run_at': now + timedelta(seconds=backoff_seconds(row.attempts))}
+    else:
+        values = {'status': 'failed', 'finished_at': now, 'last_error': error}
+    with connection.begin():
+        connection.execute(
+            update(table)
+            .where(table.c.id == row.id, table.c.locked_by == row.locked_by)
+            .values(locked_by=None, **values))
+    return values['status']
+
+
+def requeue_stale_jobs(connection):
+    """
+    Puts back jobs left running by a worker that died, counting the lost
+    run as a failed attempt
+    """
+    table = _job_table()
+    cutoff = datetime.utcnow() - timedelta(seconds=current_app.config['JOBS_VISIBILITY_TIMEOUT'])
+    stale = (table.c.status == 'running') & (table.c.started_at < cutoff)
+    with connection.begin():
+        failed = connection.execute(
+            update(table).where(stale, table.c.attempts >= table.c.max_attempts)
+            .values(status='failed', locked_by=None, finished_at=datetime.utcnow(),
+                    last_error='worker lost while running')).rowcount
+        requeued = connection.execute(
+            update(table).where(stale)
+            .values(status='queued', locked_by=None, run_at=datetime.utcnow(),
+                    last_error='worker lost while running')).rowcount
+    return requeued, failed
+
+
+def run_job(row):
+    """
+    Runs one claimed job's handler and returns None, or the error text if it
+    raised. The handler's session work is committed when it returns.
+    """
+    fn = handlers[row.name][0]
+    try:
+        fn(row.payload)
+        db.session.commit()
+        return None
+    except Exception:
+        db.session.rollback()
+        return traceback.format_exc(limit=20)
+    finally:
+        db.session.remove()
+
+
+class WorkerStats:
+    """
+    Counters for one worker process, logged periodically
+    """
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.done = 0
+        self.retried = 0
+        self.failed = 0
+        self.run_seconds = 0.0
+        self.wait_seconds = 0.0
+
+    def record(self, status, waited, ran):
+        with self.lock:
+            if status == 'done':
+                self.done += 1
+            elif status == 'queued':
+                self.retried += 1
+            else:
+                self.failed += 1
+            self.wait_seconds += waited
+            self.run_seconds += ran
+
+    def summary(self):
+        with self.lock:
+            runs = self.done + self.retried + self.failed
+            return (f'{self.done} done, {self.retried} retried, {self.failed} failed; '
+                    f'avg wait {self.wait_seconds / runs if runs else 0:.2f}s, '
+                    f'avg run {self.run_seconds / runs if runs else 0:.2f}s')
+
+
+def _work(app, worker_id, stop, stats, poll_interval, idle_exit=False):
+    with app.app_context():
+        engine = db.engine
+        while not stop.is_set():
+            try:
+                with engine.connect() as connection:
+                    row = claim_job(connection, worker_id)
+                if row is False:
+                    continue
+                if row is None:
+                    if idle_exit:
+                        return
+                    stop.wait(poll_interval)
+                    continue
+
+                waited = (row.started_at - row.run_at).total_seconds()
+                started = time.perf_counter()
+                error = run_job(row)
+                ran = time.perf_counter() - started
+                with engine.connect() as connection:
+                    status = _finish(connection, row, error)
+                stats.record(status, waited, ran)
+                if error:
+                    logger.warning('Job %s (%s) attempt %s/%s failed, now %s:\n%s', row.id, row.name,
+                                   row.attempts, row.max_attempts, status, error)
+            except Exception:
+                # Usually the database going away. A job claimed but not
+                # finished stays running until requeue_stale_jobs picks it up
+                # after JOBS_VISIBILITY_TIMEOUT, so the thread just backs off
+                # and carries on.
+                logger.exception('Job worker %s hit an error, retrying in %ss', worker_id, poll_interval)
+                stop.wait(poll_interval)
+
+
+def run_worker(app, concurrency=None, poll_interval=None, burst=False, log=print):
+    """
+    Runs `concurrency` worker threads until SIGINT/SIGTERM (or, with burst,
+    until no job is due). Each thread claims and runs one job at a time.
+    """
+    concurrency = concurrency or app.config['JOBS_CONCURRENCY']
+    poll_interval = poll_interval or app.config['JOBS_POLL_INTERVAL']
+    hostname = f'{socket.gethostname()}:{os.getpid()}'
+    stop = threading.Event()
+    stats = WorkerStats()
+
+    if threading.current_thread() is threading.main_thread():
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            signal.signal(sig, lambda *args: stop.set())
+
+    threads = [
+        threading.Thread(target=_work, name=f'job-worker-{n}', daemon=True,
+                         args=(app, f'{hostname}:{n}', stop, stats, poll_interval, burst))
+        for n in range(concurrency)
+    ]
+    for thread in threads:
+        thread.start()
+    log(f'Job worker {hostname} started with {concurrency} threads '
+        f'({len(handlers)} job types: {", ".join(sorted(handlers))})')
+
+    last_report = time.monotonic()
+    while any(thread.is_alive() for thread in threads):
+        if stop.wait(min(poll_interval * 5, 30)):
+            break
+        try:
+            with app.app_context():
+                with db.engine.connect() as connection:
+                    requeued, failed = requeue_stale_jobs(connection)
+                if requeued or failed:
+                    log(f'Recovered stale jobs: {requeued} requeued, {failed} failed')
+                if time.monotonic() - last_report >= 60:
+                    last_report = time.monotonic()
+                    log(f'{stats.summary()}; queue {queue_stats()["depth"]}')
+        except Exception:
+            logger.exception('Job worker %s could not check for stale jobs', hostname)
+
+    stop.set()
+    for thread in threads:
+        thread.join()
+    log(f'Job worker {hostname} stopped: {stats.summary()}')
+    return stats
+
+
+def queue_stats(window_minutes=60):
+    """
+    Queue depth by status, how overdue the oldest due job is, and wait and
+    run times of jobs finished in the last `window_minutes`
+    """
+    table = _job_table()
+    now = datetime.utcnow()
+    with db.engine.connect() as connection:
+        depth = dict(connection.execute(
+            select(table.c.status, func.count()).group_by(table.c.status)).all())
+        oldest_due = connection.execute(
+            select(func.min(table.c.run_at))
+            .where(table.c.status == 'queued', table.c.run_at <= now)).scalar()
+        finished = connection.execute(
+            select(table.c.run_at, table.c.started_at, table.c.finished_at)
+            .where(table.c.status == 'done',
+                   table.c.finished_at >= now - timedelta(minutes=window_minutes))).all()
+
+    waits = sorted((row.started_at - row.run_at).total_seconds() for row in finished)
+    runs = sorted((row.finished_at - row.started_at).total_seconds() for row in finished)
+
+    def percentile(values, p):
+        return round(values[min(len(values) - 1, int(len(values) * p))], 3) if values else None
+
+    return {
+        'depth': {status: depth.get(status, 0) for status in ('queued', 'running', 'done', 'failed')},
+        'oldest_due_seconds': round((now - oldest_due).total_seconds(), 3) if oldest_due else 0,
+        'finished_last_window': len(finished),
+        'wait_seconds': {'p50': percentile(waits, 0.5), 'p95': percentile(waits, 0.95)},
+        'run_seconds': {'p50': percentile(runs, 0.5), 'p95': percentile(runs, 0.95)}
+    }
+
+
+# Creates the `flask jobs worker` command
+@job_commands.command('worker')
+@click.option('--concurrency', type=int, help='Worker threads (default JOBS_CONCURRENCY).')
+@click.option('--poll-interval', type=float, help='Seconds to wait when the queue is empty.')
+@click.option('--burst', is_flag=True, help='Exit once no job is due.')
+def worker_command(concurrency, poll_interval, burst):
+    run_worker(current_app._get_current_object(), concurrency=concurrency,
+               poll_interval=poll_interval, burst=burst, log=click.echo)
+
+
+# Creates the `flask jobs stats` command
+@job_commands.command('stats')
+@click.option('--window', type=int, default=60, help='Minutes of finished jobs to measure.')
+def stats_command(window):
+    stats = queue_stats(window)
+    click.echo('depth: ' + ', '.join(f'{k}={v}' for k, v in stats['depth'].items()))
+    click.echo(f'oldest due job waiting: {stats["oldest_due_seconds"]}s')
+    click.echo(f'finished in the last {window} min: {stats["finished_last_window"]}')
+    click.echo(f'wait p50/p95: {stats["wait_seconds"]["p50"]}s / {stats["wait_seconds"]["p95"]}s')
+    click.echo(f'run p50/p95: {stats["run_seconds"]["p50"]}s / {stats["run_seconds"]["p95"]}s')
+
+
+# Creates the `flask jobs retry <id>` command
+@job_commands.command('retry')
+@click.argument('job_id', type=int)
+def retry_command(job_id):
+    failed = db.session.get(Job, job_id)
+    if not failed or failed.status != 'failed':
+        raise click.BadParameter(f'no failed job {job_id}', param_hint='job_id')
+    failed.status = 'queued'
+    failed.attempts = 0
+    failed.run_at = datetime.utcnow()
+    failed.finished_at = None
+    db.session.commit()
+    click.echo(f'Job {job_id} queued again')
@@ -0,0 +1,89 @@
+import dataclasses
+import decimal
+import json
+import uuid
+from datetime import date, datetime, time
+from flask.json.provider import DefaultJSONProvider
+from sqlalchemy.engine import Row
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - orjson is optional
+    orjson = None
+
+
+def _default(o):
+    """
+    Handles the types neither encoder knows natively
+    """
+    if isinstance(o, (datetime, date, time)):
+        return o.isoformat()
+    if isinstance(o, decimal.Decimal):
+        return str(o)
+    if isinstance(o, Row):
+        return dict(o._mapping)
+    if isinstance(o, uuid.UUID):
+        return str(o)
+    if dataclasses.is_dataclass(o) and not isinstance(o, type):
+        return dataclasses.asdict(o)
+    if hasattr(o, '__html__'):
+        return str(o.__html__())
+    raise TypeError(f'Object of type {type(o).__name__} is not JSON serializable')
+
+
+class FastJSONProvider(DefaultJSONProvider):
+    """
+    JSON provider backed by orjson when it is installed, falling back to the
+    standard library otherwise. Datetimes are written as ISO 8601 strings,
+    decimals as strings and SQLAlchemy rows as objects.
+    """
+
+    default = staticmethod(_default)
+    ensure_ascii = False
+
+    def _orjson_options(self, indent=False):
+        options = orjson.OPT_NON_STR_KEYS
+        if self.sort_keys:
+            options |= orjson.OPT_SORT_KEYS
+        if indent:
+            options |= orjson.OPT_INDENT_2
+        return options
+
+    def _orjson_dumps(self, obj, indent=False):
+        """
+        Returns UTF-8 bytes, or None if orjson can't handle the object
+        (such as integers wider than 64 bits)
+        """
+        try:
+            return orjson.dumps(obj, default=_default, option=self._orjson_options(indent))
+        except orjson.JSONEncodeError:
+            return None
+
+    def dumps(self, obj, **kwargs):
+        # orjson output is always compact, so separators can be ignored;
+        # anything else (custom encoder classes, odd indents) uses stdlib
+        if orjson is not None and set(kwargs) <= {'separators', 'indent'} \
+                and kwargs.get('indent') in (None, 2):
+            data = self._orjson_dumps(obj, indent=kwargs.get('indent') == 2)
+            if data is not None:
+                return data.decode('utf-8')
+        kwargs.setdefault('default', _default)
+        kwargs.setdefault('ensure_ascii', self.ensure_ascii)
+        kwargs.setdefault('sort_keys', self.sort_keys)
+        return json.dumps(obj, **kwargs)
+
+    def loads(self, s, **kwargs):
+        if orjson is not None and not kwargs:
+            return orjson.loads(s)
+        return json.loads(s, **kwargs)
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        indent = self.compact is False or (self.compact is None and self._app.debug)
+        if orjson is not None:
+            data = self._orjson_dumps(obj, indent=indent)
+            if data is not None:
+                return self._app.response_class(data, mimetype=self.mimetype)
+        dump_args = {'indent': 2} if indent else {'separators': (',', ':')}
+        return self._app.response_class(
+            f'{self.dumps(obj, **dump_args)}\n', mimetype=self.mimetype)
@@ -0,0 +1,141 @@
+"""
+Change versions for grocery lists.
+
+Every flush that adds, changes or deletes items of a list (or renames it)
+bumps that list's version once, stamps the changed items with the new
+version and leaves a tombstone for each deleted item. A client that has
+seen version N asks for everything with a version above N.
+
+The bump is an UPDATE of the list row, so writers to the same list take
+turns until they commit. A committed version therefore means every lower
+version has committed too, and reading changes up to the version just read
+can never skip a write that commits later.
+"""
+import time
+from flask import current_app
+from sqlalchemy import event, select, update
+from sqlalchemy.orm import Session, attributes
+from sqlalchemy.orm.util import identity_key
+from app.models import db, GroceryList, GroceryListItem, GroceryListItemDeletion
+
+
+def _bump_version(session, list_id):
+    table = GroceryList.__table__
+    session.execute(update(table).where(table.c.id == list_id).values(version=table.c.version + 1))
+    version = session.execute(select(table.c.version).where(table.c.id == list_id)).scalar()
+    loaded = session.identity_map.get(identity_key(GroceryList, list_id))
+    if loaded is not None:
+        attributes.set_committed_value(loaded, 'version', version)
+    return version
+
+
+@event.listens_for(Session, 'before_flush')
+def version_grocery_list_changes(session, flush_context, instances):
+    deleted_lists = {obj.id for obj in session.deleted if isinstance(obj, GroceryList)}
+    changes = {}
+
+    def track(list_id, change, item):
+        # Items of lists that are new or being deleted in this flush have
+        # nothing to sync against
+        if list_id is not None and list_id not in deleted_lists:
+            changes.setdefault(list_id, []).append((change, item))
+
+    for obj in session.new:
+        if isinstance(obj, GroceryListItem):
+            list_id = obj.grocery_list_id
+            if list_id is None and obj.grocery_list is not None:
+                list_id = obj.grocery_list.id
+            track(list_id, 'insert', obj)
+    for obj in session.dirty:
+        if isinstance(obj, GroceryListItem) and session.is_modified(obj):
+            track(obj.grocery_list_id, 'update', obj)
+        elif isinstance(obj, GroceryList) and session.is_modified(obj):
+            track(obj.id, 'list', obj)
+    for obj in session.deleted:
+        if isinstance(obj, GroceryListItem):
+            track(obj.grocery_list_id, 'delete', obj)
+
+    for list_id, list_changes in changes.items():
+        version = _bump_version(session, list_id)
+        for change, obj in list_changes:
+            if change == 'insert':
+                obj.created_version = version
+                obj.version = version
+            elif change == 'update':
+                obj.version = version
+            elif change == 'delete':
+                session.add(GroceryListItemDeletion(
+                    grocery_list_id=list_id, item_id=obj.id, version=version))
+
+
+def list_changes(grocery_list, since):
+    """
+    Items inserted, updated and deleted in a list after version `since`, up
+    to the list's current version
+    """
+    version = grocery_list.version
+    items = (GroceryListItem.query
+             .filter(GroceryListItem.grocery_list_id == grocery_list.id,
+                     GroceryListItem.version > since,
+                     GroceryListItem.version <= version)
+             .order_by(GroceryListItem.version, GroceryListItem.id)
+             .all())
+    deleted = db.session.scalars(
+        select(GroceryListItemDeletion.item_id)
+        .where(GroceryListItemDeletion.grocery_list_id == grocery_list.id,
+               GroceryListItemDeletion.version > since,
+               GroceryListItemDeletion.version <= version)
+        .order_by(GroceryListItemDeletion.version)).all()
+    return {
+        'grocery_list_id': grocery_list.id,
+        'name': grocery_list.name,
+        'since': since,
+        'version': version,
+        'inserted': [item.to_dict() for item in items if item.created_version > since],
+        'updated': [item.to_dict() for item in items if item.created_version <= since],
+        'deleted': deleted
+    }
+
+
+def _event(name, data, event_id=None):
+    payload = current_app.json.dumps(data, separators=(',', ':'))
+    head = f'id: {event_id}\n' if event_id is not None else ''
+    return f'{head}event: {name}\ndata: {payload}\n\n'
+
+
+def list_change_events(list_id, since):
+    """
+    Server-sent events for a list: a `changes` event with the delta each
+    time its version moves past `since`, a comment line now and then to
+    keep the connection open, and `deleted` if the list goes away. The
+    stream ends after SYNC_STREAM_MAX_SECONDS; EventSource reconnects with
+    Last-Event-ID and picks up where it left off.
+    """
+    poll_interval = current_app.config['SYNC_POLL_INTERVAL']
+    heartbeat = current_app.config['SYNC_HEARTBEAT_SECONDS']
+    started = last_sent = time.monotonic()
+
+    yield f'retry: {int(poll_interval * 1000)}\n\n'
+    while time.monotonic() - started < current_app.config['SYNC_STREAM_MAX_SECONDS']:
+        message = None
+        try:
+            grocery_list = db.session.get(GroceryList, list_id)
+            if grocery_list is None:
+                message = _event('deleted', {'grocery_list_id': list_id})
+            elif grocery_list.version > since:
+                delta = list_changes(grocery_list, since)
+                since = delta['version']
+                message = _event('changes', delta, event_id=since)
+        finally:
+            # Give the connection back between polls
+            db.session.close()
+
+        if message:
+            last_sent = time.monotonic()
+            yield message
+            if grocery_list is None:
+                return
+        elif time.monotonic() - last_sent >= heartbeat:
+            last_sent = time.monotonic()
+            yield ': keepalive\n\n'
+        time.sleep(poll_interval)
@@ -0,0 +1,273 @@
+"""
+Nutrition totals for recipes and grocery lists.
+
+Nutrient values come from the reference table shipped in
+app/data/nutrients.csv (NUTRITION_TABLE overrides it): one row per food
+with its aliases, the weight of one piece and of one cup, and nutrients
+per 100 g, rounded from USDA FoodData Central.
+
+Each ingredient line ("1 1/2 cups all-purpose flour", "3 garlic cloves",
+"Salt") is parsed once into (food, amount, kind of unit), so a recipe is a
+sparse vector of grams per food. A batch of recipes becomes one
+recipes x foods matrix, and one product with the foods x nutrients matrix
+gives every recipe's totals at once. Lines that match no food are left out
+of the totals and listed as unmatched.
+
+Recipe totals are cached in recipes.nutrition along with the digest of the
+table they came from, so a new table recomputes them; update_recipe clears
+the cache when the ingredients change.
+"""
+import csv
+import hashlib
+import os
+import re
+import unicodedata
+from functools import lru_cache
+import numpy as np
+from sqlalchemy import bindparam, select, update
+from app.models import db, Recipe
+
+DEFAULT_TABLE = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'data', 'nutrients.csv')
+
+# Parsed ingredient lines kept per worker
+PARSE_CACHE_SIZE = 20000
+
+# Kinds of unit, indexing NutrientTable.grams: an amount in grams, in cups
+# (converted with the food's weight per cup) or in pieces
+MASS, VOLUME, COUNT = 0, 1, 2
+
+UNITS = {
+    'g': (MASS, 1), 'gram': (MASS, 1), 'gr': (MASS, 1),
+    'kg': (MASS, 1000), 'kilogram': (MASS, 1000),
+    'oz': (MASS, 28.35), 'ounce': (MASS, 28.35),
+    'lb': (MASS, 453.6), 'pound': (MASS, 453.6),
+    'cup': (VOLUME, 1), 'c': (VOLUME, 1),
+    'tablespoon': (VOLUME, 1 / 16), 'tbsp': (VOLUME, 1 / 16), 'tbs': (VOLUME, 1 / 16), 'tbl': (VOLUME, 1 / 16),
+    'teaspoon': (VOLUME, 1 / 48), 'tsp': (VOLUME, 1 / 48),
+    'ml': (VOLUME, 1 / 236.6), 'milliliter': (VOLUME, 1 / 236.6), 'millilitre': (VOLUME, 1 / 236.6),
+    'l': (VOLUME, 1000 / 236.6), 'liter': (VOLUME, 1000 / 236.6), 'litre': (VOLUME, 1000 / 236.6),
+    'pint': (VOLUME, 2), 'quart': (VOLUME, 4), 'gallon': (VOLUME, 16),
+    'pinch': (VOLUME, 1 / 768), 'dash': (VOLUME, 1 / 384),
+    'clove': (COUNT, 1), 'slice': (COUNT, 1), 'piece': (COUNT, 1), 'stalk': (COUNT, 1),
+    'sprig': (COUNT, 1), 'can': (COUNT, 1), 'tin': (COUNT, 1), 'head': (COUNT, 1),
+    'bunch': (COUNT, 1), 'whole': (COUNT, 1), 'large': (COUNT, 1), 'medium': (COUNT, 1),
+    'small': (COUNT, 1),
+}
+
+FRACTIONS = {'½': '1/2', '⅓': '1/3', '⅔': '2/3', '¼': '1/4', '¾': '3/4', '⅕': '1/5',
+             '⅛': '1/8', '⅜': '3/8', '⅝': '5/8', '⅞': '7/8'}
+
+NUMBER = r'(?:\d+/\d+|\d+(?:\.\d+)?(?:\s+\d+/\d+)?)'
+QUANTITY = re.compile(rf'^({NUMBER})(?:\s*(?:-|to)\s*({NUMBER}))?')
+
+
+def _number(text):
+    return sum(float(part.split('/')[0]) / float(part.split('/')[1]) if '/' in part else float(part)
+               for part in text.split())
+
+
+def _singular(word):
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    if word.endswith(('oes', 'ches', 'shes', 'xes')) and len(word) > 4:
+        return word[:-2]
+    if len(word) > 2 and word.endswith('s') and not word.endswith(('ss', 'us', 'is')):
+        return word[:-1]
+    return word
+
+
+def _words(text):
+    return [_singular(word) for word in re.sub(r'[^a-z0-9]+', ' ', text).split()]
+
+
+def _normalize(text):
+    text = str(text).lower()
+    for fraction, value in FRACTIONS.items():
+        text = text.replace(fraction, f' {value}')
+    text = unicodedata.normalize('NFKD', text).encode('ascii', 'ignore').decode()
+    # Drop asides like "(14 oz)" or "(optional)"
+    return ' '.join(re.sub(r'\([^)]*\)', ' ', text).split())
+
+
+class NutrientTable:
+    """
+    The reference table as arrays: nutrients per gram of each food, and
+    grams per unit of each kind for each food
+    """
+
+    def __init__(self, nutrients, foods, per_gram, grams, names, digest):
+        self.nutrients = nutrients
+        self.foods = foods
+        self.per_gram = per_gram
+        self.grams = grams
+        self.digest = digest
+        # Food by the words of each of its names
+        self._names = names
+        self._longest = max(len(words) for words in names)
+        self.parse = lru_cache(maxsize=PARSE_CACHE_SIZE)(self._parse)
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as f:
+            raw = f.read()
+        rows = list(csv.DictReader(raw.decode('utf-8').splitlines()))
+        fields = list(rows[0])
+        nutrients = fields[fields.index('grams_per_cup') + 1:]
+        names = {}
+        for food, row in enumerate(rows):
+            for name in [row['name'], *row['aliases'].split('|')]:
+                words = tuple(_words(name))
+                if words:
+                    names.setdefault(words, food)
+        return cls(
+            nutrients,
+            [row['name'] for row in rows],
+            np.array([[float(row[name]) for name in nutrients] for row in rows]) / 100,
+            np.array([[1.0] * len(rows),
+                      [float(row['grams_per_cup']) for row in rows],
+                      [float(row['grams_each']) for row in rows]]),
+            names,
+            hashlib.sha256(raw).hexdigest()[:16])
+
+    def _match(self, words):
+        # Longest name first, then leftmost, so "apple cider vinegar" wins
+        # over "apple" and "bell pepper" over "pepper". Returns the food
+        # and where its name starts.
+        for length in range(min(self._longest, len(words)), 0, -1):
+            for start in range(len(words) - length + 1):
+                food = self._names.get(tuple(words[start:start + length]))
+                if food is not None:
+                    return food, start
+        return None
+
+    def _parse(self, text):
+        """
+        (food, amount, kind of unit) for an ingredient line, or None when it
+        names no known food. A line without a quantity counts as one.
+        """
+        text = _normalize(text)
+        amount = 1.0
+        match = QUANTITY.match(text)
+        if match:
+            low = _number(match.group(1))
+            amount = (low + _number(match.group(2))) / 2 if match.group(2) else low
+            text = text[match.end():]
+        elif text.startswith(('a ', 'an ')):
+            # "a pinch of salt"
+            text = text.split(' ', 1)[1]
+        words = _words(text)
+        matched = self._match(words)
+        if matched is None:
+            return None
+        food, start = matched
+        # A leading unit word only counts as the unit when it isn't part of
+        # the food's name, as in "whole wheat flour"
+        kind, factor = COUNT, 1
+        if start > 1 and words[:2] == ['fl', 'oz']:
+            kind, factor = VOLUME, 1 / 8
+        elif start > 0 and words[0] in UNITS:
+            kind, factor = UNITS[words[0]]
+        return food, amount * factor, kind
+
+    def totals(self, ingredient_lists):
+        """
+        Nutrient totals for a batch of ingredient lists, as a lists x
+        nutrients array, and the lines of each list that matched no food
+        """
+        rows, foods, amounts, kinds = [], [], [], []
+        unmatched = []
+        for row, lines in enumerate(ingredient_lists):
+            missed = []
+            for line in lines or []:
+                parsed = self.parse(str(line))
+                if parsed is None:
+                    missed.append(line)
+                    continue
+                rows.append(row)
+                foods.append(parsed[0])
+                amounts.append(parsed[1])
+                kinds.append(parsed[2])
+            unmatched.append(missed)
+
+        foods = np.array(foods, dtype=np.intp)
+        grams = np.array(amounts) * self.grams[np.array(kinds, dtype=np.intp), foods]
+        # The food list is short, so the batch is cheap to hold densely
+        quantities = np.zeros((len(unmatched), len(self.foods)))
+        np.add.at(quantities, (np.array(rows, dtype=np.intp), foods), grams)
+        return quantities @ self.per_gram, unmatched
+
+    def describe(self, values):
+        return {name: round(float(value), 1) for name, value in zip(self.nutrients, values)}
+
+
+def nutrient_table(app):
+    return app.extensions['nutrition']
+
+
+def install_nutrition(app):
+    app.extensions['nutrition'] = NutrientTable.load(app.config['NUTRITION_TABLE'] or DEFAULT_TABLE)
+
+
+def recipe_nutrition(table, recipe_ids):
+    """
+    Nutrition for each of `recipe_ids` that exists, by id. Cached totals
+    are reused; the rest are computed in one batch and cached, unless the
+    recipe changed in the meantime.
+    """
+    recipes = Recipe.__table__
+    rows = db.session.execute(
+        select(recipes.c.id, recipes.c.ingredients, recipes.c.nutrition, recipes.c.updated_at)
+        .where(recipes.c.id.in_(set(recipe_ids)))).all()
+
+    results = {}
+    stale = []
+    for row in rows:
+        cached = row.nutrition
+        if cached and cached.get('reference') == table.digest:
+            results[row.id] = {'recipe_id': row.id, 'nutrients': cached['nutrients'],
+                               'unmatched': cached['unmatched']}
+        else:
+            stale.append(row)
+    if not stale:
+        return results
+
+    totals, unmatched = table.totals([row.ingredients for row in stale])
+    cache = []
+    for row, values, missed in zip(stale, totals, unmatched):
+        nutrients = table.describe(values)
+        results[row.id] = {'recipe_id': row.id, 'nutrients': nutrients, 'unmatched': missed}
+        cache.append({'recipe_id': row.id, 'seen': row.updated_at,
+                      'nutrition': {'reference': table.digest, 'nutrients': nutrients, 'unmatched': missed}})
+
+    # update_recipe always moves updated_at, so a recipe edited since it was
+    # read keeps its cache cleared. Setting updated_at to itself stops its
+    # onupdate default from firing.
+    db.session.execute(
+        update(recipes)
+        .where(recipes.c.id == bindparam('recipe_id'),
+               recipes.c.updated_at.is_not_distinct_from(bindparam('seen')))
+        .values(nutrition=bindparam('nutrition'), updated_at=recipes.c.updated_at),
+        cache)
+    return results
+
+
+def item_nutrition(table, items):
+    """
+    Nutrition of grocery list items, each read as "<quantity> <item name>"
+    """
+    lines = [f'{item.quantity or ""} {item.item_name}' for item in items]
+    totals, _ = table.totals([lines])
+    return {
+        'nutrients': table.describe(totals[0]),
+        'unmatched': [item.item_name for item, line in zip(items, lines) if table.parse(line) is None]
+    }
+
+
+def sum_nutrients(table, results):
+    """
+    Adds up the nutrients of several results, e.g. the recipes of a meal plan
+    """
+    values = np.zeros(len(table.nutrients))
+    for result in results:
+        values += [result['nutrients'][name] for name in table.nutrients]
+    return table.describe(values)
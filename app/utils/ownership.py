@@ -0,0 +1,52 @@
+"""
+Loading rows that belong to a user.
+
+owned() checks ownership in the database instead of loading a row and
+comparing user_id in Python: the row is joined to whatever holds its
+owner's user_id (itself, or the parent list for an item) and outer joined
+to itself on the owner matching. One primary-key query answers all three
+cases: the row, "doesn't exist" and "someone else's", and a row the user
+may not see is never loaded.
+"""
+from sqlalchemy import and_, select
+from sqlalchemy.orm import aliased
+from app.models import Recipe, GroceryList, GroceryListItem
+from app.utils.plans import run_plan
+
+# Relationships leading from a row to the one holding its owner's user_id
+OWNER_PATHS = {
+    Recipe: (),
+    GroceryList: (),
+    GroceryListItem: ('grocery_list',),
+}
+
+
+def owned_plan(model, id, user, *options):
+    """
+    Plan (see app/utils/plans.py) loading row `id` of `model` if `user`
+    owns it. Returns (instance, found): (None, False) when there is no such
+    row, (None, True) when it belongs to someone else. Loader options apply
+    to the returned instance.
+    """
+    target = aliased(model)
+    owner = target
+    query = select(target.id, model).select_from(target)
+    for key in OWNER_PATHS[model]:
+        relationship = getattr(owner, key)
+        owner = relationship.property.mapper.class_
+        query = query.join(relationship)
+
+    rows = yield (query
+                  .outerjoin(model, and_(model.id == target.id, owner.user_id == user.id))
+                  .where(target.id == id)
+                  .options(*options))
+    if not rows:
+        return None, False
+    return rows[0][1], True
+
+
+def owned(model, id, user, *options):
+    """
+    owned_plan() run on the Flask-SQLAlchemy session
+    """
+    return run_plan(owned_plan(model, id, user, *options))
@@ -0,0 +1,64 @@
+"""
+Read views that run both in the Flask app and in app/asgi.py.
+
+A view decorated with @async_view is written as a generator (a "plan"):
+it yields each statement it needs run, is sent back the result rows, and
+returns the response. In the Flask app run_plan() drives it on the
+Flask-SQLAlchemy session. app/asgi.py calls the same view inside a Flask
+request context and drives it on an AsyncSession instead, so both modes
+share the queries, serialization, decorators and request hooks.
+
+A failed statement is raised inside the plan at its yield, so a view's
+own try/except handles it in either mode.
+"""
+import inspect
+from functools import wraps
+from app.models import db
+
+
+def run_plan(plan):
+    """
+    Runs a plan on the Flask-SQLAlchemy session and returns its result
+    """
+    try:
+        statement = next(plan)
+        while True:
+            try:
+                rows = db.session.execute(statement).all()
+            except Exception as error:
+                statement = plan.throw(error)
+            else:
+                statement = plan.send(rows)
+    except StopIteration as done:
+        return done.value
+
+
+async def run_plan_async(session, plan):
+    """
+    Runs a plan on an AsyncSession and returns its result
+    """
+    try:
+        statement = next(plan)
+        while True:
+            try:
+                rows = (await session.execute(statement)).all()
+            except Exception as error:
+                statement = plan.throw(error)
+            else:
+                statement = plan.send(rows)
+    except StopIteration as done:
+        return done.value
+
+
+def async_view(view):
+    """
+    Turns a plan into a regular Flask view, and marks it for app/asgi.py.
+    Goes under @login_required and @deadline, which return a response
+    instead of a plan when they answer the request themselves.
+    """
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        rv = view(*args, **kwargs)
+        return run_plan(rv) if inspect.isgenerator(rv) else rv
+    wrapper.plan = view
+    return wrapper
@@ -0,0 +1,255 @@
+"""
+Opt-in request profiler.
+
+When PROFILER_ENABLED is set, the WSGI app is wrapped in ProfilerMiddleware.
+It profiles a request when it carries a valid X-Profile-Token header (made
+with `flask profiler token`) or when it is picked at PROFILER_SAMPLE_RATE.
+Profiles are written to PROFILER_DIR, keeping the newest PROFILER_MAX_FILES:
+    cprofile   - a pstats dump, open with `python -m pstats <file>`
+    sampling   - collapsed stacks ("frame;frame;frame count" per line), for
+                 flamegraph.pl or speedscope
+When the profiler is disabled the middleware is never installed, so requests
+don't pay for it at all.
+"""
+import cProfile
+import os
+import random
+import re
+import sys
+import threading
+import time
+from collections import Counter
+from datetime import datetime
+from urllib.parse import quote, unquote
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from itsdangerous import BadSignature, URLSafeTimedSerializer
+
+profiler_commands = AppGroup('profiler')
+
+TOKEN_HEADER = 'HTTP_X_PROFILE_TOKEN'
+MODES = ('cprofile', 'sampling')
+EXTENSIONS = {'cprofile': 'pstats', 'sampling': 'collapsed'}
+
+# <timestamp>_<method>_<quoted path>_<ms>ms.<ext>
+FILENAME = re.compile(r'^(\d{8}T\d{6}\d{6})_([A-Z]+)_(.*)_(\d+)ms\.(pstats|collapsed)$')
+
+
+def _serializer(secret_key):
+    return URLSafeTimedSerializer(secret_key, salt='profiler')
+
+
+def make_token(secret_key, mode='cprofile'):
+    return _serializer(secret_key).dumps({'mode': mode})
+
+
+class ProfileStore:
+    """
+    A directory of profiles that keeps only the newest max_files
+    """
+
+    def __init__(self, directory, max_files):
+        self.directory = directory
+        self.max_files = max_files
+        self._lock = threading.Lock()
+
+    def path(self, name):
+        if not FILENAME.match(name):
+            return None
+        path = os.path.join(self.directory, name)
+        return path if os.path.isfile(path) else None
+
+    def new_path(self, method, path, duration_ms, mode):
+        # Percent escapes would be decoded again in download URLs, so they
+        # are written with ! instead
+        slug = quote(path, safe='').replace('%', '!')[:120]
+        stamp = datetime.utcnow().strftime('%Y%m%dT%H%M%S%f')
+        name = f'{stamp}_{method}_{slug}_{duration_ms:.0f}ms.{EXTENSIONS[mode]}'
+        return os.path.join(self.directory, name)
+
+    def save(self, write, method, path, duration_ms, mode):
+        os.makedirs(self.directory, exist_ok=True)
+        target = self.new_path(method, path, duration_ms, mode)
+        write(target)
+        self.rotate()
+        return os.path.basename(target)
+
+    def names(self):
+        if not os.path.isdir(self.directory):
+            return []
+        return sorted((name for name in os.listdir(self.directory) if FILENAME.match(name)),
+                      reverse=True)
+
+    def rotate(self):
+        with self._lock:
+            for name in self.names()[self.max_files:]:
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except FileNotFoundError:
+                    pass
+
+    def list(self):
+        profiles = []
+        for name in self.names():
+            stamp, method, path, duration_ms, extension = FILENAME.match(name).groups()
+            try:
+                size = os.path.getsize(os.path.join(self.directory, name))
+            except FileNotFoundError:
+                continue
+            profiles.append({
+                'name': name,
+                'created_at': datetime.strptime(stamp, '%Y%m%dT%H%M%S%f'),
+                'method': method,
+                'path': unquote(path.replace('!', '%')),
+                'duration_ms': int(duration_ms),
+                'format': extension,
+                'size': size
+            })
+        return profiles
+
+
+class StackSampler:
+    """
+    Samples one thread's stack every `interval` seconds from a helper thread
+    and counts the collapsed stacks
+    """
+
+    def __init__(self, thread_id, interval):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f'{code.co_name} ({os.path.basename(code.co_filename)}:{frame.f_lineno})')
+                frame = frame.f_back
+            if stack:
+                self.stacks[';'.join(reversed(stack))] += 1
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def write(self, path):
+        with open(path, 'w') as f:
+            for stack, count in self.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+
+class _ProfiledBody:
+    """
+    Passes a response body through chunk by chunk and finishes the
+    request's profile when the server closes it
+    """
+
+    def __init__(self, body, finish):
+        self.body = body
+        self._finish = finish
+        self._finished = False
+
+    def __iter__(self):
+        return iter(self.body)
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            if not self._finished:
+                self._finished = True
+                self._finish()
+
+
+class ProfilerMiddleware:
+    """
+    WSGI middleware that profiles selected requests, response body included
+    """
+
+    def __init__(self, wsgi_app, store, secret_key, sample_rate=0.0,
+                 default_mode='cprofile', sample_interval=0.005, token_max_age=3600):
+        self.wsgi_app = wsgi_app
+        self.store = store
+        self.serializer = _serializer(secret_key)
+        self.sample_rate = sample_rate
+        self.default_mode = default_mode
+        self.sample_interval = sample_interval
+        self.token_max_age = token_max_age
+
+    def _mode(self, environ):
+        token = environ.get(TOKEN_HEADER)
+        if token:
+            try:
+                data = self.serializer.loads(token, max_age=self.token_max_age)
+            except BadSignature:
+                return None
+            return data.get('mode') if data.get('mode') in MODES else self.default_mode
+        if self.sample_rate and random.random() < self.sample_rate:
+            return self.default_mode
+        return None
+
+    def __call__(self, environ, start_response):
+        mode = self._mode(environ)
+        if mode is None:
+            return self.wsgi_app(environ, start_response)
+
+        if mode == 'sampling':
+            profiler = StackSampler(threading.get_ident(), self.sample_interval)
+            profiler.start()
+        else:
+            profiler = cProfile.Profile()
+            profiler.enable()
+
+        started = time.perf_counter()
+
+        def finish():
+            duration_ms = (time.perf_counter() - started) * 1000
+            if mode == 'sampling':
+                profiler.stop()
+                write = profiler.write
+            else:
+                profiler.disable()
+                write = profiler.dump_stats
+            self.store.save(write, environ.get('REQUEST_METHOD', 'GET'),
+                            environ.get('PATH_INFO', '/'), duration_ms, mode)
+
+        try:
+            body = self.wsgi_app(environ, start_response)
+        except BaseException:
+            finish()
+            raise
+        # The profile runs until the server closes the body, so streamed
+        # responses count without being held in memory
+        return _ProfiledBody(body, finish)
+
+
+def install_profiler(app):
+    """
+    Wraps app.wsgi_app in the profiler and returns the profile store
+    """
+    store = ProfileStore(app.config['PROFILER_DIR'] or os.path.join(app.instance_path, 'profiles'),
+                         app.config['PROFILER_MAX_FILES'])
+    app.wsgi_app = ProfilerMiddleware(
+        app.wsgi_app, store, app.config['SECRET_KEY'],
+        sample_rate=app.config['PROFILER_SAMPLE_RATE'],
+        default_mode=app.config['PROFILER_MODE'],
+        sample_interval=app.config['PROFILER_SAMPLE_INTERVAL'],
+        token_max_age=app.config['PROFILER_TOKEN_MAX_AGE'])
+    app.extensions['profiler'] = store
+    return store
+
+
+# Creates the `flask profiler token` command
+@profiler_commands.command('token')
+@click.option('--mode', type=click.Choice(MODES), default='cprofile')
+def token_command(mode):
+    click.echo(make_token(current_app.config['SECRET_KEY'], mode))
@@ -0,0 +1,305 @@
+"""
+Admission control for the API.
+
+Two layers, both answering before a request gets near the database pool:
+
+- AdmissionControl is WSGI middleware capping how many /api/ requests a
+  worker process runs at once. A request that can't get a slot within
+  ADMISSION_QUEUE_TIMEOUT is shed with 503 and Retry-After. Event streams
+  are capped separately by SYNC_STREAM_MAX_CONCURRENT and shed at once.
+- enforce_rate_limit is a before_request hook charging each request's cost
+  against a token bucket per user (or per client IP when logged out). An
+  empty bucket answers 429 with Retry-After.
+
+Buckets live in process memory by default. Set RATELIMIT_STORAGE_URL to a
+redis:// URL to share them between workers and hosts, or assign any object
+with a take(key, cost, capacity, rate) -> (allowed, retry_after) method to
+app.extensions['ratelimit'].
+"""
+import math
+import threading
+import time
+from flask import current_app, jsonify, request
+from flask_login import current_user
+
+try:
+    import redis
+except ImportError:  # pragma: no cover - redis is only needed for a shared backend
+    redis = None
+
+# Token cost of endpoints that do much more work than a typical request;
+# everything else costs 1. Overridden or extended by RATELIMIT_COSTS.
+ENDPOINT_COSTS = {
+    'grocery_lists.add_recipe_ingredients_to_list': 10,
+    'users.export_account': 50,
+    'recipes.import_recipes_upload': 50,
+    'recipes.upload_recipe_image': 20,
+    'recipes.get_recipes_nutrition': 5,
+    # Pages show many images, and browsers cache each one for good
+    'images.get_image': 0,
+}
+
+# Memory backend: how many take() calls between sweeps of idle buckets
+SWEEP_EVERY = 10000
+
+# Answer to a request the concurrency cap sheds
+BUSY_BODY = b'{"error":"Server is busy, try again shortly"}'
+STREAMS_UNAVAILABLE_BODY = b'{"error":"Change streams are not served here, poll the changes endpoint"}'
+
+
+class MemoryBackend:
+    """
+    Token buckets in a dict, for a single worker process
+    """
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+        self._calls = 0
+
+    def take(self, key, cost, capacity, rate):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate)
+            allowed = tokens >= cost
+            if allowed:
+                tokens -= cost
+            self._buckets[key] = (tokens, now)
+
+            self._calls += 1
+            if self._calls % SWEEP_EVERY == 0:
+                self._sweep(now, capacity, rate)
+        return allowed, 0 if allowed else math.ceil((cost - tokens) / rate)
+
+    def _sweep(self, now, capacity, rate):
+        # A bucket that would have refilled completely is the same as no bucket
+        self._buckets = {key: (tokens, updated) for key, (tokens, updated) in self._buckets.items()
+                         if tokens + (now - updated) * rate < capacity}
+
+
+class RedisBackend:
+    """
+    Token buckets in Redis, shared by every worker using the same server.
+    Each take() is one atomic script call.
+    """
+
+    SCRIPT = """
+    local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local capacity = tonumber(ARGV[1])
+    local rate = tonumber(ARGV[2])
+    local cost = tonumber(ARGV[3])
+    local now = tonumber(ARGV[4])
+    local tokens = tonumber(bucket[1]) or capacity
+    local updated = tonumber(bucket[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate)
+    local allowed = 0
+    if tokens >= cost then
+        tokens = tokens - cost
+        allowed = 1
+    end
+    redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+    redis.call('EXPIRE', KEYS[1], math.ceil(capacity / rate) + 1)
+    return {allowed, tostring(tokens)}
+    """
+
+    def __init__(self, url, prefix='ratelimit:'):
+        if redis is None:
+            raise RuntimeError('RATELIMIT_STORAGE_URL needs the redis package installed')
+        self.client = redis.Redis.from_url(url)
+        self.prefix = prefix
+        self._script = self.client.register_script(self.SCRIPT)
+
+    def take(self, key, cost, capacity, rate):
+        allowed, tokens = self._script(keys=[self.prefix + key],
+                                       args=[capacity, rate, cost, time.time()])
+        if allowed:
+            return True, 0
+        return False, math.ceil((cost - float(tokens)) / rate)
+
+
+def create_backend(url):
+    if not url:
+        return MemoryBackend()
+    if url.startswith(('redis://', 'rediss://', 'unix://')):
+        return RedisBackend(url)
+    raise ValueError(f'unsupported RATELIMIT_STORAGE_URL: {url}')
+
+
+def client_key():
+    """
+    The bucket a request is charged to: the user when logged in, otherwise
+    the client address (looking past RATELIMIT_TRUSTED_PROXIES proxies)
+    """
+    if current_user.is_authenticated:
+        return f'user:{current_user.id}'
+    proxies = current_app.config['RATELIMIT_TRUSTED_PROXIES']
+    route = request.access_route
+    if proxies and len(route) >= proxies:
+        return f'ip:{route[-proxies]}'
+    return f'ip:{request.remote_addr}'
+
+
+def endpoint_cost(endpoint):
+    costs = current_app.config['RATELIMIT_COSTS']
+    return costs.get(endpoint, ENDPOINT_COSTS.get(endpoint, 1))
+
+
+def enforce_rate_limit():
+    """
+    Charges the request against its client's bucket, answering 429 when
+    the bucket is empty
+    """
+    if not current_app.config['RATELIMIT_ENABLED'] or not request.path.startswith('/api/') \
+            or request.method == 'OPTIONS':
+        return None
+
+    capacity = current_app.config['RATELIMIT_CAPACITY']
+    rate = current_app.config['RATELIMIT_REFILL_RATE']
+    cost = min(endpoint_cost(request.endpoint), capacity)
+    limiter = current_app.extensions['ratelimit']
+    allowed, retry_after = limiter.take(client_key(), cost, capacity, rate)
+    if allowed:
+        return None
+
+    response = jsonify({'error': 'Too many requests, slow down', 'retry_after': retry_after})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(max(retry_after, 1))
+    return response
+
+
+class _SlotReleasingBody:
+    """
+    Response body that gives back its admission slot once it has been sent
+    in full or closed, whichever happens first
+    """
+
+    def __init__(self, body, release):
+        self.body = body
+        self._release = release
+        self._released = False
+        self._lock = threading.Lock()
+
+    def release(self):
+        with self._lock:
+            if self._released:
+                return
+            self._released = True
+        self._release()
+
+    def __iter__(self):
+        try:
+            yield from self.body
+        finally:
+            self.release()
+
+    def close(self):
+        try:
+            if hasattr(self.body, 'close'):
+                self.body.close()
+        finally:
+            self.release()
+
+
+class AdmissionControl:
+    """
+    WSGI middleware limiting concurrent /api/ requests per process. The slot
+    is held until the response body has been sent. Long-lived event streams
+    hold a thread for their whole life, so they have a cap of their own,
+    answered with 503 straight away when full, and are refused outright by
+    a server running one thread per process.
+    """
+
+    def __init__(self, wsgi_app, max_concurrent, queue_timeout, retry_after=1, prefix='/api/',
+                 exempt_suffixes=('/stream',), max_streams=0):
+        self.wsgi_app = wsgi_app
+        self.exempt_suffixes = exempt_suffixes
+        self.max_concurrent = max_concurrent
+        self.max_streams = max_streams
+        self.queue_timeout = queue_timeout
+        self.retry_after = retry_after
+        self.prefix = prefix
+        self.shed = 0
+        self._slots = threading.BoundedSemaphore(max_concurrent) if max_concurrent > 0 else None
+        self._stream_slots = threading.BoundedSemaphore(max_streams) if max_streams > 0 else None
+
+    def applies_to(self, path):
+        return (self._slots is not None and path.startswith(self.prefix)
+                and not path.endswith(self.exempt_suffixes))
+
+    def is_stream(self, path):
+        return path.startswith(self.prefix) and path.endswith(self.exempt_suffixes)
+
+    def acquire(self):
+        """
+        Waits up to queue_timeout for a slot. False means the request is shed.
+        """
+        if self._slots.acquire(timeout=self.queue_timeout):
+            return True
+        self.shed += 1
+        return False
+
+    def release(self):
+        self._slots.release()
+
+    def acquire_stream(self):
+        """
+        Takes a stream slot without waiting. False means the stream is shed.
+        """
+        if self._stream_slots is None or self._stream_slots.acquire(blocking=False):
+            return True
+        self.shed += 1
+        return False
+
+    def release_stream(self):
+        if self._stream_slots is not None:
+            self._stream_slots.release()
+
+    def busy_headers(self):
+        return [
+            ('Content-Type', 'application/json'),
+            ('Content-Length', str(len(BUSY_BODY))),
+            ('Retry-After', str(self.retry_after))
+        ]
+
+    def __call__(self, environ, start_response):
+        path = environ.get('PATH_INFO', '')
+        if self.is_stream(path):
+            if not environ.get('wsgi.multithread'):
+                # The stream would hold the process's only thread
+                start_response('503 Service Unavailable', [
+                    ('Content-Type', 'application/json'),
+                    ('Content-Length', str(len(STREAMS_UNAVAILABLE_BODY)))])
+                return [STREAMS_UNAVAILABLE_BODY]
+            acquire, release = self.acquire_stream, self.release_stream
+        elif self.applies_to(path):
+            acquire, release = self.acquire, self.release
+        else:
+            return self.wsgi_app(environ, start_response)
+
+        if not acquire():
+            start_response('503 Service Unavailable', self.busy_headers())
+            return [BUSY_BODY]
+
+        try:
+            body = self.wsgi_app(environ, start_response)
+        except BaseException:
+            release()
+            raise
+        return _SlotReleasingBody(body, release)
+
+
+def install_admission_control(app):
+    """
+    Sets up the rate limiter backend and wraps app.wsgi_app in the
+    concurrency caps
+    """
+    app.extensions['ratelimit'] = create_backend(app.config['RATELIMIT_STORAGE_URL'])
+    app.before_request(enforce_rate_limit)
+    # Kept in extensions too, so app/asgi.py shares the same slots
+    app.wsgi_app = app.extensions['admission'] = AdmissionControl(
+        app.wsgi_app,
+        app.config['ADMISSION_MAX_CONCURRENT'],
+        app.config['ADMISSION_QUEUE_TIMEOUT'],
+        retry_after=app.config['ADMISSION_RETRY_AFTER'],
+        max_streams=app.config['SYNC_STREAM_MAX_CONCURRENT'])
@@ -0,0 +1,224 @@
+import click
+from flask import current_app
+from flask.cli import AppGroup
+from sqlalchemy import bindparam, event, literal, select, union_all, update
+from sqlalchemy.orm import Session, attributes, joinedload, undefer
+from app.models import db, Favourite, Like, Recipe, User
+from app.utils.jobs import job
+from app.utils.plans import run_plan
+
+# Recipes rebuilt per transaction by the rebuild command
+REBUILD_BATCH_SIZE = 500
+
+recipe_commands = AppGroup('recipes')
+
+
+def build_document(recipe):
+    """
+    Serializes a recipe exactly the way the API returns it
+    """
+    return current_app.json.dumps(recipe.to_dict(), separators=(',', ':'))
+
+
+def _store_documents(session, recipes):
+    """
+    Regenerates and saves the stored document for each recipe inside the
+    session's current transaction
+    """
+    if not recipes:
+        return
+    rows = []
+    for recipe in recipes:
+        if 'user' not in recipe.__dict__:
+            # The author isn't loaded on freshly inserted recipes
+            attributes.set_committed_value(recipe, 'user', session.get(User, recipe.user_id))
+        document = build_document(recipe)
+        attributes.set_committed_value(recipe, 'document', document)
+        rows.append({'recipe_id': recipe.id, 'document': document})
+
+    # Setting updated_at to itself stops its onupdate default from firing,
+    # which would leave the document describing a stale timestamp
+    table = Recipe.__table__
+    session.connection(mapper=Recipe.__mapper__).execute(
+        update(table)
+        .where(table.c.id == bindparam('recipe_id'))
+        .values(document=bindparam('document'), updated_at=table.c.updated_at),
+        rows)
+
+
+def store_document(session, recipe):
+    """
+    Saves the document of a recipe written with a Core statement, which the
+    flush listener below never sees
+    """
+    _store_documents(session, [recipe])
+
+
+@event.listens_for(Session, 'after_flush')
+def refresh_recipe_documents(session, flush_context):
+    """
+    Keeps each recipe's stored document in step with every flush that
+    creates or changes a recipe, or renames its author
+    """
+    changed = {}
+    for obj in list(session.new) + list(session.dirty):
+        if isinstance(obj, Recipe) and obj not in session.deleted:
+            if obj in session.new or session.is_modified(obj, include_collections=False):
+                changed[obj.id] = obj
+        elif isinstance(obj, User) and obj in session.dirty:
+            if attributes.get_history(obj, 'username').has_changes():
+                for recipe in session.query(Recipe).filter(Recipe.user_id == obj.id):
+                    changed[recipe.id] = recipe
+    _store_documents(session, list(changed.values()))
+
+
+def rebuild_documents(query, batch_size=REBUILD_BATCH_SIZE):
+    """
+    Rebuilds the stored documents for every recipe a query returns, committing
+    in batches by primary key. Returns how many were rebuilt.
+    """
+    total = 0
+    last_id = 0
+    while True:
+        recipes = (query.options(joinedload(Recipe.user))
+                   .filter(Recipe.id > last_id)
+                   .order_by(Recipe.id)
+                   .limit(batch_size)
+                   .all())
+        if not recipes:
+            return total
+        _store_documents(db.session, recipes)
+        db.session.commit()
+        total += len(recipes)
+        last_id = recipes[-1].id
+
+
+@job('recipes.rebuild-documents')
+def rebuild_documents_job(payload):
+    """
+    Background rebuild of the documents for payload['ids'], or of every
+    recipe without one when no ids are given
+    """
+    query = Recipe.query
+    if payload and payload.get('ids'):
+        query = query.filter(Recipe.id.in_(payload['ids']))
+    else:
+        query = query.filter(Recipe.document.is_(None))
+    rebuild_documents(query)
+
+
+def documents_plan(statement, viewer=None):
+    """
+    Plan (see app/utils/plans.py) that runs a select of (Recipe.id,
+    Recipe.document) and returns the stored JSON for each row in order,
+    serializing on the fly any recipe that doesn't have a document yet.
+    Pass the current user as `viewer` to add liked_by_me and
+    favourited_by_me to each document.
+    """
+    rows = yield statement
+    missing = [row.id for row in rows if row.document is None]
+    built = {}
+    if missing:
+        recipes = yield (select(Recipe).options(joinedload(Recipe.user))
+                         .where(Recipe.id.in_(missing)))
+        built = {recipe.id: build_document(recipe) for recipe, in recipes}
+    documents = [row.document if row.document is not None else built[row.id] for row in rows]
+    if viewer is None or not viewer.is_authenticated or not rows:
+        # Anonymous readers get the stored documents untouched, no query
+        return documents
+    recipe_ids = [row.id for row in rows]
+    state = yield viewer_state_query(viewer.id, recipe_ids)
+    return annotate_viewer_state(documents, recipe_ids, state)
+
+
+def fetch_documents(statement, viewer=None):
+    """
+    documents_plan() run on the Flask-SQLAlchemy session
+    """
+    return run_plan(documents_plan(statement, viewer))
+
+
+def viewer_state_query(user_id, recipe_ids):
+    """
+    Finds which of `recipe_ids` a user has liked and has favourited, as
+    (recipe_id, kind) rows, in one query over the (user_id, recipe_id)
+    unique indexes
+    """
+    likes, favourites = Like.__table__, Favourite.__table__
+    return union_all(
+        select(likes.c.recipe_id, literal('like').label('kind'))
+        .where(likes.c.user_id == user_id, likes.c.recipe_id.in_(recipe_ids)),
+        select(favourites.c.recipe_id, literal('favourite').label('kind'))
+        .where(favourites.c.user_id == user_id, favourites.c.recipe_id.in_(recipe_ids)))
+
+
+_VIEWER_FIELDS = {
+    (liked, favourited): ',"liked_by_me":%s,"favourited_by_me":%s}' % (
+        'true' if liked else 'false', 'true' if favourited else 'false')
+    for liked in (False, True) for favourited in (False, True)
+}
+
+
+def annotate_viewer_state(documents, recipe_ids, state):
+    """
+    Adds liked_by_me and favourited_by_me, from the rows of
+    viewer_state_query(), to serialized recipe documents without parsing
+    them again
+    """
+    liked = {row.recipe_id for row in state if row.kind == 'like'}
+    favourited = {row.recipe_id for row in state if row.kind == 'favourite'}
+    return [document[:-1] + _VIEWER_FIELDS[recipe_id in liked, recipe_id in favourited]
+            for document, recipe_id in zip(documents, recipe_ids)]
+
+
+def document_query():
+    return select(Recipe.id, Recipe.document)
+
+
+def document_response(body, status=200):
+    return current_app.response_class(body, status=status, mimetype='application/json')
+
+
+def splice_documents(key, documents, **fields):
+    """
+    Builds a JSON object whose `key` is an array of already serialized recipe
+    documents, without parsing them again
+    """
+    rest = current_app.json.dumps(fields, separators=(',', ':'))
+    head = '{"%s":[%s]' % (key, ','.join(documents))
+    return head + ('}' if rest == '{}' else ',' + rest[1:])
+
+
+# Creates the `flask recipes rebuild-documents` command
+@recipe_commands.command('rebuild-documents')
+@click.option('--missing-only', is_flag=True, help='Only build recipes without a document.')
+def rebuild_documents_command(missing_only):
+    query = Recipe.query
+    if missing_only:
+        query = query.filter(Recipe.document.is_(None))
+    click.echo(f'Rebuilt {rebuild_documents(query)} recipe documents')
+
+
+# Creates the `flask recipes check-documents` command
+@recipe_commands.command('check-documents')
+@click.option('--fix', is_flag=True, help='Rebuild any document that is stale or missing.')
+def check_documents_command(fix):
+    stale = []
+    checked = 0
+    for recipe in (Recipe.query.options(joinedload(Recipe.user), undefer(Recipe.document))
+                   .order_by(Recipe.id).yield_per(REBUILD_BATCH_SIZE)):
+        checked += 1
+        if recipe.document != build_document(recipe):
+            stale.append(recipe.id)
+
+    click.echo(f'Checked {checked} recipes, {len(stale)} stale or missing')
+    if stale:
+        click.echo('Stale ids: ' + ', '.join(str(recipe_id) for recipe_id in stale[:50])
+                   + (' ...' if len(stale) > 50 else ''))
+        if fix:
+            for start in range(0, len(stale), REBUILD_BATCH_SIZE):
+                ids = stale[start:start + REBUILD_BATCH_SIZE]
+                rebuild_documents(Recipe.query.filter(Recipe.id.in_(ids)))
+            click.echo(f'Rebuilt {len(stale)} recipe documents')
+        else:
+            raise SystemExit(1)
@@ -0,0 +1,184 @@
+import csv
+import json
+import time
+from itertools import islice
+from sqlalchemy import insert
+from sqlalchemy.exc import SQLAlchemyError
+from app.models import db, Recipe
+from .validation import validate_recipe_data
+from .recipe_documents import rebuild_documents
+from .autocomplete import ingredient_index
+from .jobs import enqueue
+
+# Rows validated and inserted per transaction
+CHUNK_SIZE = 500
+
+# Keep the error report bounded no matter how broken the upload is
+MAX_REPORTED_ERRORS = 500
+
+
+class ImportReport:
+    def __init__(self):
+        self.rows = 0
+        self.inserted = 0
+        self.failed = 0
+        self.errors = []
+        self.started = time.perf_counter()
+
+    def error(self, row, message):
+        self.failed += 1
+        if len(self.errors) < MAX_REPORTED_ERRORS:
+            self.errors.append({'row': row, 'error': message})
+
+    def to_dict(self):
+        elapsed = time.perf_counter() - self.started
+        return {
+            'rows': self.rows,
+            'inserted': self.inserted,
+            'failed': self.failed,
+            'errors': self.errors,
+            'errors_truncated': self.failed > len(self.errors),
+            'seconds': round(elapsed, 3),
+            'rows_per_second': round(self.rows / elapsed, 1) if elapsed else None
+        }
+
+
+def detect_format(filename, content_type):
+    """
+    Works out whether an upload is NDJSON or CSV from its name or content type
+    """
+    name = (filename or '').lower()
+    content_type = (content_type or '').lower()
+    if name.endswith('.csv') or 'csv' in content_type:
+        return 'csv'
+    if name.endswith(('.ndjson', '.jsonl')) or 'ndjson' in content_type or 'json' in content_type:
+        return 'ndjson'
+    return None
+
+
+def parse_ndjson(stream):
+    """
+    Yields (row_number, data) for every non-blank line, one line at a time.
+    Lines that are not valid JSON yield a ValueError instead of data.
+    """
+    for row_number, line in enumerate(stream, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield row_number, json.loads(line)
+        except ValueError as e:
+            yield row_number, ValueError(f'invalid JSON: {e}')
+
+
+def parse_csv(stream):
+    """
+    Yields (row_number, data) for every CSV record. The ingredients column
+    may hold a JSON array or a semicolon separated list.
+    """
+    reader = csv.DictReader(stream)
+    for row_number, record in enumerate(reader, start=2):
+        ingredients = (record.get('ingredients') or '').strip()
+        if ingredients.startswith('['):
+            try:
+                ingredients = json.loads(ingredients)
+            except ValueError:
+                yield row_number, ValueError('ingredients is not a valid JSON array')
+                continue
+        else:
+            ingredients = [part.strip() for part in ingredients.split(';') if part.strip()]
+        record['ingredients'] = ingredients
+        yield row_number, record
+
+
+def _chunks(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _row_values(data, user_id):
+    return {
+        'title': data['title'],
+        'description': data.get('description') or '',
+        'ingredients': data['ingredients'],
+        'instructions': data['instructions'],
+        'image_url': data.get('image_url') or '',
+        'user_id': user_id
+    }
+
+
+def _insert_chunk(rows, report):
+    """
+    Inserts a validated chunk with one executemany inside a savepoint. If the
+    database rejects the chunk, each row is retried in its own savepoint so
+    only the offending rows are reported. Returns the inserted rows' values.
+    """
+    if not rows:
+        return []
+    statement = insert(Recipe.__table__)
+    try:
+        with db.session.begin_nested():
+            db.session.execute(statement, [values for _, values in rows])
+        report.inserted += len(rows)
+        return [values for _, values in rows]
+    except SQLAlchemyError:
+        pass
+
+    inserted = []
+    for row_number, values in rows:
+        try:
+            with db.session.begin_nested():
+                db.session.execute(statement, values)
+            report.inserted += 1
+            inserted.append(values)
+        except SQLAlchemyError as e:
+            report.error(row_number, f'database rejected row: {e.__class__.__name__}')
+    return inserted
+
+
+def import_recipes(records, user_id, chunk_size=CHUNK_SIZE):
+    """
+    Validates and inserts parsed (row_number, data) records for a user in
+    chunks, committing after every chunk. Invalid rows are reported and
+    skipped without aborting the rest of the upload.
+    """
+    report = ImportReport()
+    for chunk in _chunks(records, chunk_size):
+        valid = []
+        for row_number, data in chunk:
+            report.rows += 1
+            if isinstance(data, Exception):
+                report.error(row_number, str(data))
+                continue
+            error = validate_recipe_data(data)
+            if error:
+                report.error(row_number, error)
+                continue
+            valid.append((row_number, _row_values(data, user_id)))
+        inserted = _insert_chunk(valid, report)
+        db.session.commit()
+        ingredient_index.update(added=[name for values in inserted
+                                       for name in values['ingredients']])
+
+    # Core inserts skip the ORM flush hooks, so build the stored documents
+    # for the imported recipes in one pass
+    if report.inserted:
+        rebuild_documents(Recipe.query.filter(Recipe.user_id == user_id,
+                                              Recipe.document.is_(None)))
+        # and put the newest of them in followers' feeds
+        enqueue('feed.backfill-followers', {'author_id': user_id})
+        db.session.commit()
+    return report
+
+
+def iter_text_lines(binary_stream):
+    """
+    Decodes a binary upload one line at a time so the whole body is never
+    held in memory
+    """
+    for line in binary_stream:
+        yield line.decode('utf-8', errors='replace')
@@ -0,0 +1,70 @@
+import random
+import time
+from flask import current_app, g, has_app_context, request, session
+from flask_sqlalchemy.session import Session
+
+# Bind keys in SQLALCHEMY_BINDS that start with this are read replicas
+REPLICA_BIND_PREFIX = 'replica_'
+
+WRITE_METHODS = {'POST', 'PUT', 'PATCH', 'DELETE'}
+
+
+def replica_binds(urls):
+    """
+    Builds the SQLALCHEMY_BINDS entries for a comma separated list of
+    replica database URLs
+    """
+    urls = [url.strip().replace('postgres://', 'postgresql://')
+            for url in (urls or '').split(',') if url.strip()]
+    return {f'{REPLICA_BIND_PREFIX}{index}': url for index, url in enumerate(urls)}
+
+
+def _replica_engines(db):
+    return [engine for key, engine in db.engines.items()
+            if key and key.startswith(REPLICA_BIND_PREFIX)]
+
+
+class RoutingSession(Session):
+    """
+    Sends reads to a replica when the current request opted in with
+    route_reads_to_replica. Flushes and INSERT/UPDATE/DELETE statements
+    always go to the primary.
+    """
+
+    def get_bind(self, mapper=None, clause=None, bind=None, **kwargs):
+        if (bind is None
+                and not self._flushing
+                and not getattr(clause, 'is_dml', False)
+                and has_app_context()
+                and g.get('read_replica')):
+            engines = _replica_engines(self._db)
+            if engines:
+                return random.choice(engines)
+        return super().get_bind(mapper=mapper, clause=clause, bind=bind, **kwargs)
+
+
+def recently_wrote():
+    return session.get('_primary_until', 0) > time.time()
+
+
+def route_reads_to_replica():
+    """
+    before_request hook for blueprints whose GET handlers can read from a
+    replica. A user who wrote in the last REPLICA_STICKY_SECONDS keeps
+    reading from the primary so they always see their own changes.
+    """
+    if request.method == 'GET' and not recently_wrote():
+        g.read_replica = True
+
+
+def mark_recent_write(response):
+    """
+    after_request hook that pins the client to the primary for a short window
+    after any successful write
+    """
+    if (request.method in WRITE_METHODS
+            and response.status_code < 400
+            and not g.get('read_only_request')
+            and current_app.config.get('SQLALCHEMY_BINDS')):
+        session['_primary_until'] = time.time() + current_app.config['REPLICA_STICKY_SECONDS']
+    return response
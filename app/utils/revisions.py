@@ -0,0 +1,197 @@
+"""
+Recipe revision history.
+
+Every edit to a recipe's content bumps Recipe.revision and saves that
+revision. Most revisions are stored as a zlib-compressed line diff against
+the one before. Every SNAPSHOT_EVERY-th revision is a compressed full copy,
+and so is any revision whose diff would be no smaller than one. Rebuilding
+revision n starts from the snapshot at or below it, so it reads and applies
+at most SNAPSHOT_EVERY rows however long the history grows.
+
+Revision 0 is the recipe as it was before its first edit. It is saved along
+with revision 1, so recipes that were never edited have no rows at all.
+
+Edits made through the ORM are recorded by the before_flush listener below.
+Writes that bypass it (the UPDATE ... RETURNING in app/utils/writes.py)
+call revision_rows() and save_revisions() themselves.
+"""
+import difflib
+import json
+import zlib
+from datetime import datetime
+from sqlalchemy import event, insert, select
+from sqlalchemy.orm import Session, attributes
+from app.models import db, Recipe, RecipeRevision
+
+# Columns whose changes make a new revision
+FIELDS = ('title', 'description', 'ingredients', 'instructions', 'image_url', 'image_key')
+
+SNAPSHOT_EVERY = 16
+
+
+def recipe_content(recipe):
+    return {field: getattr(recipe, field) for field in FIELDS}
+
+
+def pack(value):
+    return zlib.compress(json.dumps(value, separators=(',', ':')).encode('utf-8'), 9)
+
+
+def unpack(data):
+    return json.loads(zlib.decompress(data))
+
+
+def _pieces(value):
+    # Texts are diffed by line, lists (ingredients) by item
+    return value.splitlines(keepends=True) if isinstance(value, str) else value
+
+
+def diff_value(old, new):
+    """
+    Ops turning `old` into `new`: n > 0 copies n pieces, n < 0 skips n
+    pieces and a list inserts its pieces. Anything that isn't text or a
+    list is stored whole as {"set": new}.
+    """
+    if not isinstance(old, (str, list)) or type(old) is not type(new):
+        return {'set': new}
+    old_pieces, new_pieces = _pieces(old), _pieces(new)
+    ops = []
+    matcher = difflib.SequenceMatcher(None, old_pieces, new_pieces, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append(i2 - i1)
+            continue
+        if i2 > i1:
+            ops.append(i1 - i2)
+        if j2 > j1:
+            ops.append(new_pieces[j1:j2])
+    return ops
+
+
+def patch_value(old, ops):
+    if isinstance(ops, dict):
+        return ops['set']
+    old_pieces = _pieces(old)
+    pieces = []
+    position = 0
+    for op in ops:
+        if isinstance(op, list):
+            pieces.extend(op)
+        elif op > 0:
+            pieces.extend(old_pieces[position:position + op])
+            position += op
+        else:
+            position -= op
+    return ''.join(pieces) if isinstance(old, str) else pieces
+
+
+def diff(old, new):
+    return {field: diff_value(old.get(field), new.get(field))
+            for field in FIELDS if old.get(field) != new.get(field)}
+
+
+def patch(content, delta):
+    return {**content, **{field: patch_value(content.get(field), ops) for field, ops in delta.items()}}
+
+
+def revision_rows(recipe_id, number, previous, current, previous_at=None, created_at=None):
+    """
+    Rows saving revision `number` with content `current`, where `previous`
+    is the content of the revision before it
+    """
+    created_at = created_at or datetime.utcnow()
+    rows = []
+    if number == 1:
+        rows.append({'recipe_id': recipe_id, 'number': 0, 'snapshot': True,
+                     'data': pack(previous), 'created_at': previous_at or created_at})
+
+    data = pack(current)
+    snapshot = number % SNAPSHOT_EVERY == 0
+    if not snapshot:
+        delta = pack(diff(previous, current))
+        snapshot = len(delta) >= len(data)
+        if not snapshot:
+            data = delta
+    rows.append({'recipe_id': recipe_id, 'number': number, 'snapshot': snapshot,
+                 'data': data, 'created_at': created_at})
+    return rows
+
+
+def save_revisions(session, rows):
+    if rows:
+        session.connection(mapper=RecipeRevision.__mapper__).execute(
+            insert(RecipeRevision.__table__), rows)
+
+
+@event.listens_for(Session, 'before_flush')
+def record_recipe_revisions(session, flush_context, instances):
+    """
+    Bumps the revision of each recipe whose content changes in this flush
+    and saves the new revision
+    """
+    rows = []
+    for recipe in session.dirty:
+        if not isinstance(recipe, Recipe) or recipe in session.deleted:
+            continue
+        previous = {}
+        changed = False
+        for field in FIELDS:
+            history = attributes.get_history(recipe, field)
+            if history.deleted:
+                previous[field] = history.deleted[0]
+                changed = changed or history.added != history.deleted
+            else:
+                previous[field] = getattr(recipe, field)
+        if not changed:
+            continue
+
+        recipe.revision = (recipe.revision or 0) + 1
+        previous_at = attributes.get_history(recipe, 'updated_at')
+        rows.extend(revision_rows(
+            recipe.id, recipe.revision, previous, recipe_content(recipe),
+            previous_at=(previous_at.deleted or previous_at.unchanged or [None])[0],
+            created_at=previous_at.added[0] if previous_at.added else None))
+    save_revisions(session, rows)
+
+
+def list_revisions(recipe):
+    """
+    Number, date, storage kind and stored size of each of a recipe's
+    revisions, newest first
+    """
+    table = RecipeRevision.__table__
+    rows = db.session.execute(
+        select(table.c.number, table.c.snapshot, table.c.created_at, db.func.length(table.c.data).label('size'))
+        .where(table.c.recipe_id == recipe.id)
+        .order_by(table.c.number.desc())).all()
+    if not rows:
+        return [{'number': recipe.revision, 'created_at': recipe.updated_at, 'snapshot': None, 'size': None}]
+    return [dict(row._mapping) for row in rows]
+
+
+def rebuild_revision(recipe, number):
+    """
+    The content and date of revision `number`, or None if it doesn't exist.
+    Reads the nearest snapshot and the diffs after it, at most
+    SNAPSHOT_EVERY rows.
+    """
+    if number < 0 or number > recipe.revision:
+        return None
+
+    table = RecipeRevision.__table__
+    rows = db.session.execute(
+        select(table.c.number, table.c.snapshot, table.c.data, table.c.created_at)
+        .where(table.c.recipe_id == recipe.id,
+               table.c.number.between(number - number % SNAPSHOT_EVERY, number))
+        .order_by(table.c.number)).all()
+    if not rows and number == recipe.revision:
+        # Never edited, so the only revision is the recipe itself
+        return recipe_content(recipe), recipe.updated_at
+    if not rows or rows[-1].number != number:
+        return None
+
+    start = max(index for index, row in enumerate(rows) if row.snapshot)
+    content = unpack(rows[start].data)
+    for row in rows[start + 1:]:
+        content = patch(content, unpack(row.data))
+    return content, rows[-1].created_at
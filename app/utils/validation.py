@@ -0,0 +1,19 @@
+def validate_recipe_data(data):
+    """
+    Checks a recipe payload the same way create_recipe does and returns an
+    error message, or None when the payload is valid
+    """
+    if not isinstance(data, dict):
+        return 'recipe must be an object'
+
+    # Validate required fields
+    required_fields = ['title', 'ingredients', 'instructions']
+    for field in required_fields:
+        if not data.get(field):
+            return f'{field} is required'
+
+    # Validate ingredients is a list
+    if not isinstance(data.get('ingredients'), list):
+        return 'ingredients must be an array'
+
+    return None
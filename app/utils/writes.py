@@ -0,0 +1,241 @@
+"""
+Round-trip-minimal writes for the recipe and grocery list handlers.
+
+On Postgres each write is a single UPDATE/INSERT ... RETURNING that also
+checks ownership and, for grocery lists, moves the list version in a CTE
+(see app/utils/list_sync.py). The handler serializes its response from the
+returned row, so nothing is read back after the commit. SQLAlchemy 1.4 has
+no RETURNING for SQLite; there the same functions go through the ORM and
+handlers still serialize before committing.
+
+Statements per request on Postgres, besides the session's user lookup:
+
+    create_recipe        INSERT ... RETURNING, timeline fan-out
+                         INSERT ... SELECT, document UPDATE, COMMIT
+    update_recipe        UPDATE ... RETURNING, document UPDATE, revision
+                         INSERT (only when the content changed), COMMIT
+                         (plus a jobs INSERT when an image_url replaces
+                         an uploaded image)
+    create_grocery_list, update_grocery_list, add_item_to_list,
+    update_grocery_item  one INSERT/WITH ... RETURNING, COMMIT
+
+These are the accepted targets. The recipe writes stay at three statements
+because the stored document is serialized in Python from the written row
+(and the author), and the revision row is a diff worked out in Python
+against the returned old content, so neither can be folded into the first
+statement's CTE. bench/write_statements.py checks these counts and exits
+non-zero when a handler sends more or fewer statements.
+
+Like owned() in app/utils/ownership.py, each function returns (result,
+found): result is None when the row doesn't exist (found is False) or
+isn't the user's (found is True).
+"""
+from datetime import datetime
+from sqlalchemy import JSON, case, cast, false, insert, literal, or_, select, update
+from sqlalchemy.dialects.postgresql import JSONB
+from sqlalchemy.orm import attributes
+from app.models import db, Recipe, GroceryList, GroceryListItem
+from app.utils.ownership import owned
+from app.utils.recipe_documents import store_document
+from app.utils.revisions import FIELDS, recipe_content, revision_rows, save_revisions
+
+
+def returning_supported():
+    return db.session.get_bind().dialect.full_returning
+
+
+def _exists(model, id):
+    return db.session.execute(select(model.id).where(model.id == id)).first() is not None
+
+
+def detached(model, values, **related):
+    """
+    Builds an instance of `model` outside the session from written column
+    values, with related objects set without loading or cascading, so its
+    to_dict() describes the row as written
+    """
+    instance = model()
+    columns = model.__table__.c
+    for key, value in values.items():
+        if key in columns:
+            setattr(instance, key, value)
+    for key, value in related.items():
+        attributes.set_committed_value(instance, key, value)
+    return instance
+
+
+def _columns(table, exclude=()):
+    return [column for column in table.c if column.name not in exclude]
+
+
+def _changed(table, values):
+    """
+    SQL condition that's true when any revisioned field in `values` differs
+    from the row being updated. JSON has no equality operator on Postgres,
+    so JSON columns are compared as jsonb.
+    """
+    conditions = []
+    for field in FIELDS:
+        if field not in values:
+            continue
+        column = table.c[field]
+        value = literal(values[field], column.type)
+        if isinstance(column.type, JSON):
+            column, value = cast(column, JSONB), cast(value, JSONB)
+        conditions.append(column.is_distinct_from(value))
+    return or_(*conditions) if conditions else false()
+
+
+def update_recipe(recipe_id, user, values):
+    """
+    Updates a recipe the user owns. The result is (recipe, its content
+    before the update).
+    """
+    if not returning_supported():
+        recipe, found = owned(Recipe, recipe_id, user)
+        if recipe is None:
+            return None, found
+        previous = recipe_content(recipe)
+        for key, value in values.items():
+            setattr(recipe, key, value)
+        db.session.flush()
+        return (recipe, previous), True
+
+    # Joining the row to itself returns its values from before the update
+    table = Recipe.__table__
+    old = table.alias('old')
+    # Saving a recipe unchanged leaves its revision alone, as the flush
+    # listener does on the ORM path
+    values = dict(values, revision=case((_changed(table, values), table.c.revision + 1),
+                                        else_=table.c.revision))
+    row = db.session.execute(
+        update(table)
+        .where(table.c.id == recipe_id, table.c.user_id == user.id, old.c.id == table.c.id)
+        .values(**values)
+        .returning(*_columns(table, exclude=('document', 'nutrition')),
+                   *[old.c[field].label(f'old_{field}') for field in FIELDS],
+                   old.c.updated_at.label('old_updated_at'))
+    ).first()
+    if row is None:
+        return None, _exists(Recipe, recipe_id)
+    recipe = detached(Recipe, row._mapping, user=user)
+    previous = {field: row._mapping[f'old_{field}'] for field in FIELDS}
+    store_document(db.session, recipe)
+    if recipe_content(recipe) != previous:
+        save_revisions(db.session, revision_rows(
+            recipe.id, recipe.revision, previous, recipe_content(recipe),
+            previous_at=row.old_updated_at, created_at=row.updated_at))
+    return (recipe, previous), True
+
+
+def _bump_list_version(list_id, user_id, now):
+    lists = GroceryList.__table__
+    return (update(lists)
+            .where(lists.c.id == list_id, lists.c.user_id == user_id)
+            .values(version=lists.c.version + 1, updated_at=now)
+            .returning(lists.c.id, lists.c.version)
+            .cte('bumped'))
+
+
+def update_grocery_list(list_id, user, values):
+    """
+    Updates a grocery list the user owns and returns it with its items
+    """
+    now = datetime.utcnow()
+    if not returning_supported():
+        grocery_list, found = owned(GroceryList, list_id, user)
+        if grocery_list is None:
+            return None, found
+        for key, value in values.items():
+            setattr(grocery_list, key, value)
+        grocery_list.updated_at = now
+        db.session.flush()
+        return grocery_list, True
+
+    lists = GroceryList.__table__
+    items = GroceryListItem.__table__
+    updated = (update(lists)
+               .where(lists.c.id == list_id, lists.c.user_id == user.id)
+               .values(version=lists.c.version + 1, updated_at=now, **values)
+               .returning(*lists.c)
+               .cte('updated'))
+    rows = db.session.execute(
+        select(*[updated.c[column.name].label(f'list_{column.name}') for column in lists.c],
+               *[column.label(f'item_{column.name}') for column in items.c])
+        .select_from(updated.outerjoin(items, items.c.grocery_list_id == updated.c.id))
+        .order_by(items.c.id)
+    ).all()
+    if not rows:
+        return None, _exists(GroceryList, list_id)
+
+    def prefixed(row, prefix):
+        return {key[len(prefix):]: value for key, value in row._mapping.items() if key.startswith(prefix)}
+
+    list_items = [detached(GroceryListItem, prefixed(row, 'item_'))
+                  for row in rows if row.item_id is not None]
+    return detached(GroceryList, prefixed(rows[0], 'list_'), user=user, items=list_items), True
+
+
+def add_grocery_item(list_id, user, values):
+    """
+    Adds an item to a grocery list the user owns
+    """
+    now = datetime.utcnow()
+    if not returning_supported():
+        grocery_list, found = owned(GroceryList, list_id, user)
+        if grocery_list is None:
+            return None, found
+        item = GroceryListItem(grocery_list_id=list_id, **values)
+        db.session.add(item)
+        db.session.flush()
+        return item, True
+
+    items = GroceryListItem.__table__
+    bumped = _bump_list_version(list_id, user.id, now)
+    names = list(values)
+    row = db.session.execute(
+        insert(items)
+        .from_select(
+            ['grocery_list_id', *names, 'created_at', 'updated_at', 'created_version', 'version'],
+            select(bumped.c.id,
+                   *[literal(values[name], items.c[name].type) for name in names],
+                   literal(now, items.c.created_at.type), literal(now, items.c.updated_at.type),
+                   bumped.c.version, bumped.c.version))
+        .returning(*items.c)
+        .add_cte(bumped)
+    ).first()
+    if row is None:
+        return None, _exists(GroceryList, list_id)
+    return detached(GroceryListItem, row._mapping), True
+
+
+def update_grocery_item(item_id, user, values):
+    """
+    Updates an item on one of the user's grocery lists. The result is
+    (item, old item name).
+    """
+    now = datetime.utcnow()
+    if not returning_supported():
+        item, found = owned(GroceryListItem, item_id, user)
+        if item is None:
+            return None, found
+        old_name = item.item_name
+        for key, value in values.items():
+            setattr(item, key, value)
+        db.session.flush()
+        return (item, old_name), True
+
+    items = GroceryListItem.__table__
+    old = items.alias('old')
+    list_id = select(items.c.grocery_list_id).where(items.c.id == item_id).scalar_subquery()
+    bumped = _bump_list_version(list_id, user.id, now)
+    row = db.session.execute(
+        update(items)
+        .where(items.c.id == item_id, items.c.grocery_list_id == bumped.c.id, old.c.id == items.c.id)
+        .values(version=bumped.c.version, updated_at=now, **values)
+        .returning(*items.c, old.c.item_name.label('old_item_name'))
+        .add_cte(bumped)
+    ).first()
+    if row is None:
+        return None, _exists(GroceryListItem, item_id)
+    return (detached(GroceryListItem, row._mapping), row.old_item_name), True
@@ -0,0 +1,36 @@
+"""
+Shared setup for the benchmark scripts: points the app at a throwaway
+SQLite database (unless DATABASE_URL is already set) and creates the schema.
+"""
+import logging
+import os
+import sys
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+if 'DATABASE_URL' not in os.environ:
+    _db_file = os.path.join(tempfile.mkdtemp(), 'bench.db')
+    os.environ['DATABASE_URL'] = f'sqlite:///{_db_file}'
+os.environ.setdefault('SECRET_KEY', 'bench')
+# Benchmarks send far more requests than the rate limit allows a user
+os.environ.setdefault('RATELIMIT_ENABLED', 'false')
+
+from app import app  # noqa: E402
+from app.models import db, User  # noqa: E402
+
+logging.getLogger('sqlalchemy.engine.Engine').disabled = True
+
+
+def setup_database():
+    """
+    Creates all tables and a benchmark user, returning the user's id
+    """
+    with app.app_context():
+        db.create_all()
+        user = User.query.filter_by(username='bench').first()
+        if not user:
+            user = User(username='bench', email='bench@aa.io', password='password')
+            db.session.add(user)
+            db.session.commit()
+        return user.id
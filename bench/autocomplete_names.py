@@ -0,0 +1,55 @@
+"""
+Checks that ingredient autocomplete indexes names the way it matches
+queries: recipe lines with quantities and units, odd spacing and case all
+count towards the same suggestion, whether they were indexed at startup or
+added by a request afterwards. Exits non-zero on a wrong suggestion.
+
+    python bench/autocomplete_names.py
+"""
+import sys
+from _setup import app, setup_database
+from app.models import db, Recipe
+from app.utils.autocomplete import build_ingredient_index, ingredient_index
+
+TITLES = ('Bench dough', 'Bench bread')
+
+# (prefix, expected first suggestion and its count)
+EXPECTED = [
+    ('all', ('All-Purpose Flour', 4)),
+    ('2 cups ALL', ('All-Purpose Flour', 4)),
+    ('  all-purpose  ', ('All-Purpose Flour', 4)),
+    ('gar', ('garlic cloves', 2)),
+    ('sea s', ('Sea Salt', 2)),
+    ('7u', ('7up', 1)),
+]
+
+
+def main():
+    user_id = setup_database()
+    with app.app_context():
+        # Left over from an earlier run against the same database
+        Recipe.query.filter(Recipe.user_id == user_id, Recipe.title.in_(TITLES)).delete(synchronize_session=False)
+        db.session.add(Recipe(title='Bench dough', instructions='Mix.', user_id=user_id, ingredients=[
+            '1 1/2 cups All-Purpose Flour', '½ tsp Sea Salt', '3 garlic cloves', '7up']))
+        db.session.commit()
+    build_ingredient_index(app)
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+    response = client.post('/api/recipes/', json={'title': 'Bench bread', 'instructions': 'Bake.', 'ingredients': [
+        '2 Tbsp. of all-purpose  flour', 'all-purpose flour', '500 g All-Purpose Flour', 'a pinch of sea salt',
+        '2 garlic cloves']})
+    assert response.status_code == 201, response.get_data(as_text=True)
+
+    failures = 0
+    for prefix, expected in EXPECTED:
+        suggestions = ingredient_index.suggest(prefix, 1)
+        ok = bool(suggestions) and (suggestions[0][0].lower(), suggestions[0][1]) == (expected[0].lower(), expected[1])
+        failures += not ok
+        print(f'{prefix!r:18} {suggestions[:1]}' + ('' if ok else f'   expected {expected}'))
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
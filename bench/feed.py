@@ -0,0 +1,121 @@
+"""
+Benchmarks the home feed on a synthetic follower graph: a few very popular
+authors that most users follow, and many ordinary ones followed by a few
+each.
+
+Reports the cost of posting a recipe, how many timeline rows fan-out
+stores compared with fanning out to everyone, and feed page latency for
+the hybrid feed against pure merge-on-read (every followed author read
+from recipes).
+
+    python bench/feed.py [users] [follows per user] [recipes] [fan-out limit]
+"""
+import random
+import statistics
+import sys
+import time
+from sqlalchemy import func, insert, select, update
+from _setup import app, setup_database
+from app.models import db, Follow, Recipe, TimelineEntry, User
+from app.utils.feed import _author_ids, feed_page, merge_pages, merged_authors
+
+CELEBRITIES = 5
+
+
+def build_graph(rng, users, follows_per_user):
+    user_ids = list(range(1, users + 1))
+    db.session.execute(insert(User.__table__), [
+        {'id': user_id, 'username': f'cook{user_id}', 'email': f'cook{user_id}@bench.io',
+         'hashed_password': 'x'} for user_id in user_ids])
+
+    celebrities = user_ids[:CELEBRITIES]
+    rows = set()
+    for follower in user_ids:
+        # Most users follow most of the celebrities
+        for celebrity in celebrities:
+            if celebrity != follower and rng.random() < 0.8:
+                rows.add((follower, celebrity))
+        for followed in rng.sample(user_ids, follows_per_user):
+            if followed != follower:
+                rows.add((follower, followed))
+    db.session.execute(insert(Follow.__table__),
+                       [{'follower_id': a, 'followed_id': b} for a, b in rows])
+
+    counts = (select(func.count()).where(Follow.followed_id == User.id).scalar_subquery())
+    db.session.execute(update(User.__table__).values(follower_count=counts))
+    db.session.commit()
+    return user_ids, celebrities, len(rows)
+
+
+def post_recipes(rng, user_ids, celebrities, count):
+    timings = {'ordinary': [], 'popular': []}
+    for number in range(count):
+        author = rng.choice(celebrities) if rng.random() < 0.1 else rng.choice(user_ids)
+        start = time.perf_counter()
+        db.session.add(Recipe(title=f'Recipe {number}', description='', ingredients=['Flour', 'Water'],
+                              instructions='Mix and bake.', user_id=author))
+        db.session.commit()
+        kind = 'popular' if author in celebrities else 'ordinary'
+        timings[kind].append((time.perf_counter() - start) * 1000)
+    return timings
+
+
+def pull_page(user_id, cursor, limit):
+    # Every followed author merged in, the way feed_page() merges popular ones
+    return merge_pages([_author_ids(author_id, cursor, limit + 1)
+                        for author_id in merged_authors(user_id, 0)], limit)
+
+
+def time_pages(fn, readers, pages, limit=20):
+    timings = []
+    for user_id in readers:
+        cursor = None
+        for _ in range(pages):
+            start = time.perf_counter()
+            ids, cursor = fn(user_id, cursor, limit)
+            timings.append((time.perf_counter() - start) * 1000)
+            db.session.rollback()
+            if cursor is None:
+                break
+    return timings
+
+
+def summary(timings):
+    timings = sorted(timings)
+    return (f'p50 {statistics.median(timings):.2f} ms, '
+            f'p95 {timings[int(len(timings) * 0.95) - 1]:.2f} ms ({len(timings)} samples)')
+
+
+def main():
+    users = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    follows_per_user = int(sys.argv[2]) if len(sys.argv) > 2 else 30
+    recipes = int(sys.argv[3]) if len(sys.argv) > 3 else 10000
+    app.config['FEED_FANOUT_LIMIT'] = int(sys.argv[4]) if len(sys.argv) > 4 else users // 4
+    setup_database()
+    rng = random.Random(1)
+
+    with app.app_context():
+        db.session.execute(User.__table__.delete())
+        db.session.commit()
+        user_ids, celebrities, follow_count = build_graph(rng, users, follows_per_user)
+        posting = post_recipes(rng, user_ids, celebrities, recipes)
+
+        stored = db.session.scalar(select(func.count()).select_from(TimelineEntry))
+        everyone = db.session.scalar(
+            select(func.count()).select_from(Recipe).join(Follow, Follow.followed_id == Recipe.user_id))
+
+        readers = rng.sample(user_ids, 200)
+        hybrid = time_pages(lambda *args: feed_page(*args), readers, 3)
+        pull = time_pages(pull_page, readers, 3)
+
+    print(f'users: {users}, follows: {follow_count}, recipes: {recipes}, '
+          f'fan-out limit: {app.config["FEED_FANOUT_LIMIT"]} followers')
+    print(f'post, ordinary author:  {summary(posting["ordinary"])}')
+    print(f'post, popular author:   {summary(posting["popular"])}')
+    print(f'timeline rows:          {stored} (fanning out every recipe: {everyone})')
+    print(f'feed page, hybrid:      {summary(hybrid)}')
+    print(f'feed page, merge only:  {summary(pull)}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,63 @@
+"""
+Compares serialization CPU for a large recipe page: the previous path
+(to_dict() formatting datetimes by hand, then the stdlib encoder) against
+the app's JSON provider on raw to_dict() output.
+
+    python bench/json_provider.py [recipes per page] [rounds]
+"""
+import json
+import sys
+import time
+from datetime import datetime
+from _setup import app
+
+
+def make_page(count):
+    now = datetime.utcnow()
+    return [{
+        'id': i,
+        'title': f'Recipe {i}',
+        'description': 'A long description of a tasty recipe. ' * 5,
+        'ingredients': ['Flour', 'Water', 'Salt', 'Yeast', 'Olive Oil', 'Sugar'],
+        'instructions': 'Mix, knead, rest and bake. ' * 20,
+        'image_url': 'https://images.pexels.com/photos/1435735/pexels-photo-1435735.jpeg',
+        'user_id': 1,
+        'username': 'Demo',
+        'created_at': now,
+        'updated_at': now
+    } for i in range(count)]
+
+
+def legacy(page):
+    recipes = [dict(recipe,
+                    created_at=recipe['created_at'].isoformat() if recipe['created_at'] else None,
+                    updated_at=recipe['updated_at'].isoformat() if recipe['updated_at'] else None)
+               for recipe in page]
+    return json.dumps({'recipes': recipes, 'total': len(recipes)}, sort_keys=True).encode('utf-8')
+
+
+def provider(page):
+    return app.json.response({'recipes': page, 'total': len(page)}).get_data()
+
+
+def measure(fn, page, rounds):
+    start = time.process_time()
+    for _ in range(rounds):
+        fn(page)
+    return (time.process_time() - start) / rounds * 1000
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1000
+    rounds = int(sys.argv[2]) if len(sys.argv) > 2 else 50
+    page = make_page(count)
+    with app.app_context():
+        before = measure(legacy, page, rounds)
+        after = measure(provider, page, rounds)
+    print(f'recipes per page:   {count}')
+    print(f'isoformat + stdlib: {before:.2f} ms CPU per page')
+    print(f'app.json provider:  {after:.2f} ms CPU per page ({before / after:.1f}x)')
+
+
+if __name__ == '__main__':
+    main()
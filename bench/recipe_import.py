@@ -0,0 +1,50 @@
+"""
+Measures bulk recipe import throughput in rows per second and compares it
+with creating the same recipes one ORM commit at a time.
+
+    python bench/recipe_import.py [rows]
+"""
+import sys
+import time
+from _setup import app, db, setup_database
+from app.models import Recipe
+from app.utils.recipe_import import import_recipes
+
+
+def make_records(count):
+    for i in range(count):
+        yield i + 1, {
+            'title': f'Recipe {i}',
+            'description': 'Benchmark recipe',
+            'ingredients': ['Flour', 'Water', 'Salt', 'Yeast'],
+            'instructions': 'Mix, knead, rest and bake. ' * 10
+        }
+
+
+def per_row(records, user_id):
+    for _, data in records:
+        recipe = Recipe(user_id=user_id, **data)
+        db.session.add(recipe)
+        db.session.commit()
+        recipe.to_dict()
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 5000
+    user_id = setup_database()
+    with app.app_context():
+        start = time.perf_counter()
+        per_row(make_records(rows), user_id)
+        baseline = rows / (time.perf_counter() - start)
+
+        start = time.perf_counter()
+        report = import_recipes(make_records(rows), user_id)
+        bulk = rows / (time.perf_counter() - start)
+
+    print(f'rows:            {rows}')
+    print(f'one by one:      {baseline:,.0f} rows/s')
+    print(f'bulk import:     {bulk:,.0f} rows/s ({report.inserted} inserted, {report.failed} failed)')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Measures recipe revision history: bytes stored per edit against keeping a
+full copy of every revision, and how long rebuilding a revision takes
+depending on how far it is from a snapshot.
+
+    python bench/recipe_revisions.py [edits] [instruction lines]
+"""
+import random
+import statistics
+import sys
+import time
+from _setup import app, setup_database
+from app.models import db, Recipe, RecipeRevision
+from app.utils.revisions import SNAPSHOT_EVERY, pack, rebuild_revision
+
+
+def make_instructions(lines):
+    return ''.join(f'Step {i}: whisk, fold and rest the mixture for {i} minutes, then taste.\n'
+                   for i in range(lines))
+
+
+def edit(recipe, number, rng):
+    # A typical edit: reword a step or two, sometimes the ingredients
+    lines = recipe.instructions.splitlines(keepends=True)
+    for _ in range(rng.randint(1, 2)):
+        index = rng.randrange(len(lines))
+        lines[index] = f'Step {index}: reworded in edit {number}, with a little more detail.\n'
+    recipe.instructions = ''.join(lines)
+    if number % 5 == 0:
+        recipe.ingredients = recipe.ingredients[:-1] + [f'Spice {number}']
+
+
+def main():
+    edits = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+    lines = int(sys.argv[2]) if len(sys.argv) > 2 else 80
+    user_id = setup_database()
+    rng = random.Random(1)
+
+    with app.app_context():
+        recipe = Recipe(title='Bench bread', description='A loaf', instructions=make_instructions(lines),
+                        ingredients=['Flour', 'Water', 'Salt', 'Yeast'], user_id=user_id)
+        db.session.add(recipe)
+        db.session.commit()
+
+        full_copies = 0
+        start = time.perf_counter()
+        for number in range(1, edits + 1):
+            edit(recipe, number, rng)
+            db.session.commit()
+            full_copies += len(pack({'title': recipe.title, 'description': recipe.description,
+                                     'ingredients': recipe.ingredients,
+                                     'instructions': recipe.instructions}))
+        write_ms = (time.perf_counter() - start) / edits * 1000
+
+        stored = db.session.execute(
+            db.select(db.func.sum(db.func.length(RecipeRevision.data)), db.func.count())
+            .where(RecipeRevision.recipe_id == recipe.id)).one()
+        raw = len(recipe.instructions.encode('utf-8'))
+
+        timings = {}
+        for number in range(edits + 1):
+            start = time.perf_counter()
+            rebuild_revision(recipe, number)
+            timings.setdefault(number % SNAPSHOT_EVERY, []).append((time.perf_counter() - start) * 1000)
+
+    print(f'edits: {edits}, instructions: {lines} lines ({raw} bytes)')
+    print(f'stored revisions:         {stored[1]} rows, {stored[0]} bytes ({stored[0] / stored[1]:.0f} per revision)')
+    print(f'compressed full copies:   {full_copies} bytes ({full_copies / stored[0]:.1f}x more)')
+    print(f'uncompressed full copies: about {raw * edits} bytes')
+    print(f'edit + commit:            {write_ms:.2f} ms')
+    print(f'rebuild, by diffs applied after the snapshot (snapshot every {SNAPSHOT_EVERY}):')
+    for distance in sorted(timings):
+        print(f'  {distance:3d}: {statistics.median(timings[distance]):.3f} ms median')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""
+Measures how long gunicorn takes from launch until it answers its first
+request, and how long that first request takes. Compare the shipped profile
+with a bare worker:
+
+    python bench/serve_startup.py
+    python bench/serve_startup.py -c /dev/null
+
+Extra arguments are passed to gunicorn. The server binds to BENCH_BIND
+(default 127.0.0.1:8099) and the probe hits BENCH_PATH (default /api/recipes/1).
+"""
+import os
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+
+def main():
+    bind = os.environ.get('BENCH_BIND', '127.0.0.1:8099')
+    url = f"http://{bind}{os.environ.get('BENCH_PATH', '/api/recipes/1')}"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+    started = time.perf_counter()
+    server = subprocess.Popen(
+        ['gunicorn', '-b', bind, *sys.argv[1:], 'app:app'], cwd=root,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        while True:
+            request_started = time.perf_counter()
+            try:
+                with urllib.request.urlopen(url) as response:
+                    response.read()
+                break
+            except urllib.error.HTTPError:
+                break
+            except OSError:
+                if server.poll() is not None:
+                    sys.exit('gunicorn exited before serving a request')
+                time.sleep(0.02)
+        finished = time.perf_counter()
+    finally:
+        server.terminate()
+        server.wait()
+
+    print(f'time to first response: {(finished - started) * 1000:.0f} ms')
+    print(f'first request latency:  {(finished - request_started) * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
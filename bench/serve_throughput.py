@@ -0,0 +1,61 @@
+"""
+Fires concurrent GET requests at a running server and reports throughput and
+latency, so the sync (gunicorn) and async (uvicorn) modes can be compared on
+the same database. Start each server against the same DATABASE_URL, e.g.
+
+    gunicorn -b :8000 app:app
+    uvicorn --port 8001 app.asgi:application
+
+then run
+
+    python bench/serve_throughput.py http://localhost:8000/api/recipes/ 64 10
+    python bench/serve_throughput.py http://localhost:8001/api/recipes/ 64 10
+
+Arguments are the URL, the number of concurrent clients and the duration in
+seconds. Pass a session cookie with COOKIE="session=..." for login-only routes.
+"""
+import os
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+
+def client(url, deadline, latencies, errors):
+    headers = {'Cookie': os.environ['COOKIE']} if os.environ.get('COOKIE') else {}
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(urllib.request.Request(url, headers=headers)) as response:
+                response.read()
+            latencies.append(time.perf_counter() - start)
+        except Exception:
+            errors.append(1)
+
+
+def main():
+    url = sys.argv[1]
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 32
+    duration = float(sys.argv[3]) if len(sys.argv) > 3 else 10
+
+    latencies, errors = [], []
+    deadline = time.perf_counter() + duration
+    with ThreadPoolExecutor(concurrency) as pool:
+        for _ in range(concurrency):
+            pool.submit(client, url, deadline, latencies, errors)
+
+    latencies.sort()
+    count = len(latencies)
+    if not count:
+        print(f'no successful requests ({len(errors)} errors)')
+        return
+    print(f'url:          {url}')
+    print(f'concurrency:  {concurrency}')
+    print(f'requests:     {count} ({len(errors)} errors)')
+    print(f'throughput:   {count / duration:,.1f} req/s')
+    print(f'latency p50:  {latencies[count // 2] * 1000:.1f} ms')
+    print(f'latency p99:  {latencies[min(count - 1, int(count * 0.99))] * 1000:.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
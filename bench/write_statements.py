@@ -0,0 +1,106 @@
+"""
+Counts the SQL statements each write handler sends and checks them against
+the counts documented in app/utils/writes.py, exiting non-zero on a
+mismatch or when saving a recipe unchanged moves its revision. The Flask-Login user lookup is left out, as are the SET LOCAL
+statement_timeout statements deadlines add on Postgres (one per
+transaction, sent from inside the first statement's event).
+
+    python bench/write_statements.py
+    DATABASE_URL=postgresql://... python bench/write_statements.py
+"""
+import sys
+from sqlalchemy import event
+from _setup import app, setup_database
+from app.models import db, Recipe
+
+# Statements per request by dialect, in the order the handlers run them
+EXPECTED = {
+    'postgresql': {
+        'create_recipe': ['INSERT', 'INSERT', 'UPDATE', 'COMMIT'],
+        'update_recipe': ['UPDATE', 'UPDATE', 'INSERT', 'COMMIT'],
+        'update_recipe_unchanged': ['UPDATE', 'UPDATE', 'COMMIT'],
+        'create_grocery_list': ['INSERT', 'COMMIT'],
+        'update_grocery_list': ['WITH', 'COMMIT'],
+        'add_item_to_list': ['WITH', 'COMMIT'],
+        'update_grocery_item': ['WITH', 'COMMIT'],
+    },
+    # The ORM fallback, without RETURNING
+    'sqlite': {
+        'create_recipe': ['INSERT', 'INSERT', 'UPDATE', 'COMMIT'],
+        'update_recipe': ['SELECT', 'INSERT', 'UPDATE', 'UPDATE', 'COMMIT'],
+        'update_recipe_unchanged': ['SELECT', 'UPDATE', 'UPDATE', 'COMMIT'],
+        'create_grocery_list': ['INSERT', 'COMMIT'],
+        'update_grocery_list': ['SELECT', 'UPDATE', 'SELECT', 'UPDATE', 'SELECT', 'COMMIT'],
+        'add_item_to_list': ['SELECT', 'UPDATE', 'SELECT', 'INSERT', 'COMMIT'],
+        'update_grocery_item': ['SELECT', 'UPDATE', 'SELECT', 'UPDATE', 'COMMIT'],
+    },
+}
+
+# The Flask-Login user loader's query
+USER_LOOKUP = 'SELECT users.id AS users_id'
+
+
+def recipe_revision(recipe_id):
+    with app.app_context():
+        return db.session.get(Recipe, recipe_id).revision
+
+
+def main():
+    user_id = setup_database()
+    statements = []
+    with app.app_context():
+        engine = db.engine
+        dialect = engine.dialect.name
+    event.listen(engine, 'before_cursor_execute',
+                 lambda conn, cursor, statement, *args: statements.append(statement))
+    event.listen(engine, 'commit', lambda conn: statements.append('COMMIT'))
+
+    client = app.test_client()
+    with client.session_transaction() as session:
+        session['_user_id'] = str(user_id)
+
+    def measure(handler, request):
+        del statements[:]
+        response = request()
+        assert response.status_code < 400, (handler, response.status_code, response.get_data(as_text=True))
+        counted = [statement.split()[0].upper() for statement in statements
+                   if not statement.lstrip().startswith(USER_LOOKUP)]
+        return response, counted
+
+    results = {}
+    response, results['create_recipe'] = measure('create_recipe', lambda: client.post(
+        '/api/recipes/', json={'title': 'Bench soup', 'ingredients': ['Water', 'Salt'], 'instructions': 'Boil.'}))
+    recipe_id = response.get_json()['id']
+    edit = {'title': 'Bench stew', 'ingredients': ['Water', 'Salt', 'Carrot']}
+    _, results['update_recipe'] = measure('update_recipe', lambda: client.put(
+        f'/api/recipes/{recipe_id}', json=edit))
+    revision = recipe_revision(recipe_id)
+    # Saving the same content again is not a new revision
+    _, results['update_recipe_unchanged'] = measure('update_recipe_unchanged', lambda: client.put(
+        f'/api/recipes/{recipe_id}', json=edit))
+    if recipe_revision(recipe_id) != revision:
+        print(f'update_recipe_unchanged moved the revision from {revision} to {recipe_revision(recipe_id)}')
+        return 1
+    response, results['create_grocery_list'] = measure('create_grocery_list', lambda: client.post(
+        '/api/grocery-lists/', json={'name': 'Bench list'}))
+    list_id = response.get_json()['id']
+    _, results['update_grocery_list'] = measure('update_grocery_list', lambda: client.put(
+        f'/api/grocery-lists/{list_id}', json={'name': 'Bench list 2'}))
+    response, results['add_item_to_list'] = measure('add_item_to_list', lambda: client.post(
+        f'/api/grocery-lists/{list_id}/items', json={'item_name': 'Apples'}))
+    item_id = response.get_json()['id']
+    _, results['update_grocery_item'] = measure('update_grocery_item', lambda: client.put(
+        f'/api/grocery-lists/items/{item_id}', json={'item_name': 'Pears', 'checked_off': True}))
+
+    expected = EXPECTED.get(dialect, {})
+    mismatches = 0
+    for handler, counted in results.items():
+        ok = expected.get(handler) == counted
+        mismatches += not ok
+        print(f'{handler:24} {len(counted)} ({", ".join(counted)})'
+              + ('' if ok else f'   expected {len(expected.get(handler, []))} ({", ".join(expected.get(handler, []))})'))
+    return 1 if mismatches else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
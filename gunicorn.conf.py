@@ -0,0 +1,106 @@
+"""
+Production serving profile, picked up automatically by `gunicorn app:app`.
+
+Workers and threads are sized from the CPU count unless overridden with
+WEB_CONCURRENCY / GUNICORN_THREADS. The app is imported once in the master
+(preload_app) and forked; every worker drops the engine state it inherited,
+then primes its own connection pool before it accepts traffic. Startup time
+and each worker's first-request latency are written to the gunicorn log.
+
+Grocery list change streams hold a thread each for up to
+SYNC_STREAM_MAX_SECONDS, which stays below `timeout`, and at most
+SYNC_STREAM_MAX_CONCURRENT of them run per worker. With GUNICORN_THREADS=1
+(the sync worker) streams are refused and clients poll the changes
+endpoint. Serving many long-lived streams needs an async server with a
+native stream handler; app/asgi.py still hands streams to the Flask app.
+"""
+import multiprocessing
+import os
+import time
+
+cpu_count = multiprocessing.cpu_count()
+
+workers = int(os.environ.get('WEB_CONCURRENCY', cpu_count * 2 + 1))
+threads = int(os.environ.get('GUNICORN_THREADS', 4))
+worker_class = 'gthread' if threads > 1 else 'sync'
+
+preload_app = True
+keepalive = int(os.environ.get('GUNICORN_KEEPALIVE', 5))
+timeout = int(os.environ.get('GUNICORN_TIMEOUT', 30))
+graceful_timeout = int(os.environ.get('GUNICORN_GRACEFUL_TIMEOUT', 30))
+
+# Recycle workers now and then so slow leaks never build up, with jitter so
+# they don't all restart at the same moment
+max_requests = int(os.environ.get('GUNICORN_MAX_REQUESTS', 1000))
+max_requests_jitter = int(os.environ.get('GUNICORN_MAX_REQUESTS_JITTER', 100))
+
+if os.environ.get('GUNICORN_BIND'):
+    bind = os.environ['GUNICORN_BIND']
+
+_started_at = time.perf_counter()
+
+
+def _engines():
+    from app import app
+    from app.models import db
+    with app.app_context():
+        return list(db.engines.values())
+
+
+def when_ready(server):
+    # Runs in the master once the app is preloaded; configuring the mappers
+    # here means every forked worker inherits them ready to use
+    from sqlalchemy.orm import configure_mappers
+    configure_mappers()
+    server.log.info('Master ready in %.0f ms (%d workers x %d threads)',
+                    (time.perf_counter() - _started_at) * 1000, workers, threads)
+
+
+def post_fork(server, worker):
+    # Connections opened in the master must never be shared with a child;
+    # close=False leaves them for the master and drops the child's references
+    for engine in _engines():
+        engine.dispose(close=False)
+    worker._forked_at = time.perf_counter()
+    worker._served = 0
+
+
+def post_worker_init(worker):
+    """
+    Warm start: open and check the worker's pooled connections and build the
+    ingredient autocomplete index so the first request doesn't pay for either
+    """
+    for engine in _engines():
+        size = min(threads, engine.pool.size()) if hasattr(engine.pool, 'size') else 1
+        connections = []
+        try:
+            for _ in range(max(size, 1)):
+                connection = engine.connect()
+                connection.exec_driver_sql('SELECT 1')
+                connections.append(connection)
+        except Exception as e:
+            worker.log.warning('Connection pool warm-up failed: %s', e)
+        finally:
+            for connection in connections:
+                connection.close()
+    try:
+        from app import app
+        from app.utils.autocomplete import build_ingredient_index
+        build_ingredient_index(app)
+    except Exception as e:
+        worker.log.warning('Autocomplete index warm-up failed: %s', e)
+    worker.log.info('Worker %s warm in %.0f ms', worker.pid,
+                    (time.perf_counter() - worker._forked_at) * 1000)
+
+
+def pre_request(worker, req):
+    if worker._served == 0:
+        worker._first_request_started = time.perf_counter()
+
+
+def post_request(worker, req, environ, resp):
+    worker._served += 1
+    if worker._served == 1:
+        worker.log.info('Worker %s first request %s %s took %.1f ms', worker.pid,
+                        req.method, req.path,
+                        (time.perf_counter() - worker._first_request_started) * 1000)
@@ -84,6 +84,11 @@ def run_migrations_online():
     )
 
     with connectable.connect() as connection:
+        # SQLite changes constraints by rebuilding tables; with foreign keys
+        # enforced, dropping the old copy of a parent table would cascade
+        if connection.dialect.name == 'sqlite':
+            connection.exec_driver_sql('PRAGMA foreign_keys=OFF')
+
         context.configure(
             connection=connection,
             target_metadata=target_metadata,
@@ -0,0 +1,29 @@
+"""add stored json document to recipes
+
+Revision ID: 3f1c9b7d2e41
+Revises: aa7046c6eb40
+Create Date: 2026-10-19 12:00:00.000000
+
+Existing rows start without a document; run `flask recipes rebuild-documents`
+after upgrading.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import os
+
+# revision identifiers, used by Alembic.
+revision = '3f1c9b7d2e41'
+down_revision = 'aa7046c6eb40'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    schema_name = os.environ.get("SCHEMA") if os.environ.get("FLASK_ENV") == "production" else None
+    op.add_column('recipes', sa.Column('document', sa.Text(), nullable=True), schema=schema_name)
+
+
+def downgrade():
+    schema_name = os.environ.get("SCHEMA") if os.environ.get("FLASK_ENV") == "production" else None
+    op.drop_column('recipes', 'document', schema=schema_name)
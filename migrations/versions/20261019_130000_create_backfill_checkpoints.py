@@ -0,0 +1,34 @@
+"""create backfill checkpoints table
+
+Revision ID: 8d2a6e0c5b17
+Revises: 3f1c9b7d2e41
+Create Date: 2026-10-19 13:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import os
+
+# revision identifiers, used by Alembic.
+revision = '8d2a6e0c5b17'
+down_revision = '3f1c9b7d2e41'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('backfill_checkpoints',
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('last_key', sa.Integer(), nullable=False),
+    sa.Column('rows_done', sa.Integer(), nullable=False),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('name'),
+    schema=os.environ.get("SCHEMA") if os.environ.get("FLASK_ENV") == "production" else None
+    )
+
+
+def downgrade():
+    schema_name = os.environ.get("SCHEMA") if os.environ.get("FLASK_ENV") == "production" else None
+    op.drop_table('backfill_checkpoints', schema=schema_name)
@@ -0,0 +1,45 @@
+"""create jobs table
+
+Revision ID: 5b9e3f2a7c60
+Revises: 8d2a6e0c5b17
+Create Date: 2026-10-19 14:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import os
+
+# revision identifiers, used by Alembic.
+revision = '5b9e3f2a7c60'
+down_revision = '8d2a6e0c5b17'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    schema_name = os.environ.get("SCHEMA") if os.environ.get("FLASK_ENV") == "production" else None
+    op.create_table('jobs',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=100), nullable=False),
+    sa.Column('payload', sa.JSON(), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('attempts', sa.Integer(), nullable=False),
+    sa.Column('max_attempts', sa.Integer(), nullable=False),
+    sa.Column('idempotency_key', sa.String(length=255), nullable=True),
+    sa.Column('last_error', sa.Text(), nullable=True),
+    sa.Column('locked_by', sa.String(length=100), nullable=True),
+    sa.Column('run_at', sa.DateTime(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('started_at', sa.DateTime(), nullable=True),
+    sa.Column('finished_at', sa.DateTime(), nullable=True),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('idempotency_key'),
+    schema=schema_name
+    )
+    op.create_index('ix_jobs_status_run_at', 'jobs', ['status', 'run_at'], unique=False, schema=schema_name)
+
+
+def downgrade():
+    schema_name = os.environ.get("SCHEMA") if os.environ.get("FLASK_ENV") == "production" else None
+    op.drop_index('ix_jobs_status_run_at', table_name='jobs', schema=schema_name)
+    op.drop_table('jobs', schema=schema_name)
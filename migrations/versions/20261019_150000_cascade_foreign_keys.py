@@ -0,0 +1,65 @@
+"""add ON DELETE CASCADE to foreign keys
+
+Revision ID: c7d41a9e3b28
+Revises: 5b9e3f2a7c60
+Create Date: 2026-10-19 15:00:00.000000
+
+"""
+from alembic import op
+import os
+
+# revision identifiers, used by Alembic.
+revision = 'c7d41a9e3b28'
+down_revision = '5b9e3f2a7c60'
+branch_labels = None
+depends_on = None
+
+# (table, column, referenced table) for every foreign key that cascades
+FOREIGN_KEYS = [
+    ('recipes', 'user_id', 'users'),
+    ('grocery_lists', 'user_id', 'users'),
+    ('grocery_list_items', 'grocery_list_id', 'grocery_lists'),
+    ('comments', 'user_id', 'users'),
+    ('comments', 'recipe_id', 'recipes'),
+    ('favourites', 'user_id', 'users'),
+    ('favourites', 'recipe_id', 'recipes'),
+    ('likes', 'user_id', 'users'),
+    ('likes', 'recipe_id', 'recipes'),
+]
+
+# The original constraints were created unnamed. SQLite reflects them
+# without a name, so batch mode names them with this convention; Postgres
+# named them <table>_<column>_fkey.
+naming_convention = {
+    'fk': 'fk_%(table_name)s_%(column_0_name)s_%(referred_table_name)s'
+}
+
+
+def _constraint_name(table, column, referred):
+    if op.get_bind().dialect.name == 'postgresql':
+        return f'{table}_{column}_fkey'
+    return f'fk_{table}_{column}_{referred}'
+
+
+def _replace_foreign_keys(ondelete):
+    schema_name = os.environ.get("SCHEMA") if os.environ.get("FLASK_ENV") == "production" else None
+    tables = {}
+    for table, column, referred in FOREIGN_KEYS:
+        tables.setdefault(table, []).append((column, referred))
+
+    for table, keys in tables.items():
+        with op.batch_alter_table(table, schema=schema_name,
+                                  naming_convention=naming_convention) as batch_op:
+            for column, referred in keys:
+                name = _constraint_name(table, column, referred)
+                batch_op.drop_constraint(name, type_='foreignkey')
+                batch_op.create_foreign_key(name, referred, [column], ['id'],
+                                            referent_schema=schema_name, ondelete=ondelete)
+
+
+def upgrade():
+    _replace_foreign_keys('CASCADE')
+
+
+def downgrade():
+    _replace_foreign_keys(None)
@@ -0,0 +1,50 @@
+"""add change versions to grocery lists and item deletion tombstones
+
+Revision ID: 4e8b2c6d1f93
+Revises: c7d41a9e3b28
+Create Date: 2026-10-19 16:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import os
+
+# revision identifiers, used by Alembic.
+revision = '4e8b2c6d1f93'
+down_revision = 'c7d41a9e3b28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    schema_name = os.environ.get("SCHEMA") if os.environ.get("FLASK_ENV") == "production" else None
+    fk_target = f'{schema_name}.grocery_lists.id' if schema_name else 'grocery_lists.id'
+    op.add_column('grocery_lists', sa.Column('version', sa.Integer(), nullable=False, server_default='0'), schema=schema_name)
+    op.add_column('grocery_list_items', sa.Column('updated_at', sa.DateTime(), nullable=True), schema=schema_name)
+    op.add_column('grocery_list_items', sa.Column('created_version', sa.Integer(), nullable=False, server_default='0'), schema=schema_name)
+    op.add_column('grocery_list_items', sa.Column('version', sa.Integer(), nullable=False, server_default='0'), schema=schema_name)
+    op.create_index('ix_grocery_list_items_list_version', 'grocery_list_items', ['grocery_list_id', 'version'], unique=False, schema=schema_name)
+    op.create_table('grocery_list_item_deletions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('grocery_list_id', sa.Integer(), nullable=False),
+    sa.Column('item_id', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('deleted_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['grocery_list_id'], [fk_target], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    schema=schema_name
+    )
+    op.create_index('ix_grocery_list_item_deletions_list_version', 'grocery_list_item_deletions', ['grocery_list_id', 'version'], unique=False, schema=schema_name)
+
+
+def downgrade():
+    schema_name = os.environ.get("SCHEMA") if os.environ.get("FLASK_ENV") == "production" else None
+    op.drop_index('ix_grocery_list_item_deletions_list_version', table_name='grocery_list_item_deletions', schema=schema_name)
+    op.drop_table('grocery_list_item_deletions', schema=schema_name)
+    op.drop_index('ix_grocery_list_items_list_version', table_name='grocery_list_items', schema=schema_name)
+    with op.batch_alter_table('grocery_list_items', schema=schema_name) as batch_op:
+        batch_op.drop_column('version')
+        batch_op.drop_column('created_version')
+        batch_op.drop_column('updated_at')
+    with op.batch_alter_table('grocery_lists', schema=schema_name) as batch_op:
+        batch_op.drop_column('version')
@@ -0,0 +1,39 @@
+"""add case-insensitive prefix search indexes on users
+
+Revision ID: 9a3f5d7e2b14
+Revises: 4e8b2c6d1f93
+Create Date: 2026-10-19 17:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import os
+
+# revision identifiers, used by Alembic.
+revision = '9a3f5d7e2b14'
+down_revision = '4e8b2c6d1f93'
+branch_labels = None
+depends_on = None
+
+COLUMNS = ['username', 'email']
+
+
+def _index_expression(column):
+    # Postgres: lower() with text_pattern_ops serves lower(column) LIKE 'x%'
+    # in any locale. SQLite: LIKE ignores case and uses a NOCASE index.
+    if op.get_bind().dialect.name == 'postgresql':
+        return sa.text(f'lower({column}) text_pattern_ops')
+    return sa.text(f'{column} COLLATE NOCASE')
+
+
+def upgrade():
+    schema_name = os.environ.get("SCHEMA") if os.environ.get("FLASK_ENV") == "production" else None
+    for column in COLUMNS:
+        op.create_index(f'ix_users_{column}_prefix', 'users', [_index_expression(column)],
+                        unique=False, schema=schema_name)
+
+
+def downgrade():
+    schema_name = os.environ.get("SCHEMA") if os.environ.get("FLASK_ENV") == "production" else None
+    for column in COLUMNS:
+        op.drop_index(f'ix_users_{column}_prefix', table_name='users', schema=schema_name)
@@ -0,0 +1,27 @@
+"""add image_key to recipes for uploaded images
+
+Revision ID: 2d6c8e1f4a57
+Revises: 9a3f5d7e2b14
+Create Date: 2026-10-19 18:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import os
+
+# revision identifiers, used by Alembic.
+revision = '2d6c8e1f4a57'
+down_revision = '9a3f5d7e2b14'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    schema_name = os.environ.get("SCHEMA") if os.environ.get("FLASK_ENV") == "production" else None
+    op.add_column('recipes', sa.Column('image_key', sa.String(length=64), nullable=True), schema=schema_name)
+
+
+def downgrade():
+    schema_name = os.environ.get("SCHEMA") if os.environ.get("FLASK_ENV") == "production" else None
+    with op.batch_alter_table('recipes', schema=schema_name) as batch_op:
+        batch_op.drop_column('image_key')
@@ -0,0 +1,41 @@
+"""add recipe revision history
+
+Revision ID: 6f1b3d9a5c82
+Revises: 2d6c8e1f4a57
+Create Date: 2026-10-19 19:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import os
+
+# revision identifiers, used by Alembic.
+revision = '6f1b3d9a5c82'
+down_revision = '2d6c8e1f4a57'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    schema_name = os.environ.get("SCHEMA") if os.environ.get("FLASK_ENV") == "production" else None
+    fk_target = f'{schema_name}.recipes.id' if schema_name else 'recipes.id'
+    op.add_column('recipes', sa.Column('revision', sa.Integer(), nullable=False, server_default='0'), schema=schema_name)
+    op.create_table('recipe_revisions',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('recipe_id', sa.Integer(), nullable=False),
+    sa.Column('number', sa.Integer(), nullable=False),
+    sa.Column('snapshot', sa.Boolean(), nullable=False),
+    sa.Column('data', sa.LargeBinary(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['recipe_id'], [fk_target], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('recipe_id', 'number', name='uq_recipe_revisions_recipe_number'),
+    schema=schema_name
+    )
+
+
+def downgrade():
+    schema_name = os.environ.get("SCHEMA") if os.environ.get("FLASK_ENV") == "production" else None
+    op.drop_table('recipe_revisions', schema=schema_name)
+    with op.batch_alter_table('recipes', schema=schema_name) as batch_op:
+        batch_op.drop_column('revision')
@@ -0,0 +1,56 @@
+"""add follows, home feed timelines and follower counts
+
+Revision ID: 8c2e4a6b0d39
+Revises: 6f1b3d9a5c82
+Create Date: 2026-10-19 20:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import os
+
+# revision identifiers, used by Alembic.
+revision = '8c2e4a6b0d39'
+down_revision = '6f1b3d9a5c82'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    schema_name = os.environ.get("SCHEMA") if os.environ.get("FLASK_ENV") == "production" else None
+    users_id = f'{schema_name}.users.id' if schema_name else 'users.id'
+    recipes_id = f'{schema_name}.recipes.id' if schema_name else 'recipes.id'
+    op.add_column('users', sa.Column('follower_count', sa.Integer(), nullable=False, server_default='0'), schema=schema_name)
+    op.create_index('ix_recipes_user_id_id', 'recipes', ['user_id', 'id'], unique=False, schema=schema_name)
+    op.create_table('follows',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('follower_id', sa.Integer(), nullable=False),
+    sa.Column('followed_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['follower_id'], [users_id], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['followed_id'], [users_id], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('follower_id', 'followed_id', name='unique_follower_followed'),
+    schema=schema_name
+    )
+    op.create_index('ix_follows_followed_id', 'follows', ['followed_id'], unique=False, schema=schema_name)
+    op.create_table('timeline_entries',
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('recipe_id', sa.Integer(), nullable=False),
+    sa.Column('author_id', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['user_id'], [users_id], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['recipe_id'], [recipes_id], ondelete='CASCADE'),
+    sa.ForeignKeyConstraint(['author_id'], [users_id], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('user_id', 'recipe_id'),
+    schema=schema_name
+    )
+
+
+def downgrade():
+    schema_name = os.environ.get("SCHEMA") if os.environ.get("FLASK_ENV") == "production" else None
+    op.drop_table('timeline_entries', schema=schema_name)
+    op.drop_index('ix_follows_followed_id', table_name='follows', schema=schema_name)
+    op.drop_table('follows', schema=schema_name)
+    op.drop_index('ix_recipes_user_id_id', table_name='recipes', schema=schema_name)
+    with op.batch_alter_table('users', schema=schema_name) as batch_op:
+        batch_op.drop_column('follower_count')
@@ -0,0 +1,69 @@
+"""add grocery list archive tables and retention indexes
+
+Revision ID: b4d7f1a3c916
+Revises: 8c2e4a6b0d39
+Create Date: 2026-10-19 21:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import os
+
+# revision identifiers, used by Alembic.
+revision = 'b4d7f1a3c916'
+down_revision = '8c2e4a6b0d39'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    schema_name = os.environ.get("SCHEMA") if os.environ.get("FLASK_ENV") == "production" else None
+    users_id = f'{schema_name}.users.id' if schema_name else 'users.id'
+    op.create_index('ix_grocery_lists_updated_at', 'grocery_lists', ['updated_at'], unique=False, schema=schema_name)
+    op.create_index('ix_grocery_list_items_checked_updated', 'grocery_list_items', ['checked_off', 'updated_at'],
+                    unique=False, schema=schema_name)
+    op.create_table('grocery_lists_archive',
+    sa.Column('archive_id', sa.Integer(), nullable=False),
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('archived_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], [users_id], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('archive_id'),
+    schema=schema_name
+    )
+    op.create_index('ix_grocery_lists_archive_user_id_id', 'grocery_lists_archive', ['user_id', 'id'],
+                    unique=False, schema=schema_name)
+    op.create_table('grocery_list_items_archive',
+    sa.Column('archive_id', sa.Integer(), nullable=False),
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('grocery_list_id', sa.Integer(), nullable=False),
+    sa.Column('user_id', sa.Integer(), nullable=False),
+    sa.Column('item_name', sa.String(length=255), nullable=False),
+    sa.Column('quantity', sa.String(length=100), nullable=True),
+    sa.Column('notes', sa.String(length=500), nullable=True),
+    sa.Column('checked_off', sa.Boolean(), nullable=True),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('updated_at', sa.DateTime(), nullable=True),
+    sa.Column('created_version', sa.Integer(), nullable=False),
+    sa.Column('version', sa.Integer(), nullable=False),
+    sa.Column('archived_at', sa.DateTime(), nullable=True),
+    sa.ForeignKeyConstraint(['user_id'], [users_id], ondelete='CASCADE'),
+    sa.PrimaryKeyConstraint('archive_id'),
+    schema=schema_name
+    )
+    op.create_index('ix_grocery_list_items_archive_user_list', 'grocery_list_items_archive',
+                    ['user_id', 'grocery_list_id'], unique=False, schema=schema_name)
+
+
+def downgrade():
+    schema_name = os.environ.get("SCHEMA") if os.environ.get("FLASK_ENV") == "production" else None
+    op.drop_index('ix_grocery_list_items_archive_user_list', table_name='grocery_list_items_archive', schema=schema_name)
+    op.drop_table('grocery_list_items_archive', schema=schema_name)
+    op.drop_index('ix_grocery_lists_archive_user_id_id', table_name='grocery_lists_archive', schema=schema_name)
+    op.drop_table('grocery_lists_archive', schema=schema_name)
+    op.drop_index('ix_grocery_list_items_checked_updated', table_name='grocery_list_items', schema=schema_name)
+    op.drop_index('ix_grocery_lists_updated_at', table_name='grocery_lists', schema=schema_name)
@@ -0,0 +1,29 @@
+"""add cached nutrition totals to recipes
+
+Revision ID: e2a9c5f81b47
+Revises: b4d7f1a3c916
+Create Date: 2026-10-19 22:00:00.000000
+
+Totals are worked out and stored the first time a recipe's nutrition is
+asked for.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+import os
+
+# revision identifiers, used by Alembic.
+revision = 'e2a9c5f81b47'
+down_revision = 'b4d7f1a3c916'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    schema_name = os.environ.get("SCHEMA") if os.environ.get("FLASK_ENV") == "production" else None
+    op.add_column('recipes', sa.Column('nutrition', sa.JSON(), nullable=True), schema=schema_name)
+
+
+def downgrade():
+    schema_name = os.environ.get("SCHEMA") if os.environ.get("FLASK_ENV") == "production" else None
+    op.drop_column('recipes', 'nutrition', schema=schema_name)
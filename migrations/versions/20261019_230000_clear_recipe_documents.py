@@ -0,0 +1,49 @@
+"""clear stored recipe documents made before the image variant urls
+
+Revision ID: 7c3e9a1d5b28
+Revises: e2a9c5f81b47
+Create Date: 2026-10-19 23:00:00.000000
+
+Recipe.to_dict() gained thumbnail_url and card_url with the image_key
+migration, but the documents stored before it don't have them. They are
+cleared here and a recipes.rebuild-documents job is queued, which rebuilds
+every recipe without a document once a worker picks it up. Until then
+those recipes are serialized on each read.
+
+"""
+from alembic import op
+import sqlalchemy as sa
+from datetime import datetime
+import os
+
+# revision identifiers, used by Alembic.
+revision = '7c3e9a1d5b28'
+down_revision = 'e2a9c5f81b47'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    schema_name = os.environ.get("SCHEMA") if os.environ.get("FLASK_ENV") == "production" else None
+    recipes = sa.table('recipes', sa.column('document', sa.Text()), schema=schema_name)
+    jobs = sa.table(
+        'jobs',
+        sa.column('name', sa.String()),
+        sa.column('status', sa.String()),
+        sa.column('attempts', sa.Integer()),
+        sa.column('max_attempts', sa.Integer()),
+        sa.column('idempotency_key', sa.String()),
+        sa.column('run_at', sa.DateTime()),
+        sa.column('created_at', sa.DateTime()),
+        schema=schema_name
+    )
+    op.execute(recipes.update().values(document=None))
+    now = datetime.utcnow()
+    op.execute(jobs.insert().values(
+        name='recipes.rebuild-documents', status='queued', attempts=0, max_attempts=5,
+        idempotency_key=f'migration:{revision}', run_at=now, created_at=now))
+
+
+def downgrade():
+    # The cleared documents are rebuilt, not restored
+    pass
@@ -0,0 +1,46 @@
+"""never reuse grocery list ids on SQLite
+
+Revision ID: 4f8b2d6e1a93
+Revises: 7c3e9a1d5b28
+Create Date: 2026-10-20 00:00:00.000000
+
+Archived lists and their items keep the list's original id. Without
+AUTOINCREMENT SQLite hands the id of the highest deleted row out again, so
+a new list could pick up an archived list's items. grocery_lists is rebuilt
+with AUTOINCREMENT and its counter starts above every archived id.
+Postgres sequences never reuse ids, so there is nothing to do there.
+
+"""
+from alembic import op
+import os
+
+# revision identifiers, used by Alembic.
+revision = '4f8b2d6e1a93'
+down_revision = '7c3e9a1d5b28'
+branch_labels = None
+depends_on = None
+
+
+def _rebuild(autoincrement):
+    schema_name = os.environ.get("SCHEMA") if os.environ.get("FLASK_ENV") == "production" else None
+    with op.batch_alter_table('grocery_lists', schema=schema_name, recreate='always',
+                              table_kwargs={'sqlite_autoincrement': autoincrement}):
+        pass
+
+
+def upgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    _rebuild(True)
+    op.execute("DELETE FROM sqlite_sequence WHERE name = 'grocery_lists'")
+    op.execute(
+        "INSERT INTO sqlite_sequence (name, seq) SELECT 'grocery_lists', max("
+        "coalesce((SELECT max(id) FROM grocery_lists), 0), "
+        "coalesce((SELECT max(id) FROM grocery_lists_archive), 0), "
+        "coalesce((SELECT max(grocery_list_id) FROM grocery_list_items_archive), 0))")
+
+
+def downgrade():
+    if op.get_bind().dialect.name != 'sqlite':
+        return
+    _rebuild(False)